@@ -4,12 +4,13 @@ API module with Flask routes for the application.
 from flask import Flask, request, abort, jsonify
 from flask_cors import CORS
 import asyncio
-import aiohttp
 import logging
 import datetime
 from config import config
 from database import db_manager, chat_repository, feedback_repository, cache_repository
-from metabase import metabase_client
+from metabase import metabase_client, AsyncMetabaseClient
+from job_poller import metabase_job_poller
+from circuit_breaker import metabase_breaker
 from chat import chat_manager
 from sql_generator import sql_generator
 from auth import require_auth, get_user_from_token
@@ -194,7 +195,10 @@ def health():
     return jsonify({
         "status": "healthy",
         "service": "unity-ai-backend",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "cost_guard_failures": sql_generator.cost_guard_failures,
+        "metabase_job_poller": metabase_job_poller.stats(),
+        "metabase_circuits": metabase_breaker.snapshot()
     }), 200
 
 
@@ -394,8 +398,9 @@ def _build_viz_settings(visualization_options: list) -> dict:
 def _shape_card_data(card_data):
     """Turn Metabase's `{cols, rows}` payload into the frontend preview shape.
 
-    Truncates rows to `config.app.preview_row_limit`. Returns None when the
-    payload is missing or malformed so the frontend can fall back to button-only.
+    Truncates rows to `config.app.preview_row_limit`. A `row_count` key, set when
+    the rows were already capped upstream, is used as the total. Returns None when
+    the payload is missing or malformed so the frontend can fall back to button-only.
     """
     if not isinstance(card_data, dict):
         return None
@@ -409,7 +414,7 @@ def _shape_card_data(card_data):
         (c.get("display_name") or c.get("name") or "") if isinstance(c, dict) else str(c)
         for c in cols
     ]
-    total_rows = len(rows)
+    total_rows = card_data.get("row_count", len(rows))
     return {
         "columns": columns,
         "rows": rows[:limit],
@@ -446,13 +451,10 @@ async def _llm_judge_lookup(tenant_id, db_id, normalized_query, borderline):
         f"[cache:borderline] tenant={tenant_id} db={db_id} "
         f"count={len(borderline)} similarities=[{borderline_sims}]"
     )
-    async with aiohttp.ClientSession() as judge_session:
-        results = await asyncio.gather(*[
-            cache_reranker.llm_judge.score_candidate(
-                normalized_query, candidate["query_text"], judge_session, config.ai
-            )
-            for candidate in borderline
-        ])
+    results = await asyncio.gather(*[
+        cache_reranker.llm_judge.score_candidate(normalized_query, candidate["query_text"])
+        for candidate in borderline
+    ])
 
     best_candidate, best_score = None, -1  # sentinel; valid scores are 0..10
     for candidate, (score, judge_tokens) in zip(borderline, results):
@@ -535,11 +537,13 @@ async def _semantic_cache_lookup(tenant_id, db_id, schema_types, collection_name
 async def _serve_cache_hit(cache_hit, db_id, collection_id, tenant_id):
     """Validate cached SQL and build the cache-hit response. Returns None if SQL is no longer valid."""
     cached = cache_hit["response_payload"]
+    # Cached SQL already ran once; a plan-only check is enough to catch schema drift
+    validation_mode = config.get_tenant_validation_mode(tenant_id, cache_hit=True)
+    statement_timeout = config.get_tenant_query_limits(tenant_id)["validation_statement_timeout"]
+    metabase = AsyncMetabaseClient()
     try:
-        loop = asyncio.get_event_loop()
-        is_valid, _ = await loop.run_in_executor(
-            None, lambda: metabase_client.validate_sql(cached["sql"], db_id, tenant_id)
-        )
+        is_valid, _ = await metabase.validate_sql(cached["sql"], db_id, tenant_id, mode=validation_mode,
+                                                  statement_timeout=statement_timeout)
     except Exception:
         is_valid = False
 
@@ -554,10 +558,13 @@ async def _serve_cache_hit(cache_hit, db_id, collection_id, tenant_id):
         "exact_hit" if cache_hit["similarity"] >= 1.0 else "semantic_hit"
     )
     tokens_saved = cached.get("tokens", {}).get("total_tokens", 0)
-    card_id, card_data = metabase_client.create_card(
-        cached["sql"], db_id, collection_id, cached["title"],
-        tenant_id=tenant_id,
-        visualization_settings=_build_viz_settings(cached.get("visualization_options", [])),
+    (card_id, _), card_data = await asyncio.gather(
+        metabase.get_or_create_card(
+            cached["sql"], db_id, collection_id, cached["title"],
+            tenant_id=tenant_id,
+            visualization_settings=_build_viz_settings(cached.get("visualization_options", [])),
+        ),
+        metabase.fetch_preview(cached["sql"], db_id, config.app.preview_row_limit, tenant_id=tenant_id),
     )
     cache_repository.touch(cache_hit["cache_id"])
 
@@ -667,10 +674,11 @@ async def _async_ask(data, user_data):
 
     logger.info("Starting SQL generation...")
     try:
-        sql, metadata, sql_tokens, error_detail = await sql_generator.generate_sql(
+        sql, metadata, sql_tokens, error_detail, preview = await sql_generator.generate_sql(
             question, past_questions, db_id, tenant_id=tenant_id,
             is_retry=is_retry, retry_error_type=retry_error_type,
-            retry_error_detail=retry_error_detail
+            retry_error_detail=retry_error_detail,
+            question_embedding=query_embedding
         )
     except Exception as e:
         return _classify_sql_generation_error(e)
@@ -686,11 +694,17 @@ async def _async_ask(data, user_data):
     logger.debug(f"Metadata: {metadata}")
     logger.info(f"Creating Metabase card with SQL length: {len(sql)}")
 
-    card_id, card_data = metabase_client.create_card(
+    # Reuse the winning candidate's rows from fingerprinting; fall back to a
+    # row-capped fetch when no preview was carried through (e.g. hardcoded examples)
+    metabase = AsyncMetabaseClient()
+    card_id, _ = await metabase.get_or_create_card(
         sql, db_id, collection_id, metadata['title'],
         tenant_id=tenant_id,
         visualization_settings=_build_viz_settings(metadata.get("visualization_options", [])),
     )
+    card_data = preview or await metabase.fetch_preview(
+        sql, db_id, config.app.preview_row_limit, tenant_id=tenant_id
+    )
     logger.info(f"Card created successfully with ID: {card_id}")
 
     # ── Store result in semantic cache ───────────────────────────────────────
@@ -748,6 +762,8 @@ def change_display():
         x_field = data.get("x_field", [])
         y_field = data.get("y_field", [])
         visualization_options = data.get("visualization_options", [])
+        title = data.get("title")
+        chat_id = data.get("chat_id")
         
         if not all([mode, card_id]):
             return abort(400, "mode and card_id are required")
@@ -766,12 +782,17 @@ def change_display():
         safe_y_field = _sanitize_field_array(y_field) if isinstance(y_field, list) else []
         safe_visualization_options = _sanitize_field_array(visualization_options) if isinstance(visualization_options, list) else []
         
-        # Update card visualization
-        metabase_client.update_card_visualization(safe_card_id, safe_mode, safe_x_field, safe_y_field,
-                                                    tenant_id=tenant_id)
+        # Update card visualization; a card shared with other answers is copied
+        new_card_id = metabase_client.update_card_visualization(
+            safe_card_id, safe_mode, safe_x_field, safe_y_field, tenant_id=tenant_id,
+            name=str(title) if title else None
+        )
+        # Keep the stored chat on the copy; chats sharing the old card keep it
+        if chat_id and new_card_id != safe_card_id:
+            chat_manager.replace_card_ids(str(chat_id), user_data["user_id"], {safe_card_id: new_card_id})
         
         return jsonify({
-            "card_id": safe_card_id,
+            "card_id": new_card_id,
             "x_field": safe_x_field,
             "y_field": safe_y_field,
             "visualization_options": safe_visualization_options
@@ -809,6 +830,110 @@ def delete_question():
         return {"success": False}
 
 
+def _get_card_batch(data, key):
+    """Return the list under `key` if it is a non-empty batch within bulk_max_cards, else None."""
+    items = (data or {}).get(key)
+    if not isinstance(items, list) or not items or len(items) > config.metabase.bulk_max_cards:
+        return None
+    return items
+
+
+@app.route("/api/cards/delete", methods=["POST"])
+@require_auth
+def delete_cards():
+    """Delete many Metabase cards in one request"""
+    data = request.get_json()
+    user_data = get_user_from_token()
+
+    card_ids = _get_card_batch(data, "card_ids")
+    if card_ids is None:
+        return abort(400, f"card_ids must be a list of 1 to {config.metabase.bulk_max_cards} card IDs")
+
+    safe_card_ids = [_sanitize_card_id(card_id) for card_id in card_ids]
+    if not all(safe_card_ids):
+        return abort(400, "Invalid card_id parameter")
+
+    try:
+        results = metabase_client.delete_cards(safe_card_ids, tenant_id=user_data["tenant"])
+        return {"results": results}, 200
+    except Exception as e:
+        logger.error(f"Error in /api/cards/delete: {e}", exc_info=True)
+        return abort(500, INTERNAL_SERVER_ERROR)
+
+
+@app.route("/api/cards/recreate", methods=["POST"])
+@require_auth
+def recreate_cards():
+    """Check many cards and recreate the missing ones in one request"""
+    data = request.get_json()
+    user_data = get_user_from_token()
+
+    cards = _get_card_batch(data, "cards")
+    if cards is None:
+        return abort(400, f"cards must be a list of 1 to {config.metabase.bulk_max_cards} cards")
+
+    safe_cards = []
+    for card in cards:
+        safe_card_id = _sanitize_card_id(card.get("card_id")) if isinstance(card, dict) else None
+        if not safe_card_id or not isinstance(card.get("SQL"), str):
+            return abort(400, "Each card needs a valid card_id and SQL")
+        mode = card.get("current_visualization")
+        safe_cards.append({
+            "card_id": safe_card_id,
+            "SQL": card["SQL"],
+            "title": str(card.get("title") or "Untitled"),
+            "current_visualization": _sanitize_mode(mode) if mode else None,
+            "x_field": _sanitize_field_array(card.get("x_field", [])),
+            "y_field": _sanitize_field_array(card.get("y_field", [])),
+        })
+
+    try:
+        results = chat_manager.recreate_cards(safe_cards, user_data["tenant"])
+        return {"results": results}, 200
+    except Exception as e:
+        logger.error(f"Error in /api/cards/recreate: {e}", exc_info=True)
+        return abort(500, INTERNAL_SERVER_ERROR)
+
+
+@app.route("/api/cards/change_display", methods=["POST"])
+@require_auth
+def change_cards_display():
+    """Update the visualization of many Metabase cards in one request"""
+    data = request.get_json()
+    user_data = get_user_from_token()
+
+    cards = _get_card_batch(data, "cards")
+    if cards is None:
+        return abort(400, f"cards must be a list of 1 to {config.metabase.bulk_max_cards} cards")
+
+    safe_cards = []
+    for card in cards:
+        safe_card_id = _sanitize_card_id(card.get("card_id")) if isinstance(card, dict) else None
+        safe_mode = _sanitize_mode(card.get("mode")) if isinstance(card, dict) else None
+        if not safe_card_id or not safe_mode:
+            return abort(400, "Each card needs a valid card_id and mode")
+        safe_cards.append({
+            "card_id": safe_card_id,
+            "mode": safe_mode,
+            "title": str(card["title"]) if card.get("title") else None,
+            "x_field": _sanitize_field_array(card.get("x_field", [])),
+            "y_field": _sanitize_field_array(card.get("y_field", [])),
+        })
+
+    try:
+        results = metabase_client.update_cards_visualization(safe_cards, tenant_id=user_data["tenant"])
+        chat_id = data.get("chat_id")
+        if chat_id:
+            chat_manager.replace_card_ids(
+                str(chat_id), user_data["user_id"],
+                {result["card_id"]: result["new_card_id"] for result in results if result["success"]}
+            )
+        return {"results": results}, 200
+    except Exception as e:
+        logger.error(f"Error in /api/cards/change_display: {e}", exc_info=True)
+        return abort(500, INTERNAL_SERVER_ERROR)
+
+
 @app.route("/api/explain_sql", methods=["POST"])
 @require_auth
 def explain_sql():
@@ -862,13 +987,16 @@ def get_chats():
 @app.route("/api/chats/<chat_id>", methods=["POST"])
 @require_auth
 def get_chat(chat_id):
-    """Get a specific chat and validate/recreate cards"""
+    """Get a specific chat and validate/recreate cards unless validate_cards is false"""
+    data = request.get_json(silent=True) or {}
     user_data = get_user_from_token()
     
     try:
         # Extract user ID from JWT token
         user_id = user_data["user_id"]
-        chat_data = chat_manager.get_chat_with_card_validation(chat_id, user_id)
+        chat_data = chat_manager.get_chat_with_card_validation(
+            chat_id, user_id, validate_cards=data.get("validate_cards", True) is not False
+        )
         
         if not chat_data:
             return abort(404, CHAT_NOT_FOUND)
@@ -920,7 +1048,7 @@ def delete_chat(chat_id):
         # Extract user ID from JWT token
         user_id = user_data["user_id"]
         
-        success = chat_manager.delete_chat(chat_id, user_id)
+        success = chat_manager.delete_chat(chat_id, user_id, tenant_id=user_data["tenant"])
 
         if not success:
             return abort(404, CHAT_NOT_FOUND)
@@ -9,6 +9,7 @@ from typing import Optional
 from config import config
 from database import db_manager, cache_repository
 from embeddings import embedding_manager
+from metabase import query_result_cache
 from api import app
 
 # Configure logging
@@ -62,12 +63,17 @@ def embed_all_tenants():
         first_tenant_id = db_cfg["tenants"][0] if db_cfg["tenants"] else None
         logger.info(f"Embedding db_id={db_id} (tenants: {tenants})...")
         try:
-            embedding_manager.embed_schemas(db_id, db_cfg["schema_types"], tenant_id=first_tenant_id)
-            logger.info(f"Successfully embedded db_id={db_id}")
+            embedded = embedding_manager.embed_schemas(
+                db_id, db_cfg["schema_types"], tenant_id=first_tenant_id,
+                skip_unchanged=config.app.embed_skip_unchanged,
+            )
+            if embedded:
+                logger.info(f"Successfully embedded db_id={db_id}")
         except Exception as e:
             logger.error(f"Failed to embed db_id={db_id}: {e}", exc_info=True)
 
     logger.info("Finished embedding all tenant databases.")
+    logger.info(f"Metabase query result cache: {query_result_cache.stats()}")
 
     # Evict stale cache entries (older than 30 days) after re-embedding
     try:
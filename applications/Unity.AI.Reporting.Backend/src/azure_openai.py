@@ -0,0 +1,326 @@
+"""
+Azure OpenAI client module.
+Keeps one long-lived aiohttp session per worker process so chat completions
+reuse pooled, kept-alive connections to the Azure endpoint, and schedules
+every call against the deployment's tokens/min and requests/min quotas.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import aiohttp
+import tiktoken
+
+from config import config, AIConfig
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Scheduling priorities, lowest first
+PRIORITY_RELEVANCE = 0
+PRIORITY_GENERATION = 1
+PRIORITY_EXPLANATION = 2
+PRIORITY_JUDGE = 3
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AzureOpenAIError(Exception):
+    """Raised for a non-200 response from the chat completions endpoint."""
+
+    def __init__(self, status: int, body: str):
+        super().__init__(f"Azure OpenAI error {status}: {body[:500]}")
+        self.status = status
+        self.body = body
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Read the server's requested delay from retry-after-ms / retry-after headers."""
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                continue
+    return None
+
+
+class RateLimitScheduler:
+    """
+    Token buckets for tokens/min and requests/min, with a priority queue.
+
+    Callers acquire() with an estimated token cost and wait until both
+    buckets can cover it. The highest-priority waiter is always served
+    first, so relevance checks are not stuck behind a burst of generation
+    samples. Buckets refill continuously at limit/60 per second and are
+    corrected from actual usage and x-ratelimit-remaining-* headers. A 429
+    pauses the whole queue for the server's Retry-After. A limit of 0 turns
+    that bucket off. Must only be used from one event loop.
+    """
+
+    def __init__(self, tpm_limit: int, rpm_limit: int):
+        self.tpm_limit = tpm_limit
+        self.rpm_limit = rpm_limit
+        self._tokens = float(tpm_limit)
+        self._requests = float(rpm_limit)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._queue: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self._updated = now - self._updated, now
+        if self.tpm_limit:
+            self._tokens = min(self.tpm_limit, self._tokens + elapsed * self.tpm_limit / 60)
+        if self.rpm_limit:
+            self._requests = min(self.rpm_limit, self._requests + elapsed * self.rpm_limit / 60)
+
+    def _wait_time(self, tokens: int) -> float:
+        """Seconds until a request costing tokens fits in both buckets."""
+        wait = max(0.0, self._paused_until - time.monotonic())
+        if self.tpm_limit:
+            # A request larger than the whole bucket waits for a full bucket
+            needed = min(tokens, self.tpm_limit)
+            if self._tokens < needed:
+                wait = max(wait, (needed - self._tokens) * 60 / self.tpm_limit)
+        if self.rpm_limit and self._requests < 1:
+            wait = max(wait, (1 - self._requests) * 60 / self.rpm_limit)
+        return wait
+
+    def _dispatch(self):
+        """Admit waiters from the head of the queue while the buckets allow it."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._queue:
+            _, _, tokens, future = self._queue[0]
+            if future.done():
+                # The waiter gave up (cancelled or timed out)
+                heapq.heappop(self._queue)
+                continue
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            if self.tpm_limit:
+                self._tokens -= tokens
+            if self.rpm_limit:
+                self._requests -= 1
+            future.set_result(None)
+
+    async def acquire(self, tokens: int, priority: int, timeout: float):
+        """
+        Wait for budget for one request.
+
+        Raises:
+            AzureOpenAIError: (429) No budget within timeout seconds
+        """
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), tokens, future))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise AzureOpenAIError(
+                429, f"rate limit: queued longer than {timeout}s for Azure OpenAI quota"
+            ) from None
+
+    def settle(self, estimated: int, actual: int):
+        """Correct the token bucket once the real usage is known."""
+        if self.tpm_limit:
+            self._tokens = min(self.tpm_limit, self._tokens + estimated - actual)
+
+    def observe(self, headers: Mapping[str, str]):
+        """Lower the buckets to the server's x-ratelimit-remaining-* counts."""
+        for name, limit, attr in (
+            ("x-ratelimit-remaining-tokens", self.tpm_limit, "_tokens"),
+            ("x-ratelimit-remaining-requests", self.rpm_limit, "_requests"),
+        ):
+            value = headers.get(name)
+            if limit and value:
+                try:
+                    setattr(self, attr, min(getattr(self, attr), float(value)))
+                except ValueError:
+                    pass
+
+    def pause(self, seconds: float):
+        """Hold every waiter for seconds (after a 429)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._dispatch()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, _, future in self._queue if not future.done())
+
+
+class AzureOpenAIClient:
+    """
+    Shared chat completions client for this worker process.
+
+    Flask handlers run each request in its own short-lived event loop
+    (asyncio.run), and an aiohttp session cannot outlive the loop it was
+    created on. The session therefore lives on a background event loop
+    thread, started on first use (after gunicorn forks) and restarted in a
+    forked child. Calls from any other loop are handed to it with
+    run_coroutine_threadsafe; cancelling the caller cancels the request.
+
+    Every request goes through a RateLimitScheduler on that loop and is
+    retried on 429, 5xx and connection errors, honouring Retry-After.
+    """
+
+    def __init__(self, ai_config: AIConfig):
+        self.config = ai_config
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._scheduler: Optional[RateLimitScheduler] = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint(self) -> str:
+        return (
+            f"{self.config.azure_endpoint}/openai/deployments/{self.config.azure_deployment}"
+            f"/chat/completions?api-version={self.config.azure_api_version}"
+        )
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Get the background event loop, starting it in this process if needed."""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="azure-openai", daemon=True).start()
+                self._loop, self._pid, self._session = loop, os.getpid(), None
+                self._scheduler = RateLimitScheduler(self.config.tpm_limit, self.config.rpm_limit)
+                logger.info(f"Started Azure OpenAI client loop in process {self._pid}")
+            return self._loop
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the pooled session. Must run on the background loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.config.http_pool_size,
+                ttl_dns_cache=self.config.http_dns_cache_ttl,
+                keepalive_timeout=self.config.http_keepalive_timeout,
+            )
+            timeout = aiohttp.ClientTimeout(
+                total=self.config.http_total_timeout,
+                sock_connect=self.config.http_connect_timeout,
+                sock_read=self.config.http_read_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=timeout,
+                headers={"api-key": self.config.azure_api_key, "Content-Type": "application/json"},
+            )
+        return self._session
+
+    def estimate_tokens(self, payload: Dict[str, Any]) -> int:
+        """Estimate the quota cost of a request: prompt tokens plus the completion allowance."""
+        if self._tokenizer is None:
+            self._tokenizer = tiktoken.encoding_for_model("gpt-4o-mini")
+        prompt_tokens = sum(
+            len(self._tokenizer.encode(message.get("content") or "")) + 4
+            for message in payload["messages"]
+        )
+        completion_tokens = payload.get("max_completion_tokens") or self.config.completion_token_estimate
+        return prompt_tokens + completion_tokens * payload.get("n", 1)
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter"""
+        return self.config.retry_backoff * (2 ** attempt) * (0.5 + random.random())
+
+    async def _post(self, payload: Dict[str, Any], priority: int, estimate: int) -> Dict[str, Any]:
+        """Schedule and send one chat completions request on the background loop, with retries."""
+        scheduler = self._scheduler
+        attempt = 0
+        while True:
+            await scheduler.acquire(estimate, priority, self.config.queue_timeout)
+            delay: Optional[float] = None
+            try:
+                async with self._get_session().post(self.endpoint, json=payload) as response:
+                    scheduler.observe(response.headers)
+                    if response.status == 200:
+                        data = await response.json()
+                        scheduler.settle(estimate, data.get("usage", {}).get("total_tokens", estimate))
+                        return data
+                    error: Exception = AzureOpenAIError(response.status, await response.text())
+                    retryable = response.status in RETRYABLE_STATUSES
+                    delay = retry_after_seconds(response.headers)
+            except asyncio.TimeoutError as e:
+                detail = str(e) or f"no response within {self.config.http_total_timeout}s"
+                raise asyncio.TimeoutError(f"Azure OpenAI request timeout: {detail}") from e
+            except aiohttp.ClientConnectionError as e:
+                error, retryable = e, True
+
+            if not retryable or attempt >= self.config.max_retries:
+                raise error
+
+            if delay is None:
+                delay = self._backoff(attempt)
+            attempt += 1
+            logger.warning(
+                f"Azure OpenAI request failed ({error}), retry {attempt}/{self.config.max_retries} "
+                f"in {delay:.1f}s ({scheduler.queued} queued)"
+            )
+            if isinstance(error, AzureOpenAIError) and error.status == 429:
+                # Everyone backs off, not just this request; acquire() waits out the pause
+                scheduler.pause(delay)
+            else:
+                await asyncio.sleep(delay)
+
+    async def chat(self, messages: List[Dict[str, str]], temperature: Optional[float] = None,
+                   priority: int = PRIORITY_GENERATION, **params: Any) -> Dict[str, Any]:
+        """
+        Create a chat completion.
+
+        Args:
+            messages: Chat messages ({"role": ..., "content": ...})
+            temperature: Sampling temperature, sent only if the deployment supports it
+            priority: Scheduling priority (PRIORITY_*), lower is served first
+            **params: Extra request fields (e.g. max_completion_tokens)
+
+        Returns:
+            The parsed chat completions response
+
+        Raises:
+            AzureOpenAIError: Azure returned a non-200 status after retries,
+                or the request waited longer than queue_timeout for quota
+            aiohttp.ClientError / asyncio.TimeoutError: The request failed
+        """
+        payload: Dict[str, Any] = {"messages": messages, **params}
+        if temperature is not None and self.config.supports_temperature:
+            payload["temperature"] = temperature
+        estimate = self.estimate_tokens(payload)
+
+        loop = self._get_loop()
+        request = self._post(payload, priority, estimate)
+        if asyncio.get_running_loop() is loop:
+            return await request
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(request, loop))
+
+    def close(self):
+        """Close the session and stop the background loop"""
+        with self._lock:
+            loop, session = self._loop, self._session
+            self._loop = self._session = None
+        if loop is None or self._pid != os.getpid():
+            return
+        if session is not None:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+# Global Azure OpenAI client instance
+azure_openai_client = AzureOpenAIClient(config.ai)
@@ -6,11 +6,12 @@ Phase 3: LLMJudge — binary equivalence judge for borderline cosine zone.
 """
 import logging
 import re
-import aiohttp
 from typing import Optional, List, Dict
 
 from rapidfuzz import fuzz, process
 
+from azure_openai import azure_openai_client, AzureOpenAIError, PRIORITY_JUDGE
+
 logger = logging.getLogger(__name__)
 
 # Domain-specific BC Government fiscal reporting abbreviations.
@@ -157,57 +158,40 @@ class LLMJudge:
     a false cache hit that returns wrong SQL.
     """
 
-    async def score_candidate(
-        self,
-        q1: str,
-        q2: str,
-        session: aiohttp.ClientSession,
-        ai_config,
-    ) -> tuple[int, int]:
+    async def score_candidate(self, q1: str, q2: str) -> tuple[int, int]:
         """Return (score, total_tokens). score in [0, 10]. Returns (0, 0) on any error."""
         try:
-            headers = {
-                "api-key": ai_config.azure_api_key,
-                "Content-Type": "application/json",
-            }
-            endpoint = (
-                f"{ai_config.azure_endpoint}/openai/deployments/"
-                f"{ai_config.azure_deployment}/chat/completions"
-                f"?api-version={ai_config.azure_api_version}"
-            )
-            payload = {
-                "messages": [
-                    {"role": "system", "content": _SCORER_SYSTEM},
-                    {"role": "user", "content": _SCORER_PROMPT.format(q1=q1, q2=q2)},
-                ],
-                "max_completion_tokens": 1000,
-            }
-            if ai_config.supports_temperature:
-                payload["temperature"] = 0
-            async with session.post(endpoint, headers=headers, json=payload) as resp:
-                if resp.status != 200:
-                    error_body = await resp.text()
-                    logger.warning(f"[llm_judge] API error status={resp.status} body={error_body}")
-                    return 0, 0
-                data = await resp.json()
-                choice = data["choices"][0]
-                finish_reason = choice.get("finish_reason", "unknown")
-                text = choice["message"].get("content") or ""
-                usage = data.get("usage", {})
-                tokens = usage.get("total_tokens", 0)
-                reasoning_tokens = usage.get("completion_tokens_details", {}).get("reasoning_tokens", 0)
-                if finish_reason == "content_filter":
-                    logger.warning(
-                        "[llm_judge] content_filter triggered — defaulting score=0"
-                    )
-                    return 0, tokens
-                score = self._parse_score(text)
-                logger.debug(
-                    f"[llm_judge] finish_reason={finish_reason} "
-                    f"reasoning_tokens={reasoning_tokens} "
-                    f"raw_response={text!r} parsed_score={score}"
+            try:
+                data = await azure_openai_client.chat(
+                    [
+                        {"role": "system", "content": _SCORER_SYSTEM},
+                        {"role": "user", "content": _SCORER_PROMPT.format(q1=q1, q2=q2)},
+                    ],
+                    temperature=0,
+                    priority=PRIORITY_JUDGE,
+                    max_completion_tokens=1000,
                 )
-                return score, tokens
+            except AzureOpenAIError as e:
+                logger.warning(f"[llm_judge] API error status={e.status} body={e.body}")
+                return 0, 0
+            choice = data["choices"][0]
+            finish_reason = choice.get("finish_reason", "unknown")
+            text = choice["message"].get("content") or ""
+            usage = data.get("usage", {})
+            tokens = usage.get("total_tokens", 0)
+            reasoning_tokens = usage.get("completion_tokens_details", {}).get("reasoning_tokens", 0)
+            if finish_reason == "content_filter":
+                logger.warning(
+                    "[llm_judge] content_filter triggered — defaulting score=0"
+                )
+                return 0, tokens
+            score = self._parse_score(text)
+            logger.debug(
+                f"[llm_judge] finish_reason={finish_reason} "
+                f"reasoning_tokens={reasoning_tokens} "
+                f"raw_response={text!r} parsed_score={score}"
+            )
+            return score, tokens
         except Exception as exc:
             logger.warning(f"[llm_judge] Exception, defaulting score=0: {exc}")
             return 0, 0
@@ -5,7 +5,7 @@ Handles conversation state and Metabase card recreation.
 import logging
 from typing import List, Dict, Any, Optional
 from database import chat_repository
-from metabase import metabase_client
+from metabase import metabase_client, build_card_visualization
 from config import config
 
 # Configure logging
@@ -23,13 +23,16 @@ class ChatManager:
         """Get all chats for a user"""
         return self.repository.get_user_chats(user_id, tenant_id)
     
-    def get_chat_with_card_validation(self, chat_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    def get_chat_with_card_validation(self, chat_id: str, user_id: str,
+                                      validate_cards: bool = True) -> Optional[Dict[str, Any]]:
         """
         Get a chat and recreate any missing Metabase cards.
         
         Args:
             chat_id: Chat ID
             user_id: User ID
+            validate_cards: Check and recreate cards; callers that run
+                recreate_cards themselves pass False to get the chat at once
             
         Returns:
             Chat data with validated/recreated cards
@@ -39,6 +42,8 @@ class ChatManager:
             return None
         
         conversation = chat_data["conversation"]
+        if not validate_cards:
+            return {"conversation": conversation}
         tenant_id = chat_data["tenant_id"]
         
         # Get tenant configuration
@@ -73,69 +78,124 @@ class ChatManager:
         Returns:
             Updated conversation with recreated cards
         """
-        # Get all existing card IDs from Metabase
-        existing_card_ids = self.metabase.get_all_cards(tenant_id=tenant_id)
-
-        for turn in conversation:
-            self._recreate_card_if_missing(turn, existing_card_ids, db_id, collection_id,
-                                           tenant_id=tenant_id)
+        # Turns are independent, so check and recreate their cards concurrently
+        # against one registry listing
+        self.metabase.refresh_card_registry(tenant_id, collection_id)
+        self.metabase.map_cards(
+            lambda turn: self._recreate_card_if_missing(turn, db_id, collection_id, tenant_id=tenant_id),
+            conversation
+        )
 
         return conversation
 
-    def _recreate_card_if_missing(self, turn: Dict, existing_card_ids: List,
-                                  db_id: int, collection_id: int,
-                                  tenant_id: Optional[str] = None) -> None:
-        """Recreate a Metabase card for a turn if it no longer exists."""
+    def recreate_cards(self, cards: List[Dict], tenant_id: str) -> List[Dict[str, Any]]:
+        """
+        Check many cards and recreate the missing ones concurrently.
+
+        Args:
+            cards: Embed dicts with card_id, SQL, title and optionally
+                current_visualization, x_field and y_field
+            tenant_id: Tenant ID for the Metabase API key and collection
+
+        Returns:
+            One `{"card_id", "new_card_id", "success"}` result per card, in
+            input order. new_card_id equals card_id when the card still exists.
+        """
+        tenant_config = config.get_tenant_config(tenant_id)
+        db_id = tenant_config["db_id"]
+        collection_id = tenant_config["collection_id"]
+
+        def recreate(card: Dict) -> Dict[str, Any]:
+            embed_data = dict(card)
+            success = self._recreate_card_if_missing(
+                {"embed": embed_data}, db_id, collection_id, tenant_id=tenant_id
+            )
+            return {"card_id": card["card_id"], "new_card_id": embed_data["card_id"], "success": success}
+
+        self.metabase.refresh_card_registry(tenant_id, collection_id)
+        return self.metabase.map_cards(recreate, cards)
+
+    def _recreate_card_if_missing(self, turn: Dict, db_id: int, collection_id: int,
+                                  tenant_id: Optional[str] = None) -> bool:
+        """
+        Recreate a Metabase card for a turn if it no longer exists.
+
+        Returns:
+            True if the turn's card exists or was recreated
+        """
         embed_data = turn.get('embed')
         if not embed_data or 'card_id' not in embed_data:
-            return
+            return False
 
         card_id = embed_data['card_id']
 
         # Card still exists — nothing to do
-        if card_id in existing_card_ids:
-            return
+        if self.metabase.check_card_exists(card_id, tenant_id=tenant_id, collection_id=collection_id):
+            return True
 
         sql = embed_data.get('SQL', '')
         if not sql:
-            return
+            return False
 
         title = embed_data.get('title', 'Untitled')
+        viz_type = embed_data.get('current_visualization')
+        x_fields = embed_data.get('x_field', [])
+        y_fields = embed_data.get('y_field', [])
         try:
-            # Create new card; card_data unused here (only restoring the card)
-            new_card_id, _ = self.metabase.create_card(
-                sql, db_id, collection_id, title,
-                tenant_id=tenant_id
-            )
-
-            # Apply visualization settings if available
-            self._apply_visualization(new_card_id, embed_data, tenant_id=tenant_id)
+            # Reuse or create a card with the turn's visualization; the query is not run
+            if viz_type and x_fields and y_fields:
+                new_card_id, reused = self.metabase.get_or_create_card(
+                    sql, db_id, collection_id, title, tenant_id=tenant_id,
+                    visualization_settings=build_card_visualization(viz_type, x_fields, y_fields),
+                    display=viz_type
+                )
+            else:
+                new_card_id, reused = self.metabase.get_or_create_card(
+                    sql, db_id, collection_id, title, tenant_id=tenant_id
+                )
 
             # Update turn with new card info
             embed_data['card_id'] = new_card_id
 
-            logger.info(f"Recreated card {card_id} as {new_card_id}")
+            logger.info(f"{'Reused' if reused else 'Recreated'} card {card_id} as {new_card_id}")
+            return True
         except Exception as e:
             logger.error(f"Error recreating card {card_id}: {e}", exc_info=True)
+            return False
 
-    def _apply_visualization(self, card_id: int, embed_data: Dict,
-                             tenant_id: Optional[str] = None) -> None:
-        """Apply visualization settings to a card if all fields are present."""
-        viz_type = embed_data.get('current_visualization')
-        x_fields = embed_data.get('x_field', [])
-        y_fields = embed_data.get('y_field', [])
+    def replace_card_ids(self, chat_id: str, user_id: str, card_ids: Dict[int, int]) -> bool:
+        """
+        Point a chat's turns at new cards, e.g. after a shared card was
+        restyled into a copy (see MetabaseClient.update_card_visualization).
+        Other chats still referencing the old cards are not touched.
 
-        if not (viz_type and x_fields and y_fields):
-            return
+        Args:
+            chat_id: Chat ID
+            user_id: User ID
+            card_ids: Old card ID to new card ID
+
+        Returns:
+            True if the chat was found and updated
+        """
+        card_ids = {old: new for old, new in card_ids.items() if old != new}
+        if not card_ids:
+            return False
+        chat_data = self.repository.get_chat(chat_id, user_id)
+        if not chat_data:
+            return False
+
+        conversation = chat_data["conversation"]
+        changed = False
+        for turn in conversation:
+            embed_data = turn.get("embed")
+            if isinstance(embed_data, dict) and embed_data.get("card_id") in card_ids:
+                embed_data["card_id"] = card_ids[embed_data["card_id"]]
+                changed = True
+
+        if changed:
+            self.repository.update_chat_cards(chat_id, user_id, conversation)
+        return changed
 
-        try:
-            self.metabase.update_card_visualization(
-                card_id, viz_type, x_fields, y_fields,
-                tenant_id=tenant_id
-            )
-        except Exception as e:
-            logger.error(f"Error updating visualization: {e}", exc_info=True)
-    
     def save_chat(self, user_id: str, tenant_id: str, metabase_url: str,
                   title: str, conversation: List[Dict], 
                   chat_id: Optional[str] = None) -> str:
@@ -144,9 +204,31 @@ class ChatManager:
             user_id, tenant_id, metabase_url, title, conversation, chat_id
         )
     
-    def delete_chat(self, chat_id: str, user_id: str) -> bool:
-        """Delete a chat"""
-        return self.repository.delete_chat(chat_id, user_id)
+    def delete_chat(self, chat_id: str, user_id: str, tenant_id: Optional[str] = None) -> bool:
+        """
+        Delete a chat and its Metabase cards.
+
+        The cards are deleted together in one delete_cards call; a card
+        shared with other chats only loses this chat's reference. Card
+        failures are logged and do not fail the chat deletion.
+
+        Returns:
+            True if the chat was found and deleted
+        """
+        conversation = self.repository.delete_chat(chat_id, user_id)
+        if conversation is None:
+            return False
+
+        card_ids = [
+            turn["embed"]["card_id"] for turn in conversation
+            if isinstance(turn.get("embed"), dict) and turn["embed"].get("card_id")
+        ]
+        if card_ids:
+            results = self.metabase.delete_cards(card_ids, tenant_id=tenant_id)
+            failed = [result["card_id"] for result in results if not result["success"]]
+            if failed:
+                logger.warning(f"Could not delete cards {failed} of chat {chat_id}")
+        return True
     
     def extract_past_questions(self, conversation: List[Dict]) -> List[Dict]:
         """
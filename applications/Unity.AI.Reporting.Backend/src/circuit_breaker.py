@@ -0,0 +1,234 @@
+"""
+Circuit breaker and in-flight limits for Metabase calls.
+Isolates tenants and endpoint classes so one degraded database cannot
+tie up every worker thread.
+"""
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, AsyncIterator, Optional, Tuple
+
+import aiohttp
+import requests
+
+from config import config, DEFAULT_TENANT
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class MetabaseUnavailableError(requests.exceptions.ConnectionError):
+    """Raised without calling Metabase when a circuit is open or its in-flight limit is full."""
+
+
+def endpoint_class(path: str) -> str:
+    """
+    Map a Metabase API path to the endpoint class used for limits.
+
+    Classes: "query" (/api/dataset, /api/async), "card" (/api/card) and
+    "metadata" (database metadata and collection listings).
+    """
+    if path.startswith("/api/card"):
+        return "card"
+    if path.startswith("/api/database") or path.startswith("/api/collection"):
+        return "metadata"
+    return "query"
+
+
+@dataclass
+class _Circuit:
+    """State for one (tenant, endpoint class) pair"""
+    state: str = CLOSED
+    failures: int = 0
+    opened_at: float = 0.0
+    probe_in_flight: bool = False
+    in_flight: int = 0
+
+
+class _Call:
+    """
+    Handle yielded by guard(); set failed for responses that count as failures,
+    or cancelled for calls the caller abandoned (e.g. at a statement timeout).
+    """
+
+    def __init__(self, probe: bool = False):
+        self.failed = False
+        self.cancelled = False
+        self.probe = probe
+
+
+class CircuitBreaker:
+    """
+    Per-tenant, per-endpoint-class circuit breaker with in-flight limits.
+
+    After failure_threshold consecutive failures (connection errors, timeouts
+    or 5xx responses) the circuit opens and calls fail fast with
+    MetabaseUnavailableError. After recovery_timeout seconds one probe call is
+    let through (half-open); success closes the circuit, failure re-opens it.
+    Independently, each circuit admits at most limits[endpoint_class] calls at
+    once; callers wait up to acquire_timeout for a slot.
+    """
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float,
+                 limits: Dict[str, int], acquire_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.limits = limits
+        self.acquire_timeout = acquire_timeout
+        self._circuits: Dict[Tuple[str, str], _Circuit] = {}
+        self._cond = threading.Condition()
+
+    def _circuit(self, key: Tuple[str, str]) -> _Circuit:
+        circuit = self._circuits.get(key)
+        if circuit is None:
+            circuit = self._circuits[key] = _Circuit()
+        return circuit
+
+    def _try_enter(self, key: Tuple[str, str]) -> Optional[_Call]:
+        """
+        Try to admit a call. Must hold self._cond.
+
+        Returns the call handle if admitted, None if the in-flight limit is
+        full, and raises MetabaseUnavailableError if the circuit is open.
+        """
+        circuit = self._circuit(key)
+        if circuit.state == OPEN:
+            if time.monotonic() - circuit.opened_at < self.recovery_timeout:
+                raise MetabaseUnavailableError(
+                    f"Metabase connection error: circuit open for tenant '{key[0]}' ({key[1]})"
+                )
+            circuit.state = HALF_OPEN
+            logger.info(f"Metabase circuit half-open for tenant '{key[0]}' ({key[1]})")
+
+        probe = circuit.state == HALF_OPEN
+        if probe and circuit.probe_in_flight:
+            raise MetabaseUnavailableError(
+                f"Metabase connection error: circuit probing for tenant '{key[0]}' ({key[1]})"
+            )
+
+        if circuit.in_flight >= self.limits.get(key[1], self.limits["query"]):
+            return None
+
+        circuit.in_flight += 1
+        if probe:
+            circuit.probe_in_flight = True
+        return _Call(probe=probe)
+
+    def _exit(self, key: Tuple[str, str], call: _Call):
+        """Release a slot and update circuit state. Must hold self._cond."""
+        circuit = self._circuit(key)
+        circuit.in_flight -= 1
+        was_probe = call.probe
+        if was_probe:
+            circuit.probe_in_flight = False
+
+        if call.cancelled:
+            # Abandoned by the caller or stopped at its statement timeout, which
+            # says nothing about Metabase's health
+            self._cond.notify_all()
+            return
+
+        if not call.failed:
+            if circuit.state != CLOSED:
+                logger.info(f"Metabase circuit closed for tenant '{key[0]}' ({key[1]})")
+            circuit.state = CLOSED
+            circuit.failures = 0
+        else:
+            circuit.failures += 1
+            if was_probe or circuit.failures >= self.failure_threshold:
+                if circuit.state != OPEN:
+                    logger.warning(
+                        f"Metabase circuit opened for tenant '{key[0]}' ({key[1]}) "
+                        f"after {circuit.failures} failures"
+                    )
+                circuit.state = OPEN
+                circuit.opened_at = time.monotonic()
+        self._cond.notify_all()
+
+    @staticmethod
+    def _key(tenant_id: Optional[str], klass: str) -> Tuple[str, str]:
+        return tenant_id or DEFAULT_TENANT, klass
+
+    def _limit_error(self, key: Tuple[str, str]) -> MetabaseUnavailableError:
+        return MetabaseUnavailableError(
+            f"Metabase connection error: too many in-flight {key[1]} calls for tenant '{key[0]}'"
+        )
+
+    @contextmanager
+    def guard(self, tenant_id: Optional[str], klass: str) -> Iterator[_Call]:
+        """Admit a blocking call, waiting for a slot, and record its outcome."""
+        key = self._key(tenant_id, klass)
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while (call := self._try_enter(key)) is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise self._limit_error(key)
+                self._cond.wait(remaining)
+
+        try:
+            yield call
+        except (requests.exceptions.RequestException, aiohttp.ClientError, asyncio.TimeoutError):
+            call.failed = True
+            raise
+        finally:
+            with self._cond:
+                self._exit(key, call)
+
+    @asynccontextmanager
+    async def guard_async(self, tenant_id: Optional[str], klass: str) -> AsyncIterator[_Call]:
+        """Admit a call from the event loop without blocking it while waiting for a slot."""
+        key = self._key(tenant_id, klass)
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                call = self._try_enter(key)
+            if call is not None:
+                break
+            if time.monotonic() >= deadline:
+                raise self._limit_error(key)
+            await asyncio.sleep(0.05)
+
+        try:
+            yield call
+        except (requests.exceptions.RequestException, aiohttp.ClientError, asyncio.TimeoutError):
+            call.failed = True
+            raise
+        except asyncio.CancelledError:
+            call.cancelled = True
+            raise
+        finally:
+            with self._cond:
+                self._exit(key, call)
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Get the state of every circuit, keyed by 'tenant/class'"""
+        with self._cond:
+            return {
+                f"{tenant}/{klass}": {
+                    "state": circuit.state,
+                    "failures": circuit.failures,
+                    "in_flight": circuit.in_flight,
+                }
+                for (tenant, klass), circuit in self._circuits.items()
+            }
+
+
+# Shared breaker for all Metabase clients in this process
+metabase_breaker = CircuitBreaker(
+    failure_threshold=config.metabase.breaker_failure_threshold,
+    recovery_timeout=config.metabase.breaker_recovery_timeout,
+    limits={
+        "query": config.metabase.max_in_flight_query,
+        "card": config.metabase.max_in_flight_card,
+        "metadata": config.metabase.max_in_flight_metadata,
+    },
+    acquire_timeout=config.metabase.breaker_acquire_timeout,
+)
@@ -4,8 +4,9 @@ Handles environment variables and application settings.
 """
 import os
 import json
+import tempfile
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from dataclasses import dataclass
 from dotenv import load_dotenv
 
@@ -38,7 +39,69 @@ class MetabaseConfig:
     url: str
     default_db_id: int
     map_region_uuid: str
-    
+    # HTTP connection pool settings (one pooled keep-alive session per tenant)
+    pool_size: int = 10
+    connect_timeout: float = 5.0
+    read_timeout: float = 30.0
+    max_retries: int = 3
+    retry_backoff: float = 0.5
+    # Max in-flight requests per AsyncMetabaseClient
+    async_max_concurrency: int = 8
+    # SQL validation mode: "full" runs the query, "explain" / "limit0" only plan it.
+    # Tenants can override with "validation_mode" / "cache_validation_mode" keys.
+    validation_mode: str = "full"
+    cache_validation_mode: str = "explain"
+    # Candidate fingerprint mode: "rows" hashes the fetched result in Python
+    # (and keeps it as the card preview); "server" computes the row count and
+    # an order-independent hash of the full result in the database.
+    fingerprint_mode: str = "rows"
+    # In-process TTL/LRU cache for execute_sql results
+    result_cache_enabled: bool = True
+    result_cache_size: int = 512
+    result_cache_ttl: float = 300.0
+    result_cache_max_rows: int = 5000
+    # Seconds before a tenant collection's card ID set is re-listed
+    card_registry_ttl: float = 300.0
+    # Polling of 202 /api/async/{id} jobs (exponential backoff with jitter)
+    poll_initial_interval: float = 0.25
+    poll_max_interval: float = 2.0
+    validation_job_timeout: float = 10.0
+    async_job_timeout: float = 30.0
+    # Database metadata cache (compact table index per db_id, memory + disk)
+    metadata_cache_ttl: float = 3600.0
+    metadata_cache_dir: str = ""
+    # Circuit breaker and in-flight limits per (tenant, endpoint class)
+    breaker_failure_threshold: int = 5
+    breaker_recovery_timeout: float = 30.0
+    breaker_acquire_timeout: float = 5.0
+    max_in_flight_query: int = 8
+    max_in_flight_card: int = 4
+    max_in_flight_metadata: int = 2
+    # Bulk card endpoints: cards handled concurrently, and max cards per request
+    bulk_max_concurrency: int = 4
+    bulk_max_cards: int = 100
+    # Pre-execution cost guard on EXPLAIN (FORMAT JSON) estimates (0 disables a limit).
+    # Tenants can override with "max_query_cost" / "max_query_rows" /
+    # "validation_statement_timeout" keys.
+    cost_guard_enabled: bool = True
+    max_query_cost: float = 10000000.0
+    max_query_rows: float = 5000000.0
+    # Seconds a validation or fingerprint execution may run before it is abandoned
+    validation_statement_timeout: float = 20.0
+
+
+@dataclass
+class ReportingDatabaseConfig:
+    """
+    Direct read-only connections to tenant reporting databases.
+    Connection settings come from each tenant's "reporting_db" key; tenants
+    without one run candidate SQL through Metabase.
+    """
+    pool_size: int = 4
+    acquire_timeout: float = 5.0
+    # Matches Metabase's row limit for ad-hoc queries so fingerprints agree
+    max_rows: int = 2000
+
 
 @dataclass
 class AIConfig:
@@ -51,6 +114,30 @@ class AIConfig:
     azure_embedding_deployment: str = "text-embedding-3-large"
     temperature: float = 0.2
     k_samples: int = 7
+    # Voting: "all" waits for every sample, "early" stops once vote_quorum samples agree
+    vote_mode: str = "all"
+    vote_quorum: int = 3
+    # Adaptive sampling: start simple questions at k_initial and escalate to k_samples on disagreement
+    adaptive_sampling: bool = False
+    k_initial: int = 3
+    # Start generation alongside the relevance check instead of after it
+    speculative_relevance: bool = False
+    # Request all samples in one call with n=k instead of k parallel calls
+    sample_with_n: bool = False
+    # Shared Azure OpenAI HTTP client (per worker process)
+    http_pool_size: int = 20
+    http_keepalive_timeout: float = 60.0
+    http_dns_cache_ttl: int = 300
+    http_connect_timeout: float = 10.0
+    http_read_timeout: float = 120.0
+    http_total_timeout: float = 180.0
+    # Azure quota scheduling: budgets per minute (0 = unlimited) and retries
+    tpm_limit: int = 0
+    rpm_limit: int = 0
+    completion_token_estimate: int = 1000
+    queue_timeout: float = 60.0
+    max_retries: int = 3
+    retry_backoff: float = 1.0
 
     @property
     def supports_temperature(self) -> bool:
@@ -76,6 +163,12 @@ class AppConfig:
     llm_judge_enabled: bool = False
     llm_judge_score_threshold: float = 8.0
     preview_row_limit: int = 1000
+    embed_skip_unchanged: bool = True
+    # Few-shot examples: send only the top_n closest to the question, within a token budget (0 = no limit).
+    # Uses the semantic cache's question embedding; all examples are sent when that cache is off
+    few_shot_selection_enabled: bool = True
+    few_shot_top_n: int = 4
+    few_shot_token_budget: int = 4000
 
 
 class Config:
@@ -98,11 +191,69 @@ class Config:
             url=os.getenv("MB_URL", ""),
             default_db_id=default_db_id,
             map_region_uuid=os.getenv("MB_MAP_REGION_UUID", ""),
+            pool_size=int(os.getenv("MB_POOL_SIZE", "10")),
+            connect_timeout=float(os.getenv("MB_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("MB_READ_TIMEOUT", "30")),
+            max_retries=int(os.getenv("MB_MAX_RETRIES", "3")),
+            retry_backoff=float(os.getenv("MB_RETRY_BACKOFF", "0.5")),
+            async_max_concurrency=int(os.getenv("MB_ASYNC_MAX_CONCURRENCY", "8")),
+            validation_mode=os.getenv("MB_VALIDATION_MODE", "full").lower(),
+            cache_validation_mode=os.getenv("MB_CACHE_VALIDATION_MODE", "explain").lower(),
+            fingerprint_mode=os.getenv("MB_FINGERPRINT_MODE", "rows").lower(),
+            result_cache_enabled=os.getenv("MB_RESULT_CACHE_ENABLED", "true").lower() == "true",
+            result_cache_size=int(os.getenv("MB_RESULT_CACHE_SIZE", "512")),
+            result_cache_ttl=float(os.getenv("MB_RESULT_CACHE_TTL", "300")),
+            result_cache_max_rows=int(os.getenv("MB_RESULT_CACHE_MAX_ROWS", "5000")),
+            card_registry_ttl=float(os.getenv("MB_CARD_REGISTRY_TTL", "300")),
+            poll_initial_interval=float(os.getenv("MB_POLL_INITIAL_INTERVAL", "0.25")),
+            poll_max_interval=float(os.getenv("MB_POLL_MAX_INTERVAL", "2")),
+            validation_job_timeout=float(os.getenv("MB_VALIDATION_JOB_TIMEOUT", "10")),
+            async_job_timeout=float(os.getenv("MB_ASYNC_JOB_TIMEOUT", "30")),
+            metadata_cache_ttl=float(os.getenv("MB_METADATA_CACHE_TTL", "3600")),
+            metadata_cache_dir=os.getenv(
+                "MB_METADATA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "unity-ai-metadata")
+            ),
+            breaker_failure_threshold=int(os.getenv("MB_BREAKER_FAILURE_THRESHOLD", "5")),
+            breaker_recovery_timeout=float(os.getenv("MB_BREAKER_RECOVERY_TIMEOUT", "30")),
+            breaker_acquire_timeout=float(os.getenv("MB_BREAKER_ACQUIRE_TIMEOUT", "5")),
+            max_in_flight_query=int(os.getenv("MB_MAX_IN_FLIGHT_QUERY", "8")),
+            max_in_flight_card=int(os.getenv("MB_MAX_IN_FLIGHT_CARD", "4")),
+            max_in_flight_metadata=int(os.getenv("MB_MAX_IN_FLIGHT_METADATA", "2")),
+            bulk_max_concurrency=int(os.getenv("MB_BULK_MAX_CONCURRENCY", "4")),
+            bulk_max_cards=int(os.getenv("MB_BULK_MAX_CARDS", "100")),
+            cost_guard_enabled=os.getenv("MB_COST_GUARD_ENABLED", "true").lower() == "true",
+            max_query_cost=float(os.getenv("MB_MAX_QUERY_COST", "10000000")),
+            max_query_rows=float(os.getenv("MB_MAX_QUERY_ROWS", "5000000")),
+            validation_statement_timeout=float(os.getenv("MB_VALIDATION_STATEMENT_TIMEOUT", "20")),
+        )
+
+        self.reporting_db = ReportingDatabaseConfig(
+            pool_size=int(os.getenv("REPORTING_DB_POOL_SIZE", "4")),
+            acquire_timeout=float(os.getenv("REPORTING_DB_ACQUIRE_TIMEOUT", "5")),
+            max_rows=int(os.getenv("REPORTING_DB_MAX_ROWS", "2000")),
         )
 
         self.ai = AIConfig(
             azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", ""),
             azure_api_key=os.getenv("AZURE_OPENAI_API_KEY", ""),
+            vote_mode=os.getenv("AI_VOTE_MODE", "all").lower(),
+            vote_quorum=int(os.getenv("AI_VOTE_QUORUM", "3")),
+            adaptive_sampling=os.getenv("AI_ADAPTIVE_SAMPLING", "false").lower() == "true",
+            k_initial=int(os.getenv("AI_K_INITIAL", "3")),
+            speculative_relevance=os.getenv("AI_SPECULATIVE_RELEVANCE", "false").lower() == "true",
+            sample_with_n=os.getenv("AI_SAMPLE_WITH_N", "false").lower() == "true",
+            http_pool_size=int(os.getenv("AZURE_OPENAI_POOL_SIZE", "20")),
+            http_keepalive_timeout=float(os.getenv("AZURE_OPENAI_KEEPALIVE_TIMEOUT", "60")),
+            http_dns_cache_ttl=int(os.getenv("AZURE_OPENAI_DNS_CACHE_TTL", "300")),
+            http_connect_timeout=float(os.getenv("AZURE_OPENAI_CONNECT_TIMEOUT", "10")),
+            http_read_timeout=float(os.getenv("AZURE_OPENAI_READ_TIMEOUT", "120")),
+            http_total_timeout=float(os.getenv("AZURE_OPENAI_TOTAL_TIMEOUT", "180")),
+            tpm_limit=int(os.getenv("AZURE_OPENAI_TPM_LIMIT", "0")),
+            rpm_limit=int(os.getenv("AZURE_OPENAI_RPM_LIMIT", "0")),
+            completion_token_estimate=int(os.getenv("AZURE_OPENAI_COMPLETION_TOKEN_ESTIMATE", "1000")),
+            queue_timeout=float(os.getenv("AZURE_OPENAI_QUEUE_TIMEOUT", "60")),
+            max_retries=int(os.getenv("AZURE_OPENAI_MAX_RETRIES", "3")),
+            retry_backoff=float(os.getenv("AZURE_OPENAI_RETRY_BACKOFF", "1")),
         )
 
         flask_env = os.getenv("FLASK_ENV", "development")
@@ -120,6 +271,10 @@ class Config:
             llm_judge_enabled=os.getenv("LLM_JUDGE_ENABLED", "false").lower() == "true",
             llm_judge_score_threshold=float(os.getenv("LLM_JUDGE_SCORE_THRESHOLD", "8.0")),
             preview_row_limit=int(os.getenv("PREVIEW_ROW_LIMIT", "1000")),
+            embed_skip_unchanged=os.getenv("EMBED_SKIP_UNCHANGED", "true").lower() == "true",
+            few_shot_selection_enabled=os.getenv("FEW_SHOT_SELECTION_ENABLED", "true").lower() == "true",
+            few_shot_top_n=int(os.getenv("FEW_SHOT_TOP_N", "4")),
+            few_shot_token_budget=int(os.getenv("FEW_SHOT_TOKEN_BUDGET", "4000")),
         )
     
     def _load_tenant_mappings(self) -> Dict[str, Dict[str, Any]]:
@@ -179,6 +334,42 @@ class Config:
         """Get configuration for a specific tenant"""
         return self.tenant_mappings.get(tenant_id, self.tenant_mappings[DEFAULT_TENANT])
 
+    def get_tenant_validation_mode(self, tenant_id: Optional[str], cache_hit: bool = False) -> str:
+        """
+        Get the SQL validation mode for a tenant.
+        cache_hit selects the mode used to revalidate semantic cache hits.
+        """
+        key = "cache_validation_mode" if cache_hit else "validation_mode"
+        default = self.metabase.cache_validation_mode if cache_hit else self.metabase.validation_mode
+        tenant_config = self.get_tenant_config(tenant_id or DEFAULT_TENANT)
+        return str(tenant_config.get(key, default)).lower()
+
+    def get_tenant_query_limits(self, tenant_id: Optional[str]) -> Dict[str, float]:
+        """
+        Get the cost guard thresholds and validation statement timeout for a tenant.
+
+        Returns:
+            Dict with max_query_cost, max_query_rows (0 disables the limit)
+            and validation_statement_timeout in seconds
+        """
+        tenant_config = self.get_tenant_config(tenant_id or DEFAULT_TENANT)
+        return {
+            key: float(tenant_config.get(key, getattr(self.metabase, key)))
+            for key in ("max_query_cost", "max_query_rows", "validation_statement_timeout")
+        }
+
+    def get_tenant_reporting_db(self, tenant_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Get the direct reporting database connection settings for a tenant.
+
+        Returns:
+            The tenant's "reporting_db" dict (host, port, dbname, user,
+            password and optional sslmode / pool_size), or None when the
+            tenant validates SQL through Metabase
+        """
+        tenant_config = self.get_tenant_config(tenant_id or DEFAULT_TENANT)
+        return tenant_config.get("reporting_db") or None
+
     def get_tenant_metabase_headers(self, tenant_id: str) -> Dict[str, str]:
         """Get Metabase API headers for a specific tenant using its api_key from tenant config."""
         tenant_config = self.get_tenant_config(tenant_id)
@@ -1,42 +1,32 @@
 import json
 import textwrap
-import requests
 import logging
 from config import config
+from metabase import metabase_client
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 
-def _get_headers(tenant_id=None):
-    """Get Metabase API headers, using tenant-specific key if available."""
-    if tenant_id:
-        return config.get_tenant_metabase_headers(tenant_id)
-    return config.metabase_headers
-
-
-def get_sql(sql, db_id, metabase_url, tenant_id=None):
+def get_sql(sql, db_id, tenant_id=None):
     ds_req = {
         "database": db_id,
         "type": "native",
         "native": {"query": sql},
     }
-    r = requests.post(
-        f"{metabase_url}/api/dataset",
-        headers=_get_headers(tenant_id),
-        json=ds_req,
-    )
+    # Goes through the client so the circuit breaker and in-flight limits apply
+    r = metabase_client._request("POST", "/api/dataset", tenant_id, json=ds_req)
     r.raise_for_status()
     return r.json()["data"]
 
 def get_worksheets():
     sql = 'SELECT "Worksheets"."Name", "Worksheets"."Id" FROM "Flex"."Worksheets"'
-    data = get_sql(sql, config.metabase.default_db_id, config.metabase.url)
+    data = get_sql(sql, config.metabase.default_db_id)
     return [{"name": r[0], "id": r[1]} for r in data["rows"]]
 
 def get_worksheet_instances(worksheet_id):
     sql = f'SELECT "WorksheetInstances"."CurrentValue", "WorksheetInstances"."WorksheetCorrelationId" FROM "Flex"."WorksheetInstances" WHERE "WorksheetInstances"."WorksheetId" = \'{worksheet_id}\''
-    data = get_sql(sql, config.metabase.default_db_id, config.metabase.url)
+    data = get_sql(sql, config.metabase.default_db_id)
     return data
 
 def get_custom_labels():
@@ -51,7 +41,7 @@ def get_custom_labels():
         ORDER BY "CustomFields"."Key"
         LIMIT {batch_size} OFFSET {offset}
         '''
-        rows = get_sql(sql, config.metabase.default_db_id, config.metabase.url)["rows"]
+        rows = get_sql(sql, config.metabase.default_db_id)["rows"]
 
         if not rows:
             break
@@ -96,7 +86,7 @@ _(none)_
 
 def get_column_example(table, column):
     sql = f"SELECT \"{column}\" FROM \"Reporting\".\"{table}\" WHERE \"{column}\" IS NOT null and \"{column}\" <> ''"
-    instance = get_sql(sql, config.metabase.default_db_id, config.metabase.url)
+    instance = get_sql(sql, config.metabase.default_db_id)
     try:
         return instance["rows"][0][0]
     except (KeyError, IndexError, TypeError):
@@ -115,10 +105,7 @@ def _format_table_schema(table_name, cols):
     return page
 
 def get_views_schemas():
-    schema = requests.get(
-        f"{config.metabase.url}/api/database/{config.metabase.default_db_id}/metadata",
-        headers=_get_headers()
-    ).json()
+    tables = metabase_client.get_table_index(config.metabase.default_db_id)
 
     junk_cols = {
         "CreatorId", "LastModificationTime", "LastModifierId",
@@ -127,7 +114,7 @@ def get_views_schemas():
 
     docs = []
 
-    for tbl in schema["tables"]:
+    for tbl in tables:
         if tbl["schema"] != "Reporting" or "Worksheet" not in tbl['name']:
             continue
 
@@ -139,7 +126,7 @@ def get_views_schemas():
 
         # Find out if there are non-blank rows
         sql = f"SELECT * FROM \"Reporting\".\"{tbl['name']}\" "
-        instance = get_sql(sql, config.metabase.default_db_id, config.metabase.url)
+        instance = get_sql(sql, config.metabase.default_db_id)
         rows = [r for r in instance["rows"] if set(r[3:]) != set([''])]
         if not rows:
             continue
@@ -99,6 +99,24 @@ class DatabaseManager:
                         ON query_cache(tenant_id, db_id, schema_fingerprint);
                 """)
 
+                # Card dedup registry: reuse live Metabase cards for identical SQL + visualization
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS card_dedup (
+                        tenant_id TEXT NOT NULL,
+                        collection_id INTEGER NOT NULL,
+                        sql_hash TEXT NOT NULL,
+                        viz_hash TEXT NOT NULL,
+                        card_id INTEGER NOT NULL,
+                        ref_count INTEGER NOT NULL DEFAULT 1,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (tenant_id, collection_id, sql_hash, viz_hash)
+                    );
+
+                    CREATE INDEX IF NOT EXISTS idx_card_dedup_card
+                        ON card_dedup(tenant_id, card_id);
+                """)
+
                 # ivfflat index requires rows to exist first — created separately via evict_old
                 # or on first similarity search. Skip here to avoid error on empty table.
 
@@ -148,6 +166,25 @@ class DatabaseManager:
             raise
 
 
+    def count_embeddings(self, db_id: int, collection_name: str = "embedded_schema") -> int:
+        """Count stored schema embeddings for a database"""
+        try:
+            with self.get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT COUNT(*) FROM langchain_pg_embedding
+                        WHERE collection_id IN (
+                            SELECT uuid FROM langchain_pg_collection
+                            WHERE name = %s
+                        )
+                        AND cmetadata->>'db_id' = %s
+                    """, (collection_name, str(db_id)))
+                    return cur.fetchone()[0]
+        except Exception as e:
+            logger.warning(f"Could not count embeddings for db_id {db_id}: {e}")
+            return 0
+
+
 class ChatRepository:
     """Repository for chat/conversation management"""
     
@@ -231,18 +268,19 @@ class ChatRepository:
                 conn.commit()
                 return result_chat_id
     
-    def delete_chat(self, chat_id: str, user_id: str) -> bool:
-        """Delete a chat"""
+    def delete_chat(self, chat_id: str, user_id: str) -> Optional[List[Dict]]:
+        """Delete a chat, returning its conversation or None if it was not found"""
         with self.db.get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     DELETE FROM chats 
                     WHERE chat_id = %s AND user_id = %s
+                    RETURNING conversation
                 """, (chat_id, user_id))
                 
-                deleted = cur.rowcount > 0
+                row = cur.fetchone()
                 conn.commit()
-                return deleted
+                return row[0] if row else None
     
     def update_chat_cards(self, chat_id: str, user_id: str, conversation: List[Dict]):
         """Update card IDs in a chat conversation"""
@@ -602,8 +640,126 @@ class CacheRepository:
                     conn.commit()
 
 
+class CardDedupRepository:
+    """
+    Repository mapping (tenant, collection, SQL hash, visualization hash) to a
+    Metabase card, so identical cards are reused instead of re-created.
+    ref_count tracks how many answers share a card; it is only deleted from
+    Metabase once the last one lets go.
+    """
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db = db_manager
+
+    def acquire(self, tenant_id: str, collection_id: int,
+                sql_hash: str, viz_hash: str) -> Optional[int]:
+        """Take a reference to a registered card. Returns its card_id, or None if none is registered."""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE card_dedup
+                    SET ref_count    = ref_count + 1,
+                        last_used_at = NOW()
+                    WHERE tenant_id = %s
+                      AND collection_id = %s
+                      AND sql_hash = %s
+                      AND viz_hash = %s
+                    RETURNING card_id
+                """, (tenant_id, collection_id, sql_hash, viz_hash))
+                row = cur.fetchone()
+                conn.commit()
+                return row[0] if row else None
+
+    def register(self, tenant_id: str, collection_id: int,
+                 sql_hash: str, viz_hash: str, card_id: int):
+        """Register a newly created card with one reference, replacing any stale entry."""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO card_dedup (tenant_id, collection_id, sql_hash, viz_hash, card_id)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (tenant_id, collection_id, sql_hash, viz_hash)
+                    DO UPDATE SET
+                        card_id      = EXCLUDED.card_id,
+                        ref_count    = 1,
+                        created_at   = NOW(),
+                        last_used_at = NOW()
+                """, (tenant_id, collection_id, sql_hash, viz_hash, card_id))
+                conn.commit()
+
+    def release(self, tenant_id: str, card_id: int) -> int:
+        """
+        Drop one reference to a card.
+
+        Returns:
+            References still held; 0 when the card is unshared or not registered
+            (its entry is removed so it can be deleted)
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE card_dedup
+                    SET ref_count = ref_count - 1
+                    WHERE tenant_id = %s AND card_id = %s
+                    RETURNING ref_count
+                """, (tenant_id, card_id))
+                row = cur.fetchone()
+                remaining = row[0] if row else 0
+                if row and remaining <= 0:
+                    cur.execute(
+                        "DELETE FROM card_dedup WHERE tenant_id = %s AND card_id = %s",
+                        (tenant_id, card_id)
+                    )
+                conn.commit()
+                return max(remaining, 0)
+
+    def forget(self, tenant_id: str, card_id: int):
+        """Remove a card that no longer exists in Metabase."""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM card_dedup WHERE tenant_id = %s AND card_id = %s",
+                    (tenant_id, card_id)
+                )
+                conn.commit()
+
+    def ref_count(self, tenant_id: str, card_id: int) -> int:
+        """Get how many answers share a card; 0 when it is not registered."""
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT ref_count FROM card_dedup WHERE tenant_id = %s AND card_id = %s",
+                    (tenant_id, card_id)
+                )
+                row = cur.fetchone()
+                return row[0] if row else 0
+
+    def update_visualization(self, tenant_id: str, card_id: int, viz_hash: str):
+        """
+        Re-key an unshared card after its visualization changed. If another
+        card is already registered for the new key, this card is dropped from
+        the registry instead.
+        """
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cur:
+                try:
+                    cur.execute("""
+                        UPDATE card_dedup
+                        SET viz_hash = %s
+                        WHERE tenant_id = %s AND card_id = %s
+                    """, (viz_hash, tenant_id, card_id))
+                except psycopg.errors.UniqueViolation:
+                    conn.rollback()
+                    cur.execute(
+                        "DELETE FROM card_dedup WHERE tenant_id = %s AND card_id = %s",
+                        (tenant_id, card_id)
+                    )
+                conn.commit()
+
+
 # Global instances
 db_manager = DatabaseManager()
 chat_repository = ChatRepository(db_manager)
 feedback_repository = FeedbackRepository(db_manager)
-cache_repository = CacheRepository(db_manager)
\ No newline at end of file
+cache_repository = CacheRepository(db_manager)
+card_dedup_repository = CardDedupRepository(db_manager)
\ No newline at end of file
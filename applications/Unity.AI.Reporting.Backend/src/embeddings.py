@@ -2,6 +2,8 @@
 Embeddings module for managing vector storage and retrieval.
 Handles schema embedding and similarity search for NL to SQL.
 """
+import json
+import hashlib
 import logging
 import time
 from typing import List, Optional
@@ -149,7 +151,7 @@ class SchemaExtractor:
         Returns:
             List of formatted schema descriptions
         """
-        metadata = self.metabase.get_database_metadata(db_id, tenant_id=tenant_id)
+        tables = self.metabase.get_table_index(db_id, tenant_id=tenant_id)
         docs = []
         schema_name = "Reporting" if schema_type == "custom" else "public"
 
@@ -158,7 +160,7 @@ class SchemaExtractor:
         if schema_type == "custom":
             custom_labels = self.get_custom_field_labels(db_id, tenant_id=tenant_id)
 
-        for table in metadata["tables"]:
+        for table in tables:
             # Filter tables based on schema type and exclusion rules
             if self._should_skip_table(table, schema_type):
                 continue
@@ -241,7 +243,7 @@ class EmbeddingManager:
         return None
 
     def embed_schemas(self, db_id: int, schema_types: Optional[List[str]] = None,
-                      tenant_id: Optional[str] = None):
+                      tenant_id: Optional[str] = None, skip_unchanged: bool = False) -> bool:
         """
         Embed database schemas for a specific database.
 
@@ -249,22 +251,35 @@ class EmbeddingManager:
             db_id: Database ID to embed schemas for
             schema_types: List of schema types to embed (e.g., ['public', 'custom'])
             tenant_id: Optional tenant ID for tenant-specific Metabase API key
+            skip_unchanged: Return before building any documents when the
+                database metadata and schema types match the last embedded
+                ones and embeddings for db_id still exist. Changes to table
+                data alone (example values, emptied worksheets) are only
+                picked up by a run without it, e.g. `python app.py embed <db_id>`
+
+        Returns:
+            True if schemas were embedded, False if the run was skipped
         """
         # Default schema types if not specified
         if schema_types is None:
             schema_types = ['public']
-        
-        # Purge existing embeddings for this db_id
-        db_manager.purge_embeddings(db_id, config.app.collection_name)
 
-        logger.info(f"Embedding schemas for db_id: {db_id}, types: {schema_types}")
+        # Start from fresh metadata so new tables and fields are picked up;
+        # its content hash is the change marker, checked before the schema
+        # extraction and custom-field probes run
+        metadata_cache = self.schema_extractor.metabase.metadata_cache
+        content_hash = metadata_cache.get(db_id, tenant_id, refresh=True)["content_hash"]
+        marker = hashlib.sha256(json.dumps([content_hash, schema_types]).encode()).hexdigest()
+        if (skip_unchanged
+                and metadata_cache.embedded_marker(db_id, tenant_id) == marker
+                and db_manager.count_embeddings(db_id, config.app.collection_name) > 0):
+            logger.info(f"Schema metadata unchanged for db_id: {db_id}, skipping embedding")
+            return False
 
-        # Extract and embed schemas for each type
+        documents = []
         for schema_type in schema_types:
             schemas = self.schema_extractor.extract_schemas(db_id, schema_type, tenant_id=tenant_id)
-
-            # Create documents with metadata
-            documents = [
+            documents.extend(
                 Document(
                     page_content=schema.strip(),
                     metadata={
@@ -273,11 +288,20 @@ class EmbeddingManager:
                     }
                 )
                 for schema in schemas
-            ]
+            )
+
+        # Purge existing embeddings for this db_id
+        db_manager.purge_embeddings(db_id, config.app.collection_name)
+
+        logger.info(f"Embedding schemas for db_id: {db_id}, types: {schema_types}")
+        for schema_type in schema_types:
+            typed = [doc for doc in documents if doc.metadata["schema_type"] == schema_type]
+            if typed:
+                self.vector_store.add_documents(typed)
+                logger.info(f"Added {len(typed)} {schema_type} schema embeddings")
 
-            if documents:
-                self.vector_store.add_documents(documents)
-                logger.info(f"Added {len(documents)} {schema_type} schema embeddings")
+        metadata_cache.mark_embedded(db_id, marker, tenant_id=tenant_id)
+        return True
     
     def _get_all_custom_schemas(self, query: str, db_id: int) -> List[Document]:
         """Retrieve ALL embedded custom/worksheet schemas for a db_id.
@@ -0,0 +1,126 @@
+"""
+Polling helper for long-running asynchronous jobs.
+Used for Metabase queries that answer 202 and finish under /api/async/{id}.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from config import config
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class JobPoller:
+    """
+    Polls a job until it completes, backing off exponentially with jitter.
+
+    The fetch callable returns the finished result, or None while the job is
+    still running. Waits return None at the deadline. wait_async sleeps on
+    the event loop, so a waiting job does not hold a worker thread, and stops
+    cleanly if its task is cancelled.
+    """
+
+    def __init__(self, initial_interval: float = 0.25, max_interval: float = 2.0,
+                 multiplier: float = 2.0, jitter: float = 0.25, default_timeout: float = 30.0):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.default_timeout = default_timeout
+        self._stats = {
+            "jobs": 0,
+            "completed": 0,
+            "timed_out": 0,
+            "cancelled": 0,
+            "polls": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+        self._lock = threading.Lock()
+
+    def _next_delay(self, interval: float, remaining: float) -> float:
+        """Apply +/- jitter to the interval and clamp it to the time left."""
+        spread = interval * self.jitter
+        return max(0.0, min(remaining, interval + random.uniform(-spread, spread)))
+
+    def _record(self, outcome: str, polls: int, started: float):
+        """Update counters once a wait finishes"""
+        waited = time.monotonic() - started
+        with self._lock:
+            self._stats["jobs"] += 1
+            self._stats[outcome] += 1
+            self._stats["polls"] += polls
+            self._stats["wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        logger.debug(f"Job poll {outcome} after {polls} polls in {waited:.2f}s")
+
+    def wait(self, fetch: Callable[[], Optional[T]], timeout: Optional[float] = None) -> Optional[T]:
+        """Poll fetch from a worker thread until it returns a result."""
+        started = time.monotonic()
+        deadline = started + (timeout if timeout is not None else self.default_timeout)
+        interval = self.initial_interval
+        polls = 0
+
+        while True:
+            polls += 1
+            result = fetch()
+            if result is not None:
+                self._record("completed", polls, started)
+                return result
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._record("timed_out", polls, started)
+                return None
+
+            time.sleep(self._next_delay(interval, remaining))
+            interval = min(interval * self.multiplier, self.max_interval)
+
+    async def wait_async(self, fetch: Callable[[], Awaitable[Optional[T]]],
+                         timeout: Optional[float] = None) -> Optional[T]:
+        """Poll an async fetch on the event loop until it returns a result."""
+        started = time.monotonic()
+        deadline = started + (timeout if timeout is not None else self.default_timeout)
+        interval = self.initial_interval
+        polls = 0
+
+        try:
+            while True:
+                polls += 1
+                result = await fetch()
+                if result is not None:
+                    self._record("completed", polls, started)
+                    return result
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._record("timed_out", polls, started)
+                    return None
+
+                await asyncio.sleep(self._next_delay(interval, remaining))
+                interval = min(interval * self.multiplier, self.max_interval)
+        except asyncio.CancelledError:
+            self._record("cancelled", polls, started)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Get poll counters, including the average wait per job"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["jobs"] if stats["jobs"] else 0.0
+        return stats
+
+
+# Shared poller for Metabase async query jobs
+metabase_job_poller = JobPoller(
+    initial_interval=config.metabase.poll_initial_interval,
+    max_interval=config.metabase.poll_max_interval,
+    default_timeout=config.metabase.async_job_timeout,
+)
@@ -3,15 +3,356 @@ Metabase API integration module.
 Handles all interactions with Metabase including queries, cards, and embeddings.
 """
 import os
+import json
+import hashlib
+import asyncio
+import aiohttp
 import requests
+import threading
 import time
 import logging
-from typing import Dict, Any, List, Optional, Tuple
-from config import config
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple, TypeVar
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import config, DEFAULT_TENANT, MetabaseConfig
+from job_poller import metabase_job_poller
+from circuit_breaker import metabase_breaker, endpoint_class
+from metadata_cache import MetadataCache
+from reporting_db import reporting_executor, iter_sql_tokens
+from database import card_dedup_repository
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# "full" executes the query; the others only plan it, which catches syntax,
+# column and type errors without producing (or scanning for) the result set.
+VALIDATION_MODES = ("full", "explain", "limit0")
+
+
+# Extra column added by build_preview_sql to carry the full result size
+PREVIEW_TOTAL_COLUMN = "_preview_total_rows"
+
+
+def strip_sql(sql: str) -> str:
+    """
+    Remove surrounding whitespace and trailing semicolons and comments so SQL
+    can be nested (a trailing `-- note` would otherwise comment out the
+    wrapper's closing parenthesis or hide the semicolon).
+    """
+    end = 0
+    for kind, _, token_end in iter_sql_tokens(sql):
+        if kind == "code":
+            end = token_end
+    return sql[:end].strip()
+
+
+def build_validation_sql(sql: str, mode: str) -> str:
+    """Rewrite SQL for the given validation mode."""
+    stripped = strip_sql(sql)
+    if mode == "explain":
+        return f"EXPLAIN {stripped}"
+    if mode == "limit0":
+        return f"SELECT * FROM (\n{stripped}\n) AS validation_q LIMIT 0"
+    return sql
+
+
+def build_preview_sql(sql: str, limit: int) -> str:
+    """
+    Wrap SQL so the database returns at most `limit` rows plus the full row
+    count. The count is a window over the whole result, computed before LIMIT,
+    so truncation can be reported without transferring the extra rows.
+    """
+    return (
+        f"SELECT preview_q.*, COUNT(*) OVER () AS {PREVIEW_TOTAL_COLUMN} "
+        f"FROM (\n{strip_sql(sql)}\n) AS preview_q LIMIT {int(limit)}"
+    )
+
+
+def parse_preview(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Split the build_preview_sql count column off a result into `row_count`."""
+    cols = data.get("cols") or []
+    rows = data.get("rows") or []
+    total_rows = rows[0][-1] if rows else 0
+    return {
+        "cols": cols[:-1],
+        "rows": [row[:-1] for row in rows],
+        "row_count": int(total_rows),
+    }
+
+
+def build_fingerprint_sql(sql: str) -> str:
+    """
+    Wrap SQL in an aggregate returning (row_count, result_hash, columns).
+
+    result_hash sums a 64-bit slice of each row's md5, so it covers the whole
+    result but not its order, and duplicate rows still count. columns is a
+    JSON array of the result's column names (null for an empty result).
+    """
+    return (
+        f"WITH fp_q AS (\n{strip_sql(sql)}\n)\n"
+        "SELECT\n"
+        "    (SELECT COUNT(*) FROM fp_q) AS row_count,\n"
+        "    (SELECT COALESCE(SUM(('x' || LEFT(MD5(t::text), 16))::bit(64)::bigint::numeric), 0)"
+        " FROM fp_q AS t)::text AS result_hash,\n"
+        "    (SELECT json_agg(k) FROM json_object_keys("
+        "(SELECT row_to_json(t) FROM fp_q AS t LIMIT 1)) AS k) AS columns"
+    )
+
+
+def build_card_visualization(display_mode: str, x_fields: List[str],
+                             y_fields: List[str]) -> Dict[str, Any]:
+    """Build Metabase visualization_settings for a chart type and its axes."""
+    visualization_settings: Dict[str, Any] = {
+        "graph.dimensions": x_fields,
+        "graph.metrics": y_fields,
+    }
+
+    # Add specific settings for different chart types
+    if display_mode == "pie":
+        visualization_settings.update({
+            "pie.dimension": x_fields,
+            "pie.metric": y_fields[0] if y_fields else ""
+        })
+    elif display_mode == "map":
+        visualization_settings["map.region"] = config.metabase.map_region_uuid
+    return visualization_settings
+
+
+def visualization_hash(display: str, visualization_settings: Optional[Dict[str, Any]]) -> str:
+    """
+    Hash a card's display type and visualization settings for the dedup
+    registry. The card name is left out so answers with different titles can
+    share a card; each answer keeps its own title in the chat, not on the card.
+    """
+    viz = json.dumps({"display": display, "settings": visualization_settings or {}}, sort_keys=True)
+    return hashlib.sha256(viz.encode()).hexdigest()
+
+
+def build_explain_json_sql(sql: str) -> str:
+    """Rewrite SQL to return the planner's estimates as JSON without running it."""
+    return f"EXPLAIN (FORMAT JSON) {strip_sql(sql)}"
+
+
+def parse_plan_estimate(data: Dict[str, Any]) -> Optional[Dict[str, float]]:
+    """
+    Read the top plan node's estimates from an EXPLAIN (FORMAT JSON) result.
+
+    Returns:
+        `{"cost": total_cost, "rows": plan_rows}`, or None if the result is
+        not a Postgres JSON plan
+    """
+    try:
+        plan = data["rows"][0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        if isinstance(plan, list):
+            plan = plan[0]
+        top = plan["Plan"]
+        return {"cost": float(top["Total Cost"]), "rows": float(top["Plan Rows"])}
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+def statement_timeout_error(seconds: float) -> str:
+    """Error message for a validation query abandoned at the statement timeout."""
+    return (
+        f"Query exceeded the {seconds:g}s statement timeout; "
+        "simplify it or add join conditions and filters"
+    )
+
+
+def _run_direct(sql: str, tenant_id: Optional[str],
+                statement_timeout: Optional[float]) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    """Run SQL on the tenant's reporting database, reporting a statement timeout as an error."""
+    try:
+        return reporting_executor.run(sql, tenant_id, statement_timeout=statement_timeout)
+    except TimeoutError:
+        return statement_timeout_error(statement_timeout or config.metabase.read_timeout), None
+
+
+def _resolve_validation_mode(mode: Optional[str], tenant_id: Optional[str]) -> str:
+    """Use the explicit mode or the tenant's configured mode, falling back to full."""
+    resolved = (mode or config.get_tenant_validation_mode(tenant_id)).lower()
+    if resolved not in VALIDATION_MODES:
+        logger.warning(f"Unknown validation mode '{resolved}', using full")
+        return "full"
+    return resolved
+
+
+class QueryResultCache:
+    """
+    Size-bounded LRU cache of query results with a TTL.
+
+    Keyed by (tenant, db_id, sha256(sql)) so identical SQL from schema probes
+    and candidate fingerprinting is served from memory instead of Metabase.
+    Results with more than max_rows rows are not stored.
+    """
+
+    def __init__(self, max_size: int, ttl: float, max_rows: int, enabled: bool = True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, int, str], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(sql: str, db_id: int, tenant_id: Optional[str] = None) -> Tuple[str, int, str]:
+        """Build the cache key for a query."""
+        return tenant_id or DEFAULT_TENANT, db_id, hashlib.sha256(sql.encode()).hexdigest()
+
+    def get(self, sql: str, db_id: int, tenant_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the cached result, or None on a miss or expired entry."""
+        if not self.enabled:
+            return None
+        key = self.make_key(sql, db_id, tenant_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def contains(self, sql: str, db_id: int, tenant_id: Optional[str] = None) -> bool:
+        """Check for a live entry without touching the hit/miss counters or LRU order."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            entry = self._entries.get(self.make_key(sql, db_id, tenant_id))
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def put(self, sql: str, db_id: int, data: Dict[str, Any], tenant_id: Optional[str] = None):
+        """Store a result, evicting the least recently used entries past max_size."""
+        if not self.enabled or not isinstance(data, dict):
+            return
+        # A row-capped result would be served as if it were complete
+        if data.get("rows_truncated") or len(data.get("rows") or []) > self.max_rows:
+            return
+        key = self.make_key(sql, db_id, tenant_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss counters and current size"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+query_result_cache = QueryResultCache(
+    max_size=config.metabase.result_cache_size,
+    ttl=config.metabase.result_cache_ttl,
+    max_rows=config.metabase.result_cache_max_rows,
+    enabled=config.metabase.result_cache_enabled,
+)
+
+
+class CardRegistry:
+    """
+    Per-tenant, per-collection set of live card IDs with a TTL.
+
+    Replaces downloading the whole /api/card list to check a handful of cards.
+    Each (tenant, collection) set is filled from a collection-scoped listing
+    and kept current as cards are created and deleted through the client.
+    IDs missing from the set are confirmed with a single-card GET before
+    being reported as gone.
+    """
+
+    def __init__(self, client: "MetabaseClient", ttl: float):
+        self.client = client
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, int], Tuple[float, Set[int]]] = {}
+        self._lock = threading.Lock()
+
+    def _card_ids(self, collection_id: int, tenant_id: Optional[str]) -> Optional[Set[int]]:
+        """Get the collection's card ID set, re-listing it once the TTL has passed."""
+        key = (tenant_id or DEFAULT_TENANT, collection_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+
+        card_ids = self.client.get_collection_card_ids(collection_id, tenant_id)
+        if card_ids is None:
+            return None
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, card_ids)
+        return card_ids
+
+    def refresh(self, collection_id: int, tenant_id: Optional[str] = None):
+        """
+        Re-list the collection if its set has expired.
+
+        Call once before checking a batch of cards concurrently, so the
+        checks share one listing instead of each re-listing an expired set.
+        """
+        self._card_ids(collection_id, tenant_id)
+
+    def exists(self, card_id: int, collection_id: int, tenant_id: Optional[str] = None) -> bool:
+        """Check whether a card is still live in Metabase."""
+        card_ids = self._card_ids(collection_id, tenant_id)
+        if card_ids is not None and card_id in card_ids:
+            return True
+
+        exists = self.client.get_card_exists(card_id, tenant_id)
+        if exists is None:
+            # Metabase could not answer; assume the card is there rather than duplicate it
+            return True
+        if exists:
+            self.add(card_id, collection_id, tenant_id)
+        return exists
+
+    def add(self, card_id: int, collection_id: int, tenant_id: Optional[str] = None):
+        """Record a newly created card"""
+        key = (tenant_id or DEFAULT_TENANT, collection_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1].add(card_id)
+
+    def discard(self, card_id: int, tenant_id: Optional[str] = None):
+        """Forget a deleted card in every collection of the tenant"""
+        tenant = tenant_id or DEFAULT_TENANT
+        with self._lock:
+            for (entry_tenant, _), (_, card_ids) in self._entries.items():
+                if entry_tenant == tenant:
+                    card_ids.discard(card_id)
+
+    def invalidate(self, tenant_id: Optional[str] = None):
+        """Drop cached sets for a tenant, or for all tenants when tenant_id is None"""
+        with self._lock:
+            if tenant_id is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == tenant_id]:
+                    del self._entries[key]
+
+
+def metabase_headers(tenant_id: Optional[str] = None) -> Dict[str, str]:
+    """Get API headers, using the tenant-specific key when tenant_id is provided."""
+    if tenant_id:
+        return config.get_tenant_metabase_headers(tenant_id)
+    return config.metabase_headers
+
 
 class MetabaseClient:
     """Client for interacting with Metabase API"""
@@ -19,18 +360,117 @@ class MetabaseClient:
     def __init__(self):
         self.config = config.metabase
         self.headers = config.metabase_headers
+        self.timeout = (self.config.connect_timeout, self.config.read_timeout)
+        self.result_cache = query_result_cache
+        self.card_registry = CardRegistry(self, self.config.card_registry_ttl)
+        self.poller = metabase_job_poller
+        self.metadata_cache = MetadataCache(
+            self.get_database_metadata,
+            ttl=self.config.metadata_cache_ttl,
+            cache_dir=self.config.metadata_cache_dir,
+        )
+        self._sessions: Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+
+    def _build_session(self, headers: Dict[str, str]) -> requests.Session:
+        """Create a keep-alive session with a bounded connection pool and retries.
+
+        Retries cover connection failures and gateway errors. POST is left out of
+        the status-based retry methods so a slow card creation is never duplicated.
+        """
+        retry = Retry(
+            total=self.config.max_retries,
+            connect=self.config.max_retries,
+            read=self.config.max_retries,
+            backoff_factor=self.config.retry_backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "PUT", "DELETE", "HEAD"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.config.pool_size,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(headers)
+        return session
 
-    def _get_headers(self, tenant_id: Optional[str] = None) -> Dict[str, str]:
+    def get_session(self, tenant_id: Optional[str] = None) -> requests.Session:
         """
-        Get API headers for Metabase requests.
-        If tenant_id is provided, uses tenant-specific API key from config file.
-        Otherwise uses default headers.
+        Get the pooled session for a tenant, creating it on first use.
+
+        Sessions carry the tenant's API key header, so callers only add
+        the request body and a timeout.
+        """
+        key = tenant_id or DEFAULT_TENANT
+        session = self._sessions.get(key)
+        if session is not None:
+            return session
+
+        headers = metabase_headers(tenant_id)
+        with self._sessions_lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._build_session(headers)
+                self._sessions[key] = session
+        return session
+
+    def _request(self, method: str, path: str, tenant_id: Optional[str] = None,
+                 deadline: Optional[float] = None, **kwargs) -> requests.Response:
+        """
+        Send a request to the Metabase API through the tenant's pooled session.
+
+        With deadline (a time.monotonic() value) the body is streamed and the
+        request is abandoned once the deadline passes, however often data
+        arrives (see _read_until). Abandoning a query at its statement
+        timeout says nothing about Metabase's health, so it is not counted
+        as a circuit breaker failure.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        with metabase_breaker.guard(tenant_id, endpoint_class(path)) as call:
+            try:
+                response = self.get_session(tenant_id).request(
+                    method, f"{self.config.url}{path}", stream=deadline is not None, **kwargs
+                )
+                call.failed = response.status_code >= 500
+                if deadline is not None:
+                    self._read_until(response, deadline)
+                return response
+            except requests.exceptions.Timeout as e:
+                if deadline is not None and not isinstance(e, requests.exceptions.ConnectTimeout):
+                    call.cancelled = True
+                raise
+
+    @staticmethod
+    def _read_until(response: requests.Response, deadline: float):
         """
-        if tenant_id:
-            return config.get_tenant_metabase_headers(tenant_id)
-        return self.headers
+        Read a streamed response body, closing it once the deadline passes.
 
-    def execute_sql(self, sql: str, db_id: int, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        Metabase keeps a running /api/dataset request alive by streaming
+        newlines, so the per-read timeout alone never ends a slow query.
+        Closing the connection makes Metabase cancel the query.
+        """
+        chunks = []
+        for chunk in response.iter_content(chunk_size=65536):
+            chunks.append(chunk)
+            if time.monotonic() > deadline:
+                response.close()
+                raise requests.exceptions.Timeout("Metabase query exceeded its deadline")
+        # Hand the body back to the usual .json() / .text accessors
+        response._content = b"".join(chunks)
+
+    def close(self):
+        """Close all pooled sessions"""
+        with self._sessions_lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def execute_sql(self, sql: str, db_id: int, tenant_id: Optional[str] = None,
+                    use_cache: bool = True, statement_timeout: Optional[float] = None) -> Dict[str, Any]:
         """
         Execute SQL query via Metabase API.
 
@@ -38,27 +478,106 @@ class MetabaseClient:
             sql: SQL query to execute
             db_id: Database ID in Metabase
             tenant_id: Optional tenant ID to use tenant-specific API key
+            use_cache: Set False to bypass the result cache and always hit Metabase
+            statement_timeout: Optional seconds to wait for the result instead
+                of the default read timeout
 
         Returns:
             Query results from Metabase
         """
+        if use_cache:
+            cached = self.result_cache.get(sql, db_id, tenant_id)
+            if cached is not None:
+                return cached
+
+        if reporting_executor.enabled(tenant_id):
+            error, data = _run_direct(sql, tenant_id, statement_timeout)
+            if error:
+                raise requests.exceptions.HTTPError(f"Reporting database query error: {error}")
+            self.result_cache.put(sql, db_id, data, tenant_id)
+            return data
+
         payload = {
             "database": db_id,
             "type": "native",
             "native": {"query": sql}
         }
 
-        headers = self._get_headers(tenant_id)
-
-        r = requests.post(
-            f"{self.config.url}/api/dataset",
-            headers=headers,
-            json=payload
-        )
+        deadline = self._deadline(statement_timeout)
+        r = self._request("POST", "/api/dataset", tenant_id, json=payload,
+                          **self._statement_timeout(statement_timeout, deadline))
         r.raise_for_status()
-        return r.json()["data"]
+        body = r.json()
+        if r.status_code == 202 and body.get("status") == "running":
+            body = self._wait_for_job(
+                body, tenant_id, self._remaining(self.config.async_job_timeout, deadline)
+            )
+        if "error" in body:
+            raise requests.exceptions.HTTPError(f"Metabase query error: {body['error']}", response=r)
+        data = body["data"]
+        self.result_cache.put(sql, db_id, data, tenant_id)
+        return data
+
+    def fetch_preview(self, sql: str, db_id: int, limit: int,
+                      tenant_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Fetch at most `limit` rows of a query for the card preview.
+
+        The row cap and the total count are applied in the database (see
+        build_preview_sql), so large results never reach this process.
+
+        Returns:
+            `{"cols": [...], "rows": [...], "row_count": n}`, or None on any
+            failure so callers can fall back gracefully.
+        """
+        try:
+            data = self.execute_sql(build_preview_sql(sql, limit), db_id, tenant_id=tenant_id)
+        except Exception:
+            logger.exception("Error fetching preview rows")
+            return None
+        return parse_preview(data)
     
-    def validate_sql(self, sql: str, db_id: int, tenant_id: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+    @staticmethod
+    def _deadline(statement_timeout: Optional[float]) -> Optional[float]:
+        """Get the time.monotonic() deadline for a statement timeout, if any."""
+        return None if statement_timeout is None else time.monotonic() + statement_timeout
+
+    @staticmethod
+    def _remaining(job_timeout: float, deadline: Optional[float]) -> float:
+        """Cap a job polling timeout at the time left before the deadline."""
+        if deadline is None:
+            return job_timeout
+        return max(0.0, min(job_timeout, deadline - time.monotonic()))
+
+    def _statement_timeout(self, statement_timeout: Optional[float],
+                           deadline: Optional[float]) -> Dict[str, Any]:
+        """
+        Build _request kwargs that end the request at the deadline.
+
+        The read timeout still applies to each read, so a connection that
+        goes silent is dropped without waiting for the next chunk.
+        """
+        if statement_timeout is None:
+            return {}
+        return {
+            "timeout": (self.config.connect_timeout, statement_timeout),
+            "deadline": deadline,
+        }
+
+    def _wait_for_job(self, body: Dict[str, Any], tenant_id: Optional[str],
+                      timeout: float) -> Dict[str, Any]:
+        """Poll /api/async/{id} for a 202 job; returns the original body if it never finishes."""
+        job_id = body.get("id")
+
+        def fetch() -> Optional[Dict[str, Any]]:
+            jr = self._request("GET", f"/api/async/{job_id}", tenant_id)
+            return jr.json() if jr.status_code == 200 else None
+
+        return self.poller.wait(fetch, timeout=timeout) or body
+
+    def validate_sql(self, sql: str, db_id: int, tenant_id: Optional[str] = None,
+                     mode: Optional[str] = None,
+                     statement_timeout: Optional[float] = None) -> Tuple[bool, Optional[str]]:
         """
         Validate if SQL query can be executed.
 
@@ -66,23 +585,33 @@ class MetabaseClient:
             sql: SQL query to validate
             db_id: Database ID
             tenant_id: Optional tenant ID to use tenant-specific API key
+            mode: Validation mode ("full", "explain" or "limit0"); defaults
+                to the tenant's configured validation_mode
+            statement_timeout: Optional seconds after which the query is
+                abandoned and reported as invalid
 
         Returns:
             Tuple of (is_valid, error_message)
         """
+        mode = _resolve_validation_mode(mode, tenant_id)
+        if reporting_executor.enabled(tenant_id):
+            error, _ = _run_direct(build_validation_sql(sql, mode), tenant_id, statement_timeout)
+            return error is None, error
+
         payload = {
             "database": db_id,
             "type": "native",
-            "native": {"query": sql}
+            "native": {"query": build_validation_sql(sql, mode)}
         }
 
-        headers = self._get_headers(tenant_id)
-
-        r = requests.post(
-            f"{self.config.url}/api/dataset",
-            headers=headers,
-            json=payload
-        )
+        deadline = self._deadline(statement_timeout)
+        try:
+            r = self._request("POST", "/api/dataset", tenant_id, json=payload,
+                              **self._statement_timeout(statement_timeout, deadline))
+        except requests.exceptions.Timeout:
+            if statement_timeout is None:
+                raise
+            return False, statement_timeout_error(statement_timeout)
 
         if r.status_code not in (200, 202):
             return False, f"HTTP {r.status_code}: {r.text}"
@@ -91,18 +620,9 @@ class MetabaseClient:
 
         # Handle async queries
         if r.status_code == 202 and body.get("status") == "running":
-            job_id = body["id"]
-            deadline = time.time() + 10
-
-            while time.time() < deadline:
-                jr = requests.get(
-                    f"{self.config.url}/api/async/{job_id}",
-                    headers=headers
-                )
-                if jr.status_code == 200:
-                    body = jr.json()
-                    break
-                time.sleep(0.5)
+            body = self._wait_for_job(
+                body, tenant_id, self._remaining(self.config.validation_job_timeout, deadline)
+            )
 
         if "error" in body:
             return False, body["error"]
@@ -110,18 +630,24 @@ class MetabaseClient:
         return True, None
     
     def get_database_metadata(self, db_id: int, tenant_id: Optional[str] = None) -> Dict[str, Any]:
-        """Get metadata for a database including tables and fields"""
-        headers = self._get_headers(tenant_id)
-        r = requests.get(
-            f"{self.config.url}/api/database/{db_id}/metadata",
-            headers=headers
-        )
+        """Get the full, uncached metadata for a database including tables and fields"""
+        r = self._request("GET", f"/api/database/{db_id}/metadata", tenant_id)
         r.raise_for_status()
         return r.json()
 
+    def get_table_index(self, db_id: int, tenant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get the cached compact table index for a database.
+
+        Returns:
+            List of {"schema", "name", "fields": [{"name", "base_type"}]} dicts
+        """
+        return self.metadata_cache.get_tables(db_id, tenant_id)
+
     def create_card(self, sql: str, db_id: int, collection_id: int,
                     name: str, tenant_id: Optional[str] = None,
-                    visualization_settings: Optional[Dict[str, Any]] = None
+                    visualization_settings: Optional[Dict[str, Any]] = None,
+                    run_query: bool = True, display: str = "table"
                     ) -> Tuple[int, Optional[Dict[str, Any]]]:
         """
         Create a new Metabase card (saved question) and execute its query.
@@ -132,13 +658,16 @@ class MetabaseClient:
             collection_id: Collection ID to save the card in
             name: Name of the card
             tenant_id: Optional tenant ID to use tenant-specific API key
+            run_query: Set False when the caller already has the result rows;
+                the card is then created without executing its query
+            display: Metabase display type for the card
 
         Returns:
             Tuple of (card_id, card_data) where card_data is the inner
             `{"cols": [...], "rows": [...]}` dict from Metabase (same shape as
-            execute_sql), or None if the post-creation query failed.
+            execute_sql), or None if the post-creation query failed or was
+            skipped.
         """
-        headers = self._get_headers(tenant_id)
         url = f"{self.config.url}/api/card"
         payload = {
             "name": name,
@@ -150,7 +679,7 @@ class MetabaseClient:
                 "native": {"query": sql},
                 "type": "native"
             },
-            "display": "table"
+            "display": display
         }
 
         logger.debug(f"Metabase create_card - URL: {url}")
@@ -161,16 +690,11 @@ class MetabaseClient:
 
         try:
             logger.info("Making POST request to Metabase API...")
-            r = requests.post(
-                url,
-                headers=headers,
-                json=payload,
-                timeout=30  # Add timeout
-            )
+            r = self._request("POST", "/api/card", tenant_id, json=payload)
             logger.info(f"POST request completed - Status: {r.status_code}")
 
         except requests.exceptions.Timeout:
-            logger.error("Metabase request timed out after 30 seconds")
+            logger.error(f"Metabase request timed out after {self.config.read_timeout} seconds")
             raise requests.exceptions.Timeout("Metabase API request timed out")
         except requests.exceptions.ConnectionError as e:
             logger.error(f"Connection error to Metabase: {e}", exc_info=True)
@@ -192,69 +716,132 @@ class MetabaseClient:
             logger.error(f"Response text: {r.text}")
             raise ValueError(f"Error parsing Metabase response: {e}")
 
-        card_data = self._run_card_query(card_id, headers)
+        self.card_registry.add(card_id, collection_id, tenant_id)
+        if not run_query:
+            return card_id, None
+        card_data = self._run_card_query(card_id, tenant_id)
         return card_id, card_data
 
-    def _run_card_query(self, card_id: int, headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    def get_or_create_card(self, sql: str, db_id: int, collection_id: int,
+                           name: str, tenant_id: Optional[str] = None,
+                           visualization_settings: Optional[Dict[str, Any]] = None,
+                           display: str = "table") -> Tuple[int, bool]:
+        """
+        Reuse a live card with the same SQL and visualization, or create one.
+
+        Cards are looked up in the card_dedup registry by (tenant, collection,
+        sha256(sql), visualization). A reused card keeps the name it was
+        created with; `name` only titles a new card. A registered card is
+        checked against the collection's live cards before it is reused;
+        stale entries are dropped.
+        Registry errors fall back to creating the card. The card's query is
+        never run here.
+
+        Returns:
+            Tuple of (card_id, reused)
+        """
+        tenant = tenant_id or DEFAULT_TENANT
+        sql_hash = hashlib.sha256(strip_sql(sql).encode()).hexdigest()
+        viz_hash = visualization_hash(display, visualization_settings)
+
+        try:
+            card_id = card_dedup_repository.acquire(tenant, collection_id, sql_hash, viz_hash)
+        except Exception as e:
+            logger.warning(f"Card dedup lookup failed, creating a new card: {e}")
+            card_id = None
+
+        if card_id is not None:
+            if self.card_registry.exists(card_id, collection_id, tenant_id):
+                logger.info(f"Reusing card {card_id} for tenant '{tenant}'")
+                return card_id, True
+            logger.info(f"Registered card {card_id} no longer exists; creating a new one")
+            try:
+                card_dedup_repository.forget(tenant, card_id)
+            except Exception as e:
+                logger.warning(f"Could not drop stale card {card_id} from dedup registry: {e}")
+
+        card_id, _ = self.create_card(
+            sql, db_id, collection_id, name, tenant_id=tenant_id,
+            visualization_settings=visualization_settings, run_query=False, display=display
+        )
+        try:
+            card_dedup_repository.register(tenant, collection_id, sql_hash, viz_hash, card_id)
+        except Exception as e:
+            logger.warning(f"Could not register card {card_id} for dedup: {e}")
+        return card_id, False
+
+    def _run_card_query(self, card_id: int, tenant_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Execute a saved card and return its inner data dict.
 
         Returns None on any failure so callers can fall back gracefully.
         """
-        query_url = f"{self.config.url}/api/card/{card_id}/query"
         try:
-            r = requests.post(query_url, headers=headers, json={"ignore_cache": True}, timeout=30)
+            r = self._request("POST", f"/api/card/{card_id}/query", tenant_id, json={"ignore_cache": True})
             body = r.json()
 
             if r.status_code == 202 and body.get("status") == "running":
-                job_id = body.get("id")
-                deadline = time.time() + 30
-                while time.time() < deadline:
-                    jr = requests.get(
-                        f"{self.config.url}/api/async/{job_id}",
-                        headers=headers,
-                        timeout=10,
-                    )
-                    if jr.status_code == 200:
-                        body = jr.json()
-                        break
-                    time.sleep(1)
+                body = self._wait_for_job(body, tenant_id, self.config.async_job_timeout)
 
             return body.get("data") if isinstance(body, dict) else None
         except Exception:
             logger.exception("Error fetching card data for card %s", card_id)
             return None
     
+    def get_card(self, card_id: int, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """Get a card's definition (name, collection, dataset_query, display)"""
+        r = self._request("GET", f"/api/card/{card_id}", tenant_id)
+        if r.status_code != 200:
+            raise requests.exceptions.HTTPError(f"HTTP {r.status_code}: {r.text}", response=r)
+        return r.json()
+
     def update_card_visualization(self, card_id: int, display_mode: str,
                                  x_fields: List[str], y_fields: List[str],
-                                 tenant_id: Optional[str] = None):
+                                 tenant_id: Optional[str] = None,
+                                 name: Optional[str] = None) -> int:
         """
         Update visualization settings for a card.
 
+        A card shared by other answers through the dedup registry is not
+        modified: this answer's reference moves to a card with the new
+        visualization (reused or created), so the other answers keep theirs.
+
         Args:
             card_id: Card ID to update
             display_mode: Visualization type (bar, line, pie, map, etc.)
             x_fields: Fields for x-axis
             y_fields: Fields for y-axis
             tenant_id: Optional tenant ID to use tenant-specific API key
+            name: The answer's title, used when a shared card has to be copied;
+                defaults to the shared card's name
+
+        Returns:
+            The card ID now holding the answer: card_id itself, or the copy's
+            ID when the card was shared
         """
-        headers = self._get_headers(tenant_id)
-        visualization_settings: Dict[str, Any] = {
-            "graph.dimensions": x_fields,
-            "graph.metrics": y_fields,
-        }
+        tenant = tenant_id or DEFAULT_TENANT
+        visualization_settings = build_card_visualization(display_mode, x_fields, y_fields)
+
+        try:
+            shared = card_dedup_repository.ref_count(tenant, card_id) > 1
+        except Exception as e:
+            logger.warning(f"Could not read dedup references for card {card_id}: {e}")
+            shared = False
 
-        # Add specific settings for different chart types
-        if display_mode == "pie":
-            visualization_settings.update({
-                "pie.dimension": x_fields,
-                "pie.metric": y_fields[0] if y_fields else ""
-            })
-        elif display_mode == "map":
-            visualization_settings["map.region"] = config.metabase.map_region_uuid
-
-        r = requests.put(
-            f"{self.config.url}/api/card/{card_id}",
-            headers=headers,
+        if shared:
+            card = self.get_card(card_id, tenant_id)
+            query = card["dataset_query"]
+            new_card_id, _ = self.get_or_create_card(
+                query["native"]["query"], query["database"], card["collection_id"],
+                name or card["name"], tenant_id=tenant_id,
+                visualization_settings=visualization_settings, display=display_mode
+            )
+            # Drops this answer's reference; the card stays for the others
+            self.delete_card(card_id, tenant_id=tenant_id)
+            logger.info(f"Card {card_id} is shared; restyled this answer as card {new_card_id}")
+            return new_card_id
+
+        r = self._request(
+            "PUT", f"/api/card/{card_id}", tenant_id,
             json={
                 "display": display_mode,
                 "visualization_settings": visualization_settings
@@ -264,23 +851,95 @@ class MetabaseClient:
         if r.status_code != 200:
             raise requests.exceptions.HTTPError(f"HTTP {r.status_code}: {r.text}", response=r)
 
+        # Keep the dedup registry keyed by the card's current visualization
+        try:
+            card_dedup_repository.update_visualization(
+                tenant, card_id, visualization_hash(display_mode, visualization_settings)
+            )
+        except Exception as e:
+            logger.warning(f"Could not update dedup registry for card {card_id}: {e}")
+        return card_id
+
     def delete_card(self, card_id: int, tenant_id: Optional[str] = None) -> bool:
-        """Delete a Metabase card"""
-        headers = self._get_headers(tenant_id)
-        r = requests.delete(
-            f"{self.config.url}/api/card/{card_id}",
-            headers=headers
-        )
-        return r.status_code in (200, 204)
+        """
+        Delete a Metabase card.
+
+        A card shared by other answers through the dedup registry only loses
+        one reference and stays in Metabase.
+        """
+        try:
+            remaining = card_dedup_repository.release(tenant_id or DEFAULT_TENANT, card_id)
+        except Exception as e:
+            logger.warning(f"Could not release card {card_id} in dedup registry: {e}")
+            remaining = 0
+        if remaining > 0:
+            logger.info(f"Card {card_id} is still used by {remaining} other answer(s); not deleting")
+            return True
+
+        r = self._request("DELETE", f"/api/card/{card_id}", tenant_id)
+        deleted = r.status_code in (200, 204)
+        if deleted:
+            self.card_registry.discard(card_id, tenant_id)
+        return deleted
+
+    def map_cards(self, fn: Callable[[Any], T], items: List[Any]) -> List[T]:
+        """
+        Apply fn to each item concurrently, at most bulk_max_concurrency at a
+        time, returning results in input order.
+        """
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        workers = min(len(items), self.config.bulk_max_concurrency)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="metabase-bulk") as pool:
+            return list(pool.map(fn, items))
+
+    def delete_cards(self, card_ids: List[int], tenant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Delete many cards concurrently.
+
+        Returns:
+            One `{"card_id", "success"}` result per card, in input order
+        """
+        def delete(card_id: int) -> Dict[str, Any]:
+            try:
+                return {"card_id": card_id, "success": self.delete_card(card_id, tenant_id=tenant_id)}
+            except Exception as e:
+                logger.error(f"Error deleting card {card_id}: {e}", exc_info=True)
+                return {"card_id": card_id, "success": False}
+
+        return self.map_cards(delete, card_ids)
+
+    def update_cards_visualization(self, cards: List[Dict[str, Any]],
+                                   tenant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Re-style many cards concurrently.
+
+        Args:
+            cards: Dicts with card_id, mode, x_field, y_field and optionally title
+            tenant_id: Optional tenant ID to use tenant-specific API key
+
+        Returns:
+            One `{"card_id", "new_card_id", "success"}` result per card, in
+            input order. new_card_id differs from card_id when a shared card
+            was copied (see update_card_visualization).
+        """
+        def restyle(card: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                new_card_id = self.update_card_visualization(
+                    card["card_id"], card["mode"], card["x_field"], card["y_field"],
+                    tenant_id=tenant_id, name=card.get("title")
+                )
+                return {"card_id": card["card_id"], "new_card_id": new_card_id, "success": True}
+            except Exception as e:
+                logger.error(f"Error updating visualization for card {card['card_id']}: {e}", exc_info=True)
+                return {"card_id": card["card_id"], "new_card_id": card["card_id"], "success": False}
+
+        return self.map_cards(restyle, cards)
 
     def get_all_cards(self, tenant_id: Optional[str] = None) -> List[int]:
         """Get all card IDs from Metabase"""
-        headers = self._get_headers(tenant_id)
         try:
-            r = requests.get(
-                f"{self.config.url}/api/card",
-                headers=headers
-            )
+            r = self._request("GET", "/api/card", tenant_id)
             if r.status_code != 200:
                 raise requests.exceptions.HTTPError(f"HTTP {r.status_code}: {r.text}", response=r)
 
@@ -291,10 +950,417 @@ class MetabaseClient:
             return []
     
     
-    def check_card_exists(self, card_id: int, tenant_id: Optional[str] = None) -> bool:
-        """Check if a card exists in Metabase"""
-        existing_cards = self.get_all_cards(tenant_id)
-        return card_id in existing_cards
+    def get_collection_card_ids(self, collection_id: int,
+                                tenant_id: Optional[str] = None) -> Optional[Set[int]]:
+        """Get the IDs of live cards in a collection, or None if the listing failed"""
+        try:
+            r = self._request(
+                "GET", f"/api/collection/{collection_id}/items", tenant_id,
+                params={"models": "card"}
+            )
+            if r.status_code != 200:
+                raise requests.exceptions.HTTPError(f"HTTP {r.status_code}: {r.text}", response=r)
+
+            body = r.json()
+            # Newer Metabase versions wrap items in {"data": [...], "total": n}
+            items = body.get("data", []) if isinstance(body, dict) else body
+            return {item["id"] for item in items if item.get("model", "card") == "card"}
+        except Exception as e:
+            logger.error(f"Error listing cards in collection {collection_id}: {e}", exc_info=True)
+            return None
+
+    def get_card_exists(self, card_id: int, tenant_id: Optional[str] = None) -> Optional[bool]:
+        """Check a single card; returns None when Metabase gives no definite answer"""
+        try:
+            r = self._request("GET", f"/api/card/{card_id}", tenant_id)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Error checking card {card_id}: {e}")
+            return None
+        if r.status_code == 404:
+            return False
+        if r.status_code != 200:
+            logger.warning(f"Unexpected status checking card {card_id}: HTTP {r.status_code}")
+            return None
+        return not r.json().get("archived", False)
+
+    def refresh_card_registry(self, tenant_id: Optional[str] = None,
+                              collection_id: Optional[int] = None):
+        """Refresh the tenant's card registry once ahead of a batch of check_card_exists calls"""
+        if collection_id is None:
+            collection_id = config.get_tenant_config(tenant_id or DEFAULT_TENANT)["collection_id"]
+        self.card_registry.refresh(collection_id, tenant_id)
+
+    def check_card_exists(self, card_id: int, tenant_id: Optional[str] = None,
+                          collection_id: Optional[int] = None) -> bool:
+        """Check if a card exists in Metabase using the tenant's card registry"""
+        if collection_id is None:
+            collection_id = config.get_tenant_config(tenant_id or DEFAULT_TENANT)["collection_id"]
+        return self.card_registry.exists(card_id, collection_id, tenant_id)
+
+
+class MetabaseHTTPSession:
+    """
+    One pooled aiohttp session to Metabase for this worker process.
+
+    Like AzureOpenAIClient, the session lives on a background event loop
+    thread, because each Flask request runs in its own short-lived loop
+    (asyncio.run) and an aiohttp session cannot outlive its loop. The loop
+    starts on first use and restarts in a forked child; requests from
+    other loops are handed to it with run_coroutine_threadsafe, and
+    cancelling the caller cancels the request.
+    """
+
+    def __init__(self, metabase_config: MetabaseConfig):
+        self.config = metabase_config
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Get the background event loop, starting it in this process if needed."""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="metabase-http", daemon=True)
+                thread.start()
+                self._loop, self._thread, self._pid, self._session = loop, thread, os.getpid(), None
+                logger.info(f"Started Metabase HTTP loop in process {self._pid}")
+            return self._loop
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the pooled session. Must run on the background loop."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.config.pool_size),
+                timeout=aiohttp.ClientTimeout(
+                    total=None,
+                    sock_connect=self.config.connect_timeout,
+                    sock_read=self.config.read_timeout,
+                ),
+            )
+        return self._session
+
+    async def _send(self, method: str, url: str, **kwargs) -> Tuple[int, str]:
+        """Send one request on the background loop."""
+        async with self._get_session().request(method, url, **kwargs) as response:
+            return response.status, await response.text()
+
+    async def request(self, method: str, url: str, **kwargs) -> Tuple[int, str]:
+        """
+        Send a request through the shared session from any event loop.
+
+        Returns:
+            Tuple of (status, raw_text)
+        """
+        loop = self._get_loop()
+        request = self._send(method, url, **kwargs)
+        if asyncio.get_running_loop() is loop:
+            return await request
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(request, loop))
+
+    def close(self):
+        """Close the session and stop the background loop"""
+        with self._lock:
+            loop, thread, session = self._loop, self._thread, self._session
+            self._loop = self._thread = self._session = None
+        if loop is None or self._pid != os.getpid():
+            return
+        if session is not None:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        if not thread.is_alive():
+            loop.close()
+
+
+# Shared by every AsyncMetabaseClient in this process
+metabase_http_session = MetabaseHTTPSession(config.metabase)
+
+
+class AsyncMetabaseClient:
+    """
+    aiohttp-based Metabase client for use inside an event loop.
+
+    Covers the calls made on the SQL generation critical path. Requests go
+    through the worker's shared MetabaseHTTPSession, so connections are
+    reused across asks. A semaphore bounds how many requests this client
+    has in flight at once so concurrent candidate validation does not flood
+    Metabase:
+
+        metabase = AsyncMetabaseClient()
+        await asyncio.gather(*(metabase.validate_sql(sql, db_id) for sql in sqls))
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.config = config.metabase
+        self.result_cache = query_result_cache
+        self.poller = metabase_job_poller
+        self.http = metabase_http_session
+        self._semaphore = asyncio.Semaphore(max_concurrency or self.config.async_max_concurrency)
+
+    async def _request(self, method: str, path: str, tenant_id: Optional[str] = None,
+                       statement_timeout: Optional[float] = None,
+                       **kwargs) -> Tuple[int, Any, str]:
+        """
+        Send a request to the Metabase API.
+
+        With statement_timeout the request is abandoned after that many
+        seconds. Like the sync client, that abort raises asyncio.TimeoutError
+        without counting as a circuit breaker failure.
+
+        Returns:
+            Tuple of (status, parsed_json_or_None, raw_text)
+        """
+        if statement_timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(
+                total=statement_timeout, sock_connect=self.config.connect_timeout
+            )
+        async with self._semaphore:
+            async with metabase_breaker.guard_async(tenant_id, endpoint_class(path)) as call:
+                try:
+                    status, text = await self.http.request(
+                        method,
+                        f"{self.config.url}{path}",
+                        headers=metabase_headers(tenant_id),
+                        **kwargs
+                    )
+                except asyncio.TimeoutError as e:
+                    if statement_timeout is not None and not isinstance(e, aiohttp.ConnectionTimeoutError):
+                        call.cancelled = True
+                    raise
+                call.failed = status >= 500
+                try:
+                    body = json.loads(text) if text else None
+                except ValueError:
+                    body = None
+                return status, body, text
+
+    async def _wait_for_job(self, body: Dict[str, Any], tenant_id: Optional[str],
+                            timeout: float) -> Dict[str, Any]:
+        """Poll /api/async/{id} for a 202 job; returns the original body if it never finishes."""
+        job_id = body.get("id")
+
+        async def fetch() -> Optional[Dict[str, Any]]:
+            status, job_body, _ = await self._request("GET", f"/api/async/{job_id}", tenant_id)
+            return job_body if status == 200 and isinstance(job_body, dict) else None
+
+        return await self.poller.wait_async(fetch, timeout=timeout) or body
+
+    async def _run_dataset(self, sql: str, db_id: int, tenant_id: Optional[str] = None,
+                           job_timeout: Optional[float] = None,
+                           statement_timeout: Optional[float] = None
+                           ) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Run a native query through /api/dataset, waiting for 202 jobs.
+
+        With statement_timeout the request is abandoned after that many
+        seconds and reported as an error. Metabase cancels a /api/dataset
+        query when its client disconnects, so this also stops the query in
+        the database. Tenants with a reporting_db run the query directly on
+        their reporting database instead (see reporting_db.py).
+
+        Returns:
+            Tuple of (error_message, data). error_message is None when the
+            query ran; data is None if the job did not finish in time.
+        """
+        if reporting_executor.enabled(tenant_id):
+            return await asyncio.to_thread(_run_direct, sql, tenant_id, statement_timeout)
+
+        payload = {
+            "database": db_id,
+            "type": "native",
+            "native": {"query": sql}
+        }
+        job_timeout = job_timeout or self.config.validation_job_timeout
+        if statement_timeout is not None:
+            job_timeout = min(job_timeout, statement_timeout)
+
+        try:
+            status, body, text = await self._request("POST", "/api/dataset", tenant_id, json=payload,
+                                                     statement_timeout=statement_timeout)
+        except asyncio.TimeoutError:
+            if statement_timeout is None:
+                raise
+            return statement_timeout_error(statement_timeout), None
+
+        if status not in (200, 202) or not isinstance(body, dict):
+            return f"HTTP {status}: {text}", None
+
+        if status == 202 and body.get("status") == "running":
+            body = await self._wait_for_job(body, tenant_id, job_timeout)
+
+        if "error" in body:
+            return body["error"], None
+
+        return None, body.get("data")
+
+    async def execute_sql(self, sql: str, db_id: int, tenant_id: Optional[str] = None,
+                          use_cache: bool = True) -> Dict[str, Any]:
+        """Execute SQL query via Metabase API and return the inner data dict."""
+        is_valid, error, data = await self.validate_and_execute(sql, db_id, tenant_id, use_cache=use_cache)
+        if not is_valid:
+            raise requests.exceptions.HTTPError(error)
+        if data is None:
+            raise requests.exceptions.Timeout("Metabase query did not complete in time")
+        return data
+
+    async def validate_sql(self, sql: str, db_id: int, tenant_id: Optional[str] = None,
+                           mode: Optional[str] = None,
+                           statement_timeout: Optional[float] = None) -> Tuple[bool, Optional[str]]:
+        """Validate if SQL query can be executed. Returns (is_valid, error_message)."""
+        mode = _resolve_validation_mode(mode, tenant_id)
+        error, _ = await self._run_dataset(build_validation_sql(sql, mode), db_id, tenant_id,
+                                           statement_timeout=statement_timeout)
+        return error is None, error
+
+    async def estimate_cost(self, sql: str, db_id: int, tenant_id: Optional[str] = None,
+                            statement_timeout: Optional[float] = None
+                            ) -> Tuple[Optional[str], Optional[Dict[str, float]]]:
+        """
+        Get the planner's estimated cost and rows for SQL without running it.
+
+        Returns:
+            Tuple of (error_message, estimate). error_message is set when the
+            SQL cannot be planned; estimate is `{"cost", "rows"}` or None if
+            the plan could not be read.
+        """
+        explain_sql = build_explain_json_sql(sql)
+        data = self.result_cache.get(explain_sql, db_id, tenant_id)
+        if data is None:
+            error, data = await self._run_dataset(explain_sql, db_id, tenant_id,
+                                                  statement_timeout=statement_timeout)
+            if error is not None or data is None:
+                return error, None
+            self.result_cache.put(explain_sql, db_id, data, tenant_id)
+        return None, parse_plan_estimate(data)
+
+    async def validate_and_execute(self, sql: str, db_id: int, tenant_id: Optional[str] = None,
+                                   use_cache: bool = True, statement_timeout: Optional[float] = None
+                                   ) -> Tuple[bool, Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Validate SQL by executing it once, keeping the result.
+
+        Replaces a validate_sql call followed by execute_sql on the same SQL.
+
+        Returns:
+            Tuple of (is_valid, error_message, data). data is None when the
+            query is invalid or did not finish in time.
+        """
+        if use_cache:
+            cached = self.result_cache.get(sql, db_id, tenant_id)
+            if cached is not None:
+                return True, None, cached
+
+        error, data = await self._run_dataset(sql, db_id, tenant_id, job_timeout=self.config.async_job_timeout,
+                                              statement_timeout=statement_timeout)
+        if data is not None:
+            self.result_cache.put(sql, db_id, data, tenant_id)
+        return error is None, error, data
+
+    async def create_card(self, sql: str, db_id: int, collection_id: int,
+                          name: str, tenant_id: Optional[str] = None,
+                          visualization_settings: Optional[Dict[str, Any]] = None,
+                          run_query: bool = True, display: str = "table"
+                          ) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Create a Metabase card and execute its query. Returns (card_id, card_data)."""
+        payload = {
+            "name": name,
+            "visualization_settings": visualization_settings or {},
+            "collection_id": collection_id,
+            "enable_embedding": True,
+            "dataset_query": {
+                "database": db_id,
+                "native": {"query": sql},
+                "type": "native"
+            },
+            "display": display
+        }
+        status, body, text = await self._request("POST", "/api/card", tenant_id, json=payload)
+        if status != 200 or not isinstance(body, dict):
+            logger.error(f"Metabase API error - Status: {status}, Response: {text}")
+            raise requests.exceptions.HTTPError(f"HTTP {status}: {text}")
+
+        card_id = body["id"]
+        logger.info(f"Card created successfully with ID: {card_id}")
+        metabase_client.card_registry.add(card_id, collection_id, tenant_id)
+        if not run_query:
+            return card_id, None
+        card_data = await self.run_card_query(card_id, tenant_id)
+        return card_id, card_data
+
+    async def get_or_create_card(self, sql: str, db_id: int, collection_id: int,
+                                 name: str, tenant_id: Optional[str] = None,
+                                 visualization_settings: Optional[Dict[str, Any]] = None,
+                                 display: str = "table") -> Tuple[int, bool]:
+        """
+        Async MetabaseClient.get_or_create_card: reuse a registered live card or create one.
+
+        The card_dedup registry and the card liveness check are blocking, so
+        they run in a worker thread; the card itself is created on the loop.
+
+        Returns:
+            Tuple of (card_id, reused)
+        """
+        tenant = tenant_id or DEFAULT_TENANT
+        sql_hash = hashlib.sha256(strip_sql(sql).encode()).hexdigest()
+        viz_hash = visualization_hash(display, visualization_settings)
+
+        try:
+            card_id = await asyncio.to_thread(
+                card_dedup_repository.acquire, tenant, collection_id, sql_hash, viz_hash
+            )
+        except Exception as e:
+            logger.warning(f"Card dedup lookup failed, creating a new card: {e}")
+            card_id = None
+
+        if card_id is not None:
+            registry = metabase_client.card_registry
+            if await asyncio.to_thread(registry.exists, card_id, collection_id, tenant_id):
+                logger.info(f"Reusing card {card_id} for tenant '{tenant}'")
+                return card_id, True
+            logger.info(f"Registered card {card_id} no longer exists; creating a new one")
+            try:
+                await asyncio.to_thread(card_dedup_repository.forget, tenant, card_id)
+            except Exception as e:
+                logger.warning(f"Could not drop stale card {card_id} from dedup registry: {e}")
+
+        card_id, _ = await self.create_card(
+            sql, db_id, collection_id, name, tenant_id=tenant_id,
+            visualization_settings=visualization_settings, run_query=False, display=display
+        )
+        try:
+            await asyncio.to_thread(
+                card_dedup_repository.register, tenant, collection_id, sql_hash, viz_hash, card_id
+            )
+        except Exception as e:
+            logger.warning(f"Could not register card {card_id} for dedup: {e}")
+        return card_id, False
+
+    async def fetch_preview(self, sql: str, db_id: int, limit: int,
+                            tenant_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Fetch at most `limit` rows for the card preview (see MetabaseClient.fetch_preview)."""
+        try:
+            data = await self.execute_sql(build_preview_sql(sql, limit), db_id, tenant_id=tenant_id)
+        except Exception:
+            logger.exception("Error fetching preview rows")
+            return None
+        return parse_preview(data)
+
+    async def run_card_query(self, card_id: int, tenant_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Execute a saved card and return its inner data dict, or None on any failure."""
+        try:
+            status, body, _ = await self._request(
+                "POST", f"/api/card/{card_id}/query", tenant_id, json={"ignore_cache": True}
+            )
+            if status == 202 and isinstance(body, dict) and body.get("status") == "running":
+                body = await self._wait_for_job(body, tenant_id, self.config.async_job_timeout)
+
+            return body.get("data") if isinstance(body, dict) else None
+        except Exception:
+            logger.exception("Error fetching card data for card %s", card_id)
+            return None
 
 
 # Global client instance
@@ -0,0 +1,170 @@
+"""
+Database metadata cache module.
+Keeps a compact table -> fields index of Metabase database metadata per
+(tenant, db_id), in memory and on disk, with a content hash for change detection.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from config import DEFAULT_TENANT
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class MetadataCache:
+    """
+    Caches /api/database/{id}/metadata as a compact index per (tenant, db_id).
+
+    Only the table schema, table name and field name/base_type are kept, which
+    is all the schema extraction needs and far smaller than the raw payload.
+    The content hash is taken over that index, so Metabase sync bookkeeping
+    (timestamps, fingerprints) does not count as a change. Entries are served
+    from memory, then from disk, until the TTL passes.
+    """
+
+    def __init__(self, fetch: Callable[[int, Optional[str]], Dict[str, Any]],
+                 ttl: float, cache_dir: Optional[str] = None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.cache_dir = cache_dir or None
+        self._entries: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def build_index(metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Reduce raw Metabase metadata to a sorted list of tables with their fields."""
+        tables = [
+            {
+                "schema": table.get("schema"),
+                "name": table["name"],
+                "fields": [
+                    {"name": field["name"], "base_type": field.get("base_type")}
+                    for field in table.get("fields", [])
+                ],
+            }
+            for table in metadata.get("tables", [])
+        ]
+        tables.sort(key=lambda t: (t["schema"] or "", t["name"]))
+        return tables
+
+    @staticmethod
+    def hash_index(tables: List[Dict[str, Any]]) -> str:
+        """Hash a table index so equal schemas produce equal hashes."""
+        return hashlib.sha256(json.dumps(tables, sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def _key(db_id: int, tenant_id: Optional[str]) -> Tuple[str, int]:
+        return tenant_id or DEFAULT_TENANT, db_id
+
+    def _path(self, key: Tuple[str, int]) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        tenant = re.sub(r"[^A-Za-z0-9_-]+", "_", key[0])
+        return os.path.join(self.cache_dir, f"metadata_{tenant}_{key[1]}.json")
+
+    def _load(self, key: Tuple[str, int]) -> Optional[Dict[str, Any]]:
+        """Load an entry from disk, or None if there is no usable file."""
+        path = self._path(key)
+        if not path or not os.path.isfile(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read metadata cache {path}: {e}")
+            return None
+
+    def _save(self, key: Tuple[str, int], entry: Dict[str, Any]):
+        """Write an entry to disk atomically (non-fatal on failure)."""
+        path = self._path(key)
+        if not path:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write metadata cache {path}: {e}")
+
+    def _store(self, key: Tuple[str, int], entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = entry
+        self._save(key, entry)
+
+    def get(self, db_id: int, tenant_id: Optional[str] = None,
+            refresh: bool = False) -> Dict[str, Any]:
+        """
+        Get the cached entry for a database, fetching it when missing or stale.
+
+        Returns:
+            Dict with "content_hash", "tables", "fetched_at" and, once a
+            schema embedding has completed, "embedded_marker"
+        """
+        key = self._key(db_id, tenant_id)
+        if not refresh:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key)
+                if entry is not None:
+                    with self._lock:
+                        self._entries[key] = entry
+            if entry is not None and time.time() - entry["fetched_at"] < self.ttl:
+                return entry
+
+        previous = self._entries.get(key) or self._load(key) or {}
+        tables = self.build_index(self.fetch(db_id, tenant_id))
+        entry = {
+            "content_hash": self.hash_index(tables),
+            "tables": tables,
+            "fetched_at": time.time(),
+        }
+        if "embedded_marker" in previous:
+            entry["embedded_marker"] = previous["embedded_marker"]
+        if previous.get("content_hash") and previous["content_hash"] != entry["content_hash"]:
+            logger.info(f"Database metadata changed for tenant={key[0]} db_id={db_id}")
+        self._store(key, entry)
+        return entry
+
+    def get_tables(self, db_id: int, tenant_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get the compact table index for a database."""
+        return self.get(db_id, tenant_id)["tables"]
+
+    def embedded_marker(self, db_id: int, tenant_id: Optional[str] = None) -> Optional[str]:
+        """Get the marker recorded by the last mark_embedded call, or None."""
+        key = self._key(db_id, tenant_id)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key) or {}
+        return entry.get("embedded_marker")
+
+    def mark_embedded(self, db_id: int, marker: str, tenant_id: Optional[str] = None):
+        """
+        Record the marker of a completed schema embedding.
+
+        The marker is built by the caller from the content hash and whatever
+        else selects the embedded documents (see EmbeddingManager.embed_schemas).
+        """
+        key = self._key(db_id, tenant_id)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        self._store(key, {**entry, "embedded_marker": marker})
+
+    def invalidate(self, db_id: Optional[int] = None, tenant_id: Optional[str] = None):
+        """Drop in-memory entries so the next call re-reads disk or Metabase"""
+        with self._lock:
+            if db_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(db_id, tenant_id), None)
@@ -0,0 +1,260 @@
+"""
+Direct reporting database execution module.
+Runs candidate SQL over pooled, read-only psycopg connections to a tenant's
+reporting database instead of going through the Metabase API.
+"""
+import datetime as dt
+import logging
+import re
+import threading
+import uuid
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import psycopg
+from psycopg import sql as pgsql
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import ConnectionPool
+
+from config import config, DEFAULT_TENANT
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Statements that can run behind a server-side cursor (DECLARE ... CURSOR FOR)
+CURSOR_STATEMENTS = ("SELECT", "WITH", "VALUES", "TABLE")
+
+_LEADING_KEYWORD = re.compile(r"^(?:\s+|--[^\n]*(?:\n|$)|/\*.*?\*/|\()*([A-Za-z]+)", re.S)
+_DOLLAR_TAG = re.compile(r"\$(?:[A-Za-z_][A-Za-z0-9_]*)?\$")
+# Characters that cannot start a comment, quote, dollar quote or separator
+_PLAIN_RUN = re.compile(r"[^\s;'\"$/-]+")
+
+
+def iter_sql_tokens(sql: str) -> Iterator[Tuple[str, int, int]]:
+    """
+    Split SQL into (kind, start, end) spans, where kind is "comment",
+    "space", "semicolon" or "code".
+
+    Quoted strings (including E'' strings with backslash escapes), quoted
+    identifiers and dollar quotes are single "code" spans, so comment markers
+    and semicolons inside them are not mistaken for real ones.
+    """
+    i, n = 0, len(sql)
+    while i < n:
+        start, c, kind = i, sql[i], "code"
+        if sql.startswith("--", i):
+            kind = "comment"
+            end = sql.find("\n", i)
+            i = n if end < 0 else end + 1
+        elif sql.startswith("/*", i):
+            kind = "comment"
+            end = sql.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+        elif c.isspace() or c == ";":
+            kind = "space" if c.isspace() else "semicolon"
+            i += 1
+        elif c in ("'", '"'):
+            # E'...' strings treat backslash as an escape character
+            escapes = (c == "'" and i > 0 and sql[i - 1] in "eE"
+                       and not (i > 1 and (sql[i - 2].isalnum() or sql[i - 2] == "_")))
+            i += 1
+            while i < n:
+                if escapes and sql[i] == "\\":
+                    i += 2
+                elif sql[i] == c:
+                    if sql.startswith(c * 2, i):
+                        i += 2
+                    else:
+                        break
+                else:
+                    i += 1
+            i += 1
+        elif c == "$" and not (i > 0 and (sql[i - 1].isalnum() or sql[i - 1] in "_$")):
+            tag = _DOLLAR_TAG.match(sql, i)
+            if tag:
+                end = sql.find(tag.group(), tag.end())
+                i = n if end < 0 else end + len(tag.group())
+            else:
+                i += 1
+        else:
+            plain = _PLAIN_RUN.match(sql, i)
+            i = plain.end() if plain else i + 1
+        yield kind, start, min(i, n)
+
+
+def is_single_statement(sql: str) -> bool:
+    """
+    Check that SQL holds exactly one statement.
+
+    Semicolons inside quoted strings, quoted identifiers, dollar quotes and
+    comments are ignored (see iter_sql_tokens), and trailing semicolons are
+    allowed. Anything but whitespace and comments after a statement-ending
+    semicolon makes this False.
+    """
+    ended = False
+    for kind, _, _ in iter_sql_tokens(sql):
+        if kind == "semicolon":
+            ended = True
+        elif kind == "code" and ended:
+            return False
+    return True
+
+
+def _to_json_value(value: Any) -> Any:
+    """Convert a database value to the JSON-friendly form Metabase would return."""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, dt.timedelta):
+        return str(value)
+    return value
+
+
+class ReportingDatabaseExecutor:
+    """
+    Executes SQL directly against tenant reporting databases.
+
+    Each tenant with a "reporting_db" entry in tenant_config.json gets its own
+    connection pool. Sessions default to read-only transactions and a
+    statement_timeout, every query runs in a read-only transaction with its
+    own statement_timeout and is always rolled back, and only single
+    statements are accepted. Results use Metabase's
+    `{"cols": [...], "rows": [...]}` data shape so callers can treat both
+    backends the same.
+    """
+
+    def __init__(self):
+        self.config = config.reporting_db
+        self._pools: Dict[str, ConnectionPool] = {}
+        self._pools_lock = threading.Lock()
+
+    def enabled(self, tenant_id: Optional[str] = None) -> bool:
+        """Check whether a tenant has direct reporting database settings."""
+        return config.get_tenant_reporting_db(tenant_id) is not None
+
+    @staticmethod
+    def _configure(conn: psycopg.Connection):
+        """Make every transaction on a pooled connection read-only."""
+        conn.read_only = True
+
+    def _get_pool(self, tenant_id: Optional[str]) -> ConnectionPool:
+        """Get (or create) the connection pool for a tenant."""
+        key = tenant_id or DEFAULT_TENANT
+        with self._pools_lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                settings = dict(config.get_tenant_reporting_db(key))
+                max_size = int(settings.pop("pool_size", self.config.pool_size))
+                # Session-level defaults, so a transaction that escapes the
+                # per-query settings is still read-only and time-limited
+                timeout_ms = int(config.metabase.read_timeout * 1000)
+                settings["options"] = " ".join(filter(None, [
+                    str(settings.get("options", "")),
+                    "-c default_transaction_read_only=on",
+                    f"-c statement_timeout={timeout_ms}",
+                    "-c standard_conforming_strings=on",
+                ]))
+                pool = ConnectionPool(
+                    make_conninfo(**{k: str(v) for k, v in settings.items()}),
+                    min_size=1,
+                    max_size=max_size,
+                    configure=self._configure,
+                    name=f"reporting-{key}",
+                    open=True,
+                )
+                self._pools[key] = pool
+                logger.info(f"Opened reporting database pool for tenant '{key}' (max_size={max_size})")
+            return pool
+
+    def run(self, sql: str, tenant_id: Optional[str] = None,
+            statement_timeout: Optional[float] = None) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        Run SQL in a read-only transaction and return Metabase-shaped data.
+
+        SELECT-like statements are read through a server-side cursor, so at
+        most max_rows rows are transferred to this process. A longer result
+        is marked the way Metabase marks its own row cap: `rows_truncated`
+        holds the cap and `row_count` the full row count, which the database
+        counts by moving the cursor to the end without sending the rows.
+
+        Args:
+            sql: A single SQL statement to run (no parameters are bound)
+            tenant_id: Tenant whose reporting database to use
+            statement_timeout: Seconds before the database cancels the
+                statement; defaults to the Metabase read timeout
+
+        Returns:
+            Tuple of (error_message, data). error_message holds the database
+            error for SQL that failed, or the rejection of SQL with more than
+            one statement; data is None in that case.
+
+        Raises:
+            TimeoutError: The statement was cancelled at statement_timeout
+            psycopg.OperationalError / PoolTimeout: The database is unreachable
+        """
+        if not is_single_statement(sql):
+            return "Only a single SQL statement is allowed", None
+
+        timeout_ms = int((statement_timeout or config.metabase.read_timeout) * 1000)
+        keyword = _LEADING_KEYWORD.match(sql)
+        server_side = bool(keyword) and keyword.group(1).upper() in CURSOR_STATEMENTS
+        pool = self._get_pool(tenant_id)
+
+        with pool.connection(timeout=self.config.acquire_timeout) as conn:
+            try:
+                conn.execute("SELECT set_config('statement_timeout', %s, true)", (str(timeout_ms),))
+                with conn.cursor(name="reporting_q") if server_side else conn.cursor() as cur:
+                    cur.execute(sql)
+                    if cur.description is None:
+                        return None, {"cols": [], "rows": []}
+                    cols: List[Dict[str, Any]] = [
+                        {"name": col.name, "display_name": col.name}
+                        for col in cur.description
+                    ]
+                    max_rows = self.config.max_rows
+                    fetched = cur.fetchmany(max_rows + 1)
+                    data = {
+                        "cols": cols,
+                        "rows": [[_to_json_value(value) for value in row] for row in fetched[:max_rows]],
+                    }
+                    if len(fetched) > max_rows:
+                        data["rows_truncated"] = max_rows
+                        data["row_count"] = self._count_rows(conn, cur, len(fetched), server_side)
+                        logger.info(f"Reporting query truncated to {max_rows} of {data['row_count']} rows")
+                    return None, data
+            except psycopg.errors.QueryCanceled as e:
+                raise TimeoutError(str(e)) from e
+            except psycopg.OperationalError:
+                raise
+            except psycopg.Error as e:
+                return str(e).strip(), None
+            finally:
+                if not conn.closed:
+                    conn.rollback()
+
+    @staticmethod
+    def _count_rows(conn: psycopg.Connection, cur: psycopg.Cursor, fetched: int, server_side: bool) -> int:
+        """Get a result's full row count after `fetched` rows were read from cur."""
+        if not server_side:
+            return cur.rowcount
+        status = conn.execute(
+            pgsql.SQL("MOVE FORWARD ALL FROM {}").format(pgsql.Identifier(cur.name))
+        ).statusmessage or ""
+        moved = status.split()[-1] if status.startswith("MOVE") else "0"
+        return fetched + int(moved)
+
+    def close(self):
+        """Close all tenant pools"""
+        with self._pools_lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+# Global reporting database executor instance
+reporting_executor = ReportingDatabaseExecutor()
@@ -2,27 +2,207 @@
 SQL generation module for natural language to SQL conversion.
 Uses LLM with majority voting for robust SQL generation.
 """
+import os
 import re
+import math
+import operator
 import json
 import hashlib
 import asyncio
-import aiohttp
+import threading
 import tiktoken
 import datetime as dt
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, Callable, List, Optional, Tuple
 from collections import Counter
 from config import config
+from azure_openai import (
+    azure_openai_client, AzureOpenAIError,
+    PRIORITY_RELEVANCE, PRIORITY_GENERATION, PRIORITY_EXPLANATION,
+)
 from embeddings import embedding_manager
-from metabase import metabase_client
+from metabase import metabase_client, AsyncMetabaseClient, build_fingerprint_sql
 import time
 
 # Define constants
-CONTENT_TYPE = "application/json"
+EXAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "QDECOMP_examples.json")
+
+# Static instructions and rules that follow the per-request question context
+PROMPT_INSTRUCTIONS = (
+    "Please generate SQL and metadata for the following question, with reasoning but no explanation.\n"
+    "\n"
+    "Rules:\n"
+    "- The schema context above is divided into sections: PUBLIC TABLES, WORKSHEET VIEWS, and SCORESHEET VIEWS.\n"
+    "- Use PUBLIC TABLES for application-level data (applicants, applications, statuses, funding amounts).\n"
+    "- Use WORKSHEET VIEWS for program-specific form data and custom applicant fields collected on worksheets.\n"
+    "- Use SCORESHEET VIEWS for evaluation, scoring, reviewer assessments, or scorecard data.\n"
+    "- Do not mix WORKSHEET VIEWS and SCORESHEET VIEWS in the same query unless explicitly requested; prefer JOINing via a shared applicant or application identifier.\n"
+    "- When using columns from WORKSHEET VIEWS or SCORESHEET VIEWS that have type/Text but contain numeric values (e.g. currency amounts), "
+    "always cast them using ::numeric before applying any aggregation (e.g. SUM(\"m2Cost\"::numeric)).\n"
+    "- When using type/Text date columns from WORKSHEET VIEWS or SCORESHEET VIEWS, cast them using ::date when filtering or ordering by date.\n"
+    "- Enable the map visualization option only for questions involving regional districts.\n"
+    "\n"
+)
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+
+class ExampleCorpus:
+    """
+    Few-shot examples from QDECOMP_examples.json, parsed and rendered once.
+
+    The file's mtime is checked on each access and the corpus is reloaded
+    only when it changes. A file that fails to parse keeps the previous
+    corpus, so a half-written edit does not empty the prompt.
+
+    select() picks the examples whose questions are closest to the incoming
+    question. Example questions are embedded on first use and the unit
+    vectors are kept by question text, so a reload only embeds new examples.
+    """
+
+    def __init__(self, path: str = EXAMPLES_PATH,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        self.path = path
+        self.count_tokens = count_tokens or (lambda text: len(text) // 4)
+        self._mtime: Optional[int] = None
+        # (raw examples, formatted examples, rendered block, token counts), swapped as one
+        self._snapshot: Tuple[List[Dict[str, Any]], List[str], str, List[int]] = ([], [], "", [])
+        self._vectors: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def format_example(ex: Dict[str, Any]) -> str:
+        """Render one example in the prompt's Schema/Question/Reasoning/SQL/Metadata layout."""
+        newline = '\n'
+        metadata_dict = {
+            'title': ex['title'],
+            'x_axis': ex['x_axis'],
+            'y_axis': ex['y_axis'],
+            'visualization_options': ex['visualization_options']
+        }
+        return (
+            f"### Schema:{newline}{newline.join(ex['Schema'])}{newline}"
+            f"### Question:{newline}{ex['Question']}{newline}"
+            f"### Reasoning:{newline}{ex['Reasoning']}{newline}"
+            f"### SQL:{newline}{ex['SQL']}{newline}"
+            f"### Metadata:{newline}{json.dumps(metadata_dict)}"
+        )
+
+    def refresh(self):
+        """Reload the examples if the file changed since the last load."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            if self._mtime != -1:
+                logger.warning(f"{self.path} not found, using empty examples")
+                self._snapshot = ([], [], "", [])
+                self._mtime = -1
+            return
+
+        if mtime == self._mtime:
+            return
+
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, "r") as file:
+                    examples = json.load(file)
+                formatted = [self.format_example(ex) for ex in examples]
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Could not load examples from {self.path}, keeping previous set: {e}")
+                return
+            token_counts = [self.count_tokens(text) for text in formatted]
+            self._snapshot = (examples, formatted, "\n\n".join(formatted), token_counts)
+            self._mtime = mtime
+            logger.info(f"Loaded {len(formatted)} few-shot examples from {self.path}")
+
+    @property
+    def examples(self) -> List[Dict[str, Any]]:
+        """Raw example dicts"""
+        self.refresh()
+        return self._snapshot[0]
+
+    @property
+    def formatted(self) -> List[str]:
+        """Examples rendered for the prompt"""
+        self.refresh()
+        return self._snapshot[1]
+
+    @property
+    def rendered(self) -> str:
+        """All examples joined into the prompt's leading block"""
+        self.refresh()
+        return self._snapshot[2]
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> List[float]:
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def _example_vectors(self, questions: List[str],
+                         embed: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """Get unit vectors for example questions, embedding any not seen before."""
+        missing = [q for q in dict.fromkeys(questions) if q not in self._vectors]
+        if missing:
+            vectors = embed(missing)
+            with self._lock:
+                for question, vector in zip(missing, vectors):
+                    self._vectors[question] = self._normalize(vector)
+            logger.info(f"Embedded {len(missing)} few-shot example questions")
+        return [self._vectors[q] for q in questions]
+
+    def fits(self, top_n: int, token_budget: int = 0) -> bool:
+        """Check whether the whole corpus is within top_n and token_budget, so no selection is needed."""
+        self.refresh()
+        examples, _, _, token_counts = self._snapshot
+        return len(examples) <= top_n and (not token_budget or sum(token_counts) <= token_budget)
+
+    def select(self, question_vector: List[float],
+               embed: Callable[[List[str]], List[List[float]]],
+               top_n: int, token_budget: int = 0) -> Tuple[str, int]:
+        """
+        Render the examples most similar to a question.
+
+        Args:
+            question_vector: Embedding of the incoming question
+            embed: Embeds a batch of texts (e.g. embed_documents)
+            top_n: Maximum number of examples to include
+            token_budget: Maximum prompt tokens for the examples (0 for no limit).
+                The most similar example is always included.
+
+        Returns:
+            Tuple of (rendered block, number of examples included). Examples
+            are ordered least to most similar, so the closest one sits right
+            before the question.
+        """
+        if self.fits(top_n, token_budget):
+            return self._snapshot[2], len(self._snapshot[0])
+        examples, formatted, _, token_counts = self._snapshot
+
+        vectors = self._example_vectors([ex["Question"] for ex in examples], embed)
+        query = self._normalize(question_vector)
+        scores = [sum(map(operator.mul, query, vector)) for vector in vectors]
+        ranked = sorted(range(len(examples)), key=lambda i: scores[i], reverse=True)
+
+        chosen: List[int] = []
+        used_tokens = 0
+        for i in ranked:
+            if len(chosen) >= top_n:
+                break
+            if chosen and token_budget and used_tokens + token_counts[i] > token_budget:
+                continue
+            chosen.append(i)
+            used_tokens += token_counts[i]
+
+        logger.debug(
+            f"Selected few-shot examples {chosen} "
+            f"(scores={[round(scores[i], 3) for i in chosen]}, tokens={used_tokens})"
+        )
+        return "\n\n".join(formatted[i] for i in reversed(chosen)), len(chosen)
+
+
 class SQLGenerator:
     """Generates SQL from natural language queries"""
     
@@ -30,7 +210,14 @@ class SQLGenerator:
         self.config = config.ai
         self.metabase = metabase_client
         self.embeddings = embedding_manager
+        self.llm = azure_openai_client
+        # Cleared when the deployment rejects the n parameter
+        self._n_supported = True
+        # Cost guard checks that raised and let the candidate through unchecked
+        self.cost_guard_failures = 0
         self.tokenizer = tiktoken.encoding_for_model("gpt-4o-mini")
+        self.example_corpus = ExampleCorpus(count_tokens=lambda text: len(self.tokenizer.encode(text)))
+        self.example_corpus.refresh()
         
         # Regex patterns for extraction
         self.sql_pattern = re.compile(r"```sql\s*(.+?)```", re.I | re.S)
@@ -75,9 +262,113 @@ class SQLGenerator:
         Create a fingerprint of SQL results for comparison.
 
         Returns:
-            Tuple of (row_count, column_names, hash_of_first_5_rows)
+            Tuple of (row_count, column_names, result_hash). In "rows" mode the
+            hash covers the first 5 rows; in "server" mode it covers the whole
+            result regardless of row order.
+        """
+        statement_timeout = config.get_tenant_query_limits(tenant_id)["validation_statement_timeout"]
+        if config.metabase.fingerprint_mode == "server":
+            data = self.metabase.execute_sql(build_fingerprint_sql(sql), db_id, tenant_id=tenant_id,
+                                             statement_timeout=statement_timeout)
+            return self._parse_server_fingerprint(data)
+        data = self.metabase.execute_sql(sql, db_id, tenant_id=tenant_id, statement_timeout=statement_timeout)
+        return self._fingerprint_data(data)
+
+    async def check_query_cost(self, sql: str, db_id: int, metabase: AsyncMetabaseClient,
+                               tenant_id: Optional[str] = None) -> Optional[str]:
+        """
+        Reject SQL whose planner estimates exceed the tenant's cost guard thresholds.
+
+        Runs EXPLAIN (FORMAT JSON) only, so expensive candidates (e.g. cartesian
+        joins) are caught before they execute.
+
+        Returns:
+            The rejection reason, or None if the SQL may be executed. SQL that
+            cannot be planned is rejected with the planner's error.
+        """
+        limits = config.get_tenant_query_limits(tenant_id)
+        error, estimate = await metabase.estimate_cost(
+            sql, db_id, tenant_id=tenant_id, statement_timeout=limits["validation_statement_timeout"]
+        )
+        if error:
+            return error
+        if estimate is None:
+            logger.debug("Cost guard skipped: no plan estimate returned")
+            return None
+
+        logger.debug(f"Plan estimate: cost={estimate['cost']:.0f} rows={estimate['rows']:.0f}")
+        max_cost, max_rows = limits["max_query_cost"], limits["max_query_rows"]
+        if max_cost and estimate["cost"] > max_cost:
+            return (
+                f"Query too expensive: estimated cost {estimate['cost']:.0f} exceeds {max_cost:.0f}; "
+                "check for missing join conditions"
+            )
+        if max_rows and estimate["rows"] > max_rows:
+            return (
+                f"Query too large: estimated {estimate['rows']:.0f} rows exceeds {max_rows:.0f}; "
+                "check for missing join conditions or aggregate the result"
+            )
+        return None
+
+    async def validate_and_fingerprint(self, sql: str, db_id: int, metabase: AsyncMetabaseClient,
+                                       tenant_id: Optional[str] = None
+                                       ) -> Tuple[bool, Optional[str], Optional[Tuple[str, Tuple[str, ...], str]], Optional[Dict[str, Any]]]:
+        """
+        Validate SQL and fingerprint its results from a single execution.
+
+        The execution is abandoned after the tenant's validation statement
+        timeout and reported as invalid. In "server" fingerprint mode the SQL
+        runs wrapped in build_fingerprint_sql, so only the aggregate crosses
+        the wire and no preview is kept.
+
+        Returns:
+            Tuple of (is_valid, error_message, fingerprint, preview). fingerprint
+            and preview are None when the SQL is invalid or the query did not
+            finish in time. preview is the result capped to preview_row_limit
+            rows (see _build_preview), or None in "server" mode.
+        """
+        statement_timeout = config.get_tenant_query_limits(tenant_id)["validation_statement_timeout"]
+        server_side = config.metabase.fingerprint_mode == "server"
+        is_valid, error, data = await metabase.validate_and_execute(
+            self._validation_sql(sql), db_id,
+            tenant_id=tenant_id, statement_timeout=statement_timeout
+        )
+        if not is_valid or data is None:
+            return is_valid, error, None, None
+        if server_side:
+            return True, None, self._parse_server_fingerprint(data), None
+        return True, None, self._fingerprint_data(data), self._build_preview(data)
+
+    @staticmethod
+    def _validation_sql(sql: str) -> str:
+        """Get the SQL validate_and_fingerprint actually executes for a candidate."""
+        if config.metabase.fingerprint_mode == "server":
+            return build_fingerprint_sql(sql)
+        return sql
+
+    @staticmethod
+    def _build_preview(data: Dict[str, Any]) -> Dict[str, Any]:
+        """Cap a result to preview_row_limit rows, keeping the full row count.
+
+        The returned dict has the same `{cols, rows}` shape as Metabase card
+        data plus `row_count`, so the winning candidate's rows can be shown
+        without running the card again.
+        """
+        rows = data.get("rows") or []
+        return {
+            "cols": data.get("cols") or [],
+            "rows": rows[:config.app.preview_row_limit],
+            "row_count": data.get("row_count", len(rows)),
+        }
+
+    @staticmethod
+    def _fingerprint_data(data: Dict[str, Any]) -> Tuple[str, Tuple[str, ...], str]:
+        """
+        Build the (row_count, column_names, hash_of_first_5_rows) fingerprint from Metabase data.
+
+        A row-capped result (see ReportingDatabaseExecutor.run) counts its
+        full row_count, so candidates differing past the cap do not match.
         """
-        data = self.metabase.execute_sql(sql, db_id, tenant_id=tenant_id)
         rows = data["rows"]
         cols = tuple(
             c["name"] if isinstance(c, dict) else c
@@ -85,7 +376,15 @@ class SQLGenerator:
         )
         head = rows[:5]
         digest = hashlib.md5(json.dumps(head, default=str).encode()).hexdigest()
-        return str(len(rows)), cols, digest
+        return str(data.get("row_count", len(rows))), cols, digest
+
+    @staticmethod
+    def _parse_server_fingerprint(data: Dict[str, Any]) -> Tuple[str, Tuple[str, ...], str]:
+        """Build the (row_count, column_names, result_hash) fingerprint from a build_fingerprint_sql result."""
+        row_count, result_hash, columns = data["rows"][0]
+        if isinstance(columns, str):
+            columns = json.loads(columns)
+        return str(row_count), tuple(columns or ()), str(result_hash)
     
     def find_majority(self, items: List) -> Optional[Any]:
         """Find the most common item if it appears more than once"""
@@ -95,8 +394,9 @@ class SQLGenerator:
         winner, freq = counts.most_common(1)[0]
         return winner if freq > 1 else None
     
-    async def fetch_completion(self, prompt: str, session: aiohttp.ClientSession,
-                              index: int, system_message: str = "You are a professional SQL programmer.") -> Optional[Tuple[str, Dict[str, int]]]:
+    async def fetch_completion(self, prompt: str, index: int,
+                               system_message: str = "You are a professional SQL programmer.",
+                               priority: int = PRIORITY_GENERATION) -> Optional[Tuple[str, Dict[str, int]]]:
         """Fetch a single completion from the LLM
 
         Returns:
@@ -105,70 +405,133 @@ class SQLGenerator:
         """
         logger.debug(f"[{index}] Tokens in prompt: {len(self.tokenizer.encode(prompt))}")
 
-        headers = {
-            "api-key": self.config.azure_api_key,
-            "Content-Type": CONTENT_TYPE
-        }
+        try:
+            data = await self.llm.chat(
+                [
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=self.config.temperature,
+                priority=priority,
+            )
+        except AzureOpenAIError as e:
+            logger.error(f"[{index}] Error: {e.status}")
+            logger.error(e.body)
+            return None
 
-        endpoint = f"{self.config.azure_endpoint}/openai/deployments/{self.config.azure_deployment}/chat/completions?api-version={self.config.azure_api_version}"
+        usage = data.get('usage', {})
+        logger.debug(f"[{index}] Tokens used: {usage.get('total_tokens', 0)}")
+        return data["choices"][0]["message"]["content"], usage
+    
+    def _use_n(self, k: int) -> bool:
+        """Check whether k samples should be requested in one call with n=k."""
+        return self.config.sample_with_n and self._n_supported and k > 1
 
-        json_data: Dict[str, Any] = {
-            "messages": [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": prompt}
-            ]
-        }
-        if self.config.supports_temperature:
-            json_data["temperature"] = self.config.temperature
-        
-        async with session.post(
-            endpoint,
-            headers=headers,
-            json=json_data
-        ) as response:
-            if response.status != 200:
-                logger.error(f"[{index}] Error: {response.status}")
-                logger.error(await response.text())
+    @staticmethod
+    def _rejects_n(error: AzureOpenAIError) -> bool:
+        """Check whether a 400 response is the deployment refusing the n parameter."""
+        if error.status != 400:
+            return False
+        try:
+            details = json.loads(error.body).get("error", {})
+        except (ValueError, AttributeError):
+            details = {}
+        return details.get("param") == "n" or "'n'" in error.body or '"n"' in error.body
+
+    async def fetch_completions_n(self, prompt: str, k: int, start: int = 0) -> Optional[List]:
+        """
+        Fetch k completions of one prompt in a single request using n=k.
+
+        The prompt is sent and billed once. The request's usage is attributed
+        to the first completion so _aggregate_token_usage still sums correctly.
+
+        Returns:
+            List of k results shaped like fetch_completion's (None for a missing
+            or failed choice), or None if the deployment rejects n; the caller
+            should then fall back to k separate requests.
+        """
+        logger.debug(f"[{start}-{start + k - 1}] Tokens in prompt: {len(self.tokenizer.encode(prompt))}, n={k}")
+
+        try:
+            data = await self.llm.chat(
+                [
+                    {"role": "system", "content": "You are a professional SQL programmer."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=self.config.temperature,
+                priority=PRIORITY_GENERATION,
+                n=k,
+            )
+        except AzureOpenAIError as e:
+            if self._rejects_n(e):
+                logger.warning(f"Deployment rejected n={k}, falling back to parallel requests: {e}")
+                self._n_supported = False
                 return None
+            logger.error(f"[{start}-{start + k - 1}] Error: {e.status}")
+            logger.error(e.body)
+            return [None] * k
+
+        usage = data.get('usage', {})
+        logger.debug(f"[{start}-{start + k - 1}] Tokens used: {usage.get('total_tokens', 0)}")
+        results: List = [None] * k
+        for position, choice in enumerate(sorted(data["choices"], key=lambda c: c.get("index", 0))[:k]):
+            content = choice.get("message", {}).get("content")
+            if content:
+                results[position] = (content, usage if position == 0 else {})
+        if results[0] is None and usage:
+            # Keep the request's usage even when the first choice is empty
+            results[0] = ("", usage)
+        return results
 
-            data = await response.json()
-            usage = data.get('usage', {})
-            logger.debug(f"[{index}] Tokens used: {usage.get('total_tokens', 0)}")
-            return data["choices"][0]["message"]["content"], usage
-    
     def load_examples(self) -> List[str]:
-        """Load example queries for few-shot prompting"""
+        """Get the formatted example queries for few-shot prompting"""
+        return self.example_corpus.formatted
+    
+    async def select_examples(self, question: str,
+                              question_embedding: Optional[List[float]] = None) -> str:
+        """
+        Pick the few-shot examples most similar to a question.
+
+        Args:
+            question: Natural language question
+            question_embedding: Embedding of the question from the semantic
+                cache lookup. Selection is skipped without one, so it never
+                costs an extra embedding call.
+
+        Returns:
+            The rendered examples block. All examples are used when selection
+            is disabled, no embedding is available, the corpus already fits,
+            or selection fails.
+        """
+        top_n = config.app.few_shot_top_n
+        token_budget = config.app.few_shot_token_budget
+        if (not config.app.few_shot_selection_enabled or question_embedding is None
+                or self.example_corpus.fits(top_n, token_budget)):
+            return self.example_corpus.rendered
+
+        loop = asyncio.get_running_loop()
         try:
-            with open("QDECOMP_examples.json", "r") as file:
-                examples = json.load(file)
-            
-            formatted = []
-            for ex in examples:
-                newline = '\n'
-                metadata_dict = {
-                    'title': ex['title'],
-                    'x_axis': ex['x_axis'], 
-                    'y_axis': ex['y_axis'],
-                    'visualization_options': ex['visualization_options']
-                }
-                formatted.append(
-                    f"### Schema:{newline}{newline.join(ex['Schema'])}{newline}"
-                    f"### Question:{newline}{ex['Question']}{newline}"
-                    f"### Reasoning:{newline}{ex['Reasoning']}{newline}"
-                    f"### SQL:{newline}{ex['SQL']}{newline}"
-                    f"### Metadata:{newline}{json.dumps(metadata_dict)}"
+            examples_block, count = await loop.run_in_executor(
+                None, lambda: self.example_corpus.select(
+                    question_embedding, self.embeddings.embedding_model.embed_documents,
+                    top_n, token_budget
                 )
-            return formatted
-        except FileNotFoundError:
-            logger.warning("QDECOMP_examples.json not found, using empty examples")
-            return []
-    
+            )
+        except Exception as e:
+            logger.warning(f"Few-shot example selection failed, using all examples: {e}")
+            return self.example_corpus.rendered
+
+        logger.info(f"Using {count} of {len(self.example_corpus.examples)} few-shot examples")
+        return examples_block
+
     def build_prompt(self, question: str, schemas: str,
                     past_questions: List[Dict], is_retry: bool = False,
                     retry_error_type: Optional[str] = None,
-                    retry_error_detail: Optional[str] = None) -> str:
-        """Build the prompt for SQL generation"""
-        examples = self.load_examples()
+                    retry_error_detail: Optional[str] = None,
+                    examples_block: Optional[str] = None) -> str:
+        """Build the prompt for SQL generation, using all examples unless examples_block is given"""
+        if examples_block is None:
+            examples_block = self.example_corpus.rendered
         newline = '\n'
 
         # Add past question context if available
@@ -209,25 +572,13 @@ class SQLGenerator:
                 )
 
         prompt = (
-            f"{f'{newline}{newline}'.join(examples)}{newline}{newline}"
+            f"{examples_block}{newline}{newline}"
             f"### Schema:{newline}{schemas}{newline}"
             f"### Question:{newline}"
             f"The current date is {dt.datetime.now().strftime('%Y-%m-%d')}. "
             f"{past_context}"
             f"{retry_context}"
-            f"Please generate SQL and metadata for the following question, with reasoning but no explanation.{newline}"
-            f"{newline}"
-            f"Rules:{newline}"
-            f"- The schema context above is divided into sections: PUBLIC TABLES, WORKSHEET VIEWS, and SCORESHEET VIEWS.{newline}"
-            f"- Use PUBLIC TABLES for application-level data (applicants, applications, statuses, funding amounts).{newline}"
-            f"- Use WORKSHEET VIEWS for program-specific form data and custom applicant fields collected on worksheets.{newline}"
-            f"- Use SCORESHEET VIEWS for evaluation, scoring, reviewer assessments, or scorecard data.{newline}"
-            f"- Do not mix WORKSHEET VIEWS and SCORESHEET VIEWS in the same query unless explicitly requested; prefer JOINing via a shared applicant or application identifier.{newline}"
-            f"- When using columns from WORKSHEET VIEWS or SCORESHEET VIEWS that have type/Text but contain numeric values (e.g. currency amounts), "
-            f"always cast them using ::numeric before applying any aggregation (e.g. SUM(\"m2Cost\"::numeric)).{newline}"
-            f"- When using type/Text date columns from WORKSHEET VIEWS or SCORESHEET VIEWS, cast them using ::date when filtering or ordering by date.{newline}"
-            f"- Enable the map visualization option only for questions involving regional districts.{newline}"
-            f"{newline}"
+            f"{PROMPT_INSTRUCTIONS}"
             f"Question: {question}{newline}"
             f"### Reasoning:"
         )
@@ -235,10 +586,17 @@ class SQLGenerator:
         
         return prompt
     
-    def _process_completion(self, completion_result, db_id: int,
-                           tenant_id: Optional[str] = None,
-                           errors: Optional[List[str]] = None) -> Optional[Tuple]:
-        """Process a single LLM completion, returning (fingerprint, sql, metadata) or None."""
+    async def _process_completion(self, completion_result, db_id: int,
+                                  metabase: AsyncMetabaseClient,
+                                  tenant_id: Optional[str] = None,
+                                  errors: Optional[List[str]] = None,
+                                  gate: Optional[asyncio.Future] = None) -> Optional[Tuple]:
+        """
+        Process a single LLM completion, returning (fingerprint, sql, metadata, preview) or None.
+
+        If gate is given, nothing is sent to Metabase until it resolves, and
+        the completion is dropped if it resolves falsy.
+        """
         if not completion_result:
             return None
 
@@ -255,22 +613,51 @@ class SQLGenerator:
             logger.debug("No metadata found in completion")
             return None
 
-        # Validate SQL
-        is_valid, error = self.metabase.validate_sql(sql, db_id, tenant_id=tenant_id)
+        if gate is not None and not await gate:
+            return None
+
+        # Reject expensive candidates from the plan alone, before any execution.
+        # A cached validation result means the SQL already ran within the limits.
+        already_validated = metabase.result_cache.contains(self._validation_sql(sql), db_id, tenant_id)
+        if config.metabase.cost_guard_enabled and not already_validated:
+            try:
+                rejection = await self.check_query_cost(sql, db_id, metabase, tenant_id=tenant_id)
+            except Exception as e:
+                # Fails open: the statement timeout still bounds the execution
+                self.cost_guard_failures += 1
+                logger.warning(
+                    f"Cost guard check failed ({self.cost_guard_failures} so far), "
+                    f"executing unchecked: {e}", exc_info=True
+                )
+                rejection = None
+
+            if rejection:
+                logger.warning(f"SQL rejected by cost guard: {rejection}\nFor sql: {sql}")
+                if errors is not None:
+                    errors.append(rejection)
+                return None
+
+        # Validate and fingerprint with one execution
+        try:
+            is_valid, error, fingerprint, preview = await self.validate_and_fingerprint(
+                sql, db_id, metabase, tenant_id=tenant_id
+            )
+        except Exception as e:
+            logger.error(f"Error generating fingerprint: {e}", exc_info=True)
+            return None
+
         if not is_valid:
             logger.warning(f"SQL validation failed: {error}\nFor sql: {sql}")
             if errors is not None:
                 errors.append(error)
             return None
 
-        # Generate fingerprint
-        try:
-            fingerprint = self.fingerprint_results(sql, db_id, tenant_id=tenant_id)
-            return (fingerprint, sql, metadata)
-        except Exception as e:
-            logger.error(f"Error generating fingerprint: {e}", exc_info=True)
+        if fingerprint is None:
+            logger.error("Error generating fingerprint: query did not complete in time")
             return None
 
+        return (fingerprint, sql, metadata, preview)
+
     def _aggregate_token_usage(self, completions) -> Dict[str, int]:
         """Sum token usage across all completions."""
         total_prompt = 0
@@ -293,26 +680,214 @@ class SQLGenerator:
             "total_tokens": total
         }
 
-    def _select_best_candidate(self, candidates: List[Tuple]) -> Tuple[str, Dict]:
-        """Pick the majority-vote winner or fall back to the first candidate."""
-        fingerprints = [fp for fp, _, _ in candidates]
+    def _select_best_candidate(self, candidates: List[Tuple]) -> Tuple[str, Dict, Optional[Dict]]:
+        """Pick the majority-vote winner or fall back to the first candidate.
+
+        Returns (sql, metadata, preview) for the chosen candidate.
+        """
+        fingerprints = [fp for fp, _, _, _ in candidates]
         winner_fp = self.find_majority(fingerprints)
 
         if winner_fp:
             # Return the first candidate with winning fingerprint
-            for fp, sql, metadata in candidates:
+            for fp, sql, metadata, preview in candidates:
                 if fp == winner_fp:
                     logger.info(f"Majority vote winner: {sql[:100]}...")
-                    return sql, metadata
+                    return sql, metadata, preview
 
         # Fallback to first valid candidate
         logger.info("No majority, using first candidate")
-        return candidates[0][1], candidates[0][2]
+        _, sql, metadata, preview = candidates[0]
+        return sql, metadata, preview
+
+    async def _vote_as_completed(self, prompt: str, db_id: int, metabase: AsyncMetabaseClient,
+                                 tenant_id: Optional[str] = None,
+                                 errors: Optional[List[str]] = None,
+                                 k: Optional[int] = None, start: int = 0,
+                                 prior: Optional[List[Tuple]] = None,
+                                 gate: Optional[asyncio.Future] = None) -> Tuple[List, List[Tuple]]:
+        """
+        Fetch k completions (k_samples by default) and validate each one as soon as it lands.
+
+        Stops once vote_quorum candidates share a fingerprint and cancels the
+        completions and validations still outstanding. Candidates from an
+        earlier batch (prior) count towards the quorum.
+
+        Returns:
+            Tuple of (completions, candidates). completions holds the results
+            that finished (for token usage); candidates are in arrival order,
+            so the first-candidate fallback picks the earliest valid one.
+        """
+        k = k or self.config.k_samples
+        prior = prior or []
+        quorum = max(1, min(self.config.vote_quorum, k + len(prior)))
+        if self._use_n(k):
+            # One n=k request, keyed by -1; its choices are validated as they are parsed
+            fetching = {asyncio.create_task(self.fetch_completions_n(prompt, k, start)): -1}
+        else:
+            fetching = {
+                asyncio.create_task(self.fetch_completion(prompt, i)): i
+                for i in range(start, start + k)
+            }
+        processing: Dict[asyncio.Task, int] = {}
+        completions: List = []
+        candidates: List[Tuple] = []
+        votes: Counter = Counter(fp for fp, _, _, _ in prior)
+
+        try:
+            while fetching or processing:
+                done, _ = await asyncio.wait(
+                    set(fetching) | set(processing), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task in fetching:
+                        index = fetching.pop(task)
+                        if index >= 0:
+                            batch = [(index, task.result())]
+                        elif task.result() is None:
+                            fetching.update({
+                                asyncio.create_task(self.fetch_completion(prompt, i)): i
+                                for i in range(start, start + k)
+                            })
+                            continue
+                        else:
+                            batch = list(enumerate(task.result(), start))
+                        for i, completion in batch:
+                            completions.append(completion)
+                            processing[asyncio.create_task(self._process_completion(
+                                completion, db_id, metabase, tenant_id=tenant_id, errors=errors, gate=gate
+                            ))] = i
+                        continue
+
+                    processing.pop(task)
+                    candidate = task.result()
+                    if candidate is None:
+                        continue
+                    candidates.append(candidate)
+                    votes[candidate[0]] += 1
+                    if votes[candidate[0]] >= quorum:
+                        logger.info(
+                            f"Quorum of {quorum} reached after {len(completions)}/{k} completions, "
+                            f"cancelling {len(fetching) + len(processing)} outstanding tasks"
+                        )
+                        return completions, candidates
+        finally:
+            outstanding = list(fetching) + list(processing)
+            for task in outstanding:
+                task.cancel()
+            await asyncio.gather(*outstanding, return_exceptions=True)
+
+        return completions, candidates
+
+    async def _sample_candidates(self, prompt: str, k: int, db_id: int, metabase: AsyncMetabaseClient,
+                                 tenant_id: Optional[str] = None,
+                                 errors: Optional[List[str]] = None, start: int = 0,
+                                 prior: Optional[List[Tuple]] = None,
+                                 gate: Optional[asyncio.Future] = None) -> Tuple[List, List[Tuple]]:
+        """
+        Fetch k completions and turn the valid ones into candidates.
+
+        Returns:
+            Tuple of (completions, candidates) as in _vote_as_completed. In
+            "all" vote mode candidates keep completion order.
+        """
+        if self.config.vote_mode == "early":
+            return await self._vote_as_completed(
+                prompt, db_id, metabase, tenant_id=tenant_id, errors=errors,
+                k=k, start=start, prior=prior, gate=gate
+            )
+
+        completions = await self.fetch_completions_n(prompt, k, start) if self._use_n(k) else None
+        if completions is None:
+            completions = await asyncio.gather(*[
+                self.fetch_completion(prompt, i)
+                for i in range(start, start + k)
+            ])
+        # Validate and fingerprint all completions concurrently, collecting validation errors.
+        # gather preserves completion order, so the first-candidate fallback is unchanged.
+        processed = await asyncio.gather(*[
+            self._process_completion(completion_result, db_id, metabase,
+                                     tenant_id=tenant_id, errors=errors, gate=gate)
+            for completion_result in completions
+        ])
+        return list(completions), [c for c in processed if c is not None]
+
+    def _choose_sample_count(self, schemas: str, past_questions: List[Dict],
+                             is_retry: bool = False) -> Tuple[int, str]:
+        """
+        Pick the number of completions to start with.
+
+        Retries, follow-up questions and prompts that include worksheet or
+        scoresheet views start at k_samples; anything else starts at k_initial
+        and escalates only if the first batch does not settle the vote.
+
+        Returns:
+            Tuple of (k, reason)
+        """
+        k_max = self.config.k_samples
+        if not self.config.adaptive_sampling:
+            return k_max, "fixed"
+        if is_retry:
+            return k_max, "retry"
+        if past_questions and len(past_questions) > 1:
+            return k_max, "follow_up"
+        if "=== WORKSHEET VIEWS ===" in schemas or "=== SCORESHEET VIEWS ===" in schemas:
+            return k_max, "custom_views"
+        return min(max(2, self.config.k_initial), k_max), "simple"
+
+    @staticmethod
+    def _unsettled_reason(candidates: List[Tuple], sampled: int,
+                          quorum: Optional[int] = None) -> Optional[str]:
+        """
+        Return why a batch needs escalation, or None if it settled.
+
+        A batch settles when a quorum of candidates agreed (early vote mode
+        stops there, so fewer than sampled candidates are expected) or when
+        every one of the sampled completions produced the same fingerprint.
+        """
+        votes = Counter(fp for fp, _, _, _ in candidates)
+        if quorum and votes and max(votes.values()) >= quorum:
+            return None
+        if len(candidates) < sampled:
+            return "invalid_candidates"
+        if len({fp for fp, _, _, _ in candidates}) > 1:
+            return "disagreement"
+        return None
+
+    async def _check_relevance(self, question: str, schemas: str) -> bool:
+        """Ask the LLM whether the question is related to the retrieved schemas."""
+        parsed_schema = await self.fetch_completion(
+            f'''Your ONLY task is to decide if the question is related to the database schema.
+DO NOT generate SQL.
+DO NOT explain anything.
+DO NOT infer missing information.
+Output EXACTLY one word: RELATED or UNRELATED.
+
+<question>{question}</question>
+<schema>{schemas}</schema>''',
+            0,
+            system_message="You are a schema relevance filter. Output only RELATED or UNRELATED.",
+            priority=PRIORITY_RELEVANCE
+        )
+
+        if not parsed_schema:
+            logger.error("Schema parsing failed — no completion returned")
+            return False
+
+        logger.debug(f"[RelevanceCheck] Schema: {schemas}")
+        logger.info(f"[RelevanceCheck] Q: {question!r} | Raw: {parsed_schema[0]!r}")
+
+        if parsed_schema[0].strip().upper() != "RELATED":
+            logger.error("Error: NSFW or irrelevant question.", exc_info=True)
+            return False
+        return True
 
     async def generate_sql(self, question: str, past_questions: List[Dict],
                           db_id: int, tenant_id: Optional[str] = None,
                           is_retry: bool = False, retry_error_type: Optional[str] = None,
-                          retry_error_detail: Optional[str] = None) -> Tuple[Optional[str], Optional[Dict], Optional[Dict], Optional[str]]:
+                          retry_error_detail: Optional[str] = None,
+                          question_embedding: Optional[List[float]] = None
+                          ) -> Tuple[Optional[str], Optional[Dict], Optional[Dict], Optional[str], Optional[Dict]]:
         """
         Generate SQL from natural language question using majority voting.
 
@@ -325,12 +900,17 @@ class SQLGenerator:
             retry_error_type: Error type from the previous attempt, if retrying
             retry_error_detail: Validation error detail from the previous attempt,
                 fed back into the prompt to guide a corrected query
+            question_embedding: Embedding of the question, reused to select
+                few-shot examples when available
 
         Returns:
-            Tuple of (sql, metadata, token_usage, error_detail). On failure the
-            leading elements are None; error_detail carries any validation error
-            text when no valid candidate could be generated.
-            token_usage contains prompt_tokens, completion_tokens, total_tokens.
+            Tuple of (sql, metadata, token_usage, error_detail, preview). On
+            failure the leading elements are None; error_detail carries any
+            validation error text when no valid candidate could be generated.
+            token_usage contains prompt_tokens, completion_tokens, total_tokens,
+            and the number of samples drawn with the reason (samples, sample_reason).
+            preview holds the winning candidate's result rows (capped to
+            preview_row_limit) from fingerprinting, or None if unavailable.
         """
 
         # Check for hardcoded examples first (can be removed in production)
@@ -338,60 +918,70 @@ class SQLGenerator:
         if hardcoded:
             # Hardcoded examples have no token usage
             sql, metadata = hardcoded
-            return sql, metadata, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}, None
+            return sql, metadata, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}, None, None
 
         # Get relevant schemas
         schemas = self.embeddings.get_formatted_schemas(question, db_id, tenant_id=tenant_id)
         if not schemas:
             logger.error(f"No schemas found for db_id={db_id}. Embeddings may not have been generated yet.")
-            return None, None, None, None
+            return None, None, None, None, None
 
-        # Generate multiple completions in parallel
-        async with aiohttp.ClientSession() as session:
-            parsed_schema = await self.fetch_completion(
-                f'''Your ONLY task is to decide if the question is related to the database schema.
-DO NOT generate SQL.
-DO NOT explain anything.
-DO NOT infer missing information.
-Output EXACTLY one word: RELATED or UNRELATED.
+        validation_errors: List[str] = []
 
-<question>{question}</question>
-<schema>{schemas}</schema>''',
-                session, 0,
-                system_message="You are a schema relevance filter. Output only RELATED or UNRELATED."
+        async def generate(gate: Optional[asyncio.Future] = None):
+            """Build the prompt, sample completions and escalate when the first batch is unsettled."""
+            examples_block = await self.select_examples(question, question_embedding)
+            prompt = self.build_prompt(question, schemas, past_questions, is_retry=is_retry,
+                                       retry_error_type=retry_error_type, retry_error_detail=retry_error_detail,
+                                       examples_block=examples_block)
+            logger.debug(f"Prompt: {prompt[:200]}...")
+            k, sample_reason = self._choose_sample_count(schemas, past_questions, is_retry=is_retry)
+            metabase = AsyncMetabaseClient()
+            completions, candidates = await self._sample_candidates(
+                prompt, k, db_id, metabase, tenant_id=tenant_id, errors=validation_errors, gate=gate
             )
 
-            if not parsed_schema:
-                logger.error("Schema parsing failed — no completion returned")
-                return None, None, None, None
+            # Escalate to the full sample count when the small batch is not settled
+            remaining = self.config.k_samples - k
+            quorum = max(1, min(self.config.vote_quorum, k)) if self.config.vote_mode == "early" else None
+            escalation = self._unsettled_reason(candidates, len(completions), quorum) if remaining > 0 else None
+            if escalation:
+                logger.info(f"Escalating from {k} to {self.config.k_samples} samples: {escalation}")
+                more_completions, more_candidates = await self._sample_candidates(
+                    prompt, remaining, db_id, metabase, tenant_id=tenant_id, errors=validation_errors,
+                    start=k, prior=candidates, gate=gate
+                )
+                completions += more_completions
+                candidates += more_candidates
+                k = self.config.k_samples
+                sample_reason = f"{sample_reason}+{escalation}"
+            return completions, candidates, k, sample_reason
 
-            print("Schema:", schemas)
-            print("Parsed Schema:", parsed_schema[0])
-            logger.info(f"[RelevanceCheck] Q: {question!r} | Raw: {parsed_schema[0]!r}")
+        # Generate multiple completions in parallel
+        relevance = asyncio.create_task(self._check_relevance(question, schemas))
+        # Speculatively start generation; candidates wait on the relevance
+        # result before any SQL is sent to Metabase
+        generation = (
+            asyncio.create_task(generate(gate=relevance))
+            if self.config.speculative_relevance else None
+        )
+        related = False
+        try:
+            related = await relevance
+        finally:
+            if generation is not None and not related:
+                generation.cancel()
+                await asyncio.gather(generation, return_exceptions=True)
 
-            if parsed_schema[0].strip().upper() != "RELATED":
-                logger.error("Error: NSFW or irrelevant question.", exc_info=True)
-                return None, None, None, None
+        if not related:
+            return None, None, None, None, None
 
-            # Build prompt
-            prompt = self.build_prompt(question, schemas, past_questions, is_retry=is_retry,
-                                       retry_error_type=retry_error_type, retry_error_detail=retry_error_detail)
-            logger.debug(f"Prompt: {prompt[:200]}...")
-            tasks = [
-                self.fetch_completion(prompt, session, i)
-                for i in range(self.config.k_samples)
-            ]
-            completions = await asyncio.gather(*tasks)
+        completions, candidates, k, sample_reason = await (generation or generate())
 
         # Aggregate token usage from all completions
         token_usage = self._aggregate_token_usage(completions)
-
-        # Process completions and extract valid candidates, collecting validation errors
-        validation_errors: List[str] = []
-        candidates = [
-            c for completion_result in completions
-            if (c := self._process_completion(completion_result, db_id, tenant_id=tenant_id, errors=validation_errors)) is not None
-        ]
+        token_usage["samples"] = k
+        token_usage["sample_reason"] = sample_reason
 
         # Join top 2 errors, truncate to keep prompt focused
         MAX_ERROR_DETAIL_LENGTH = 200
@@ -400,11 +990,11 @@ Output EXACTLY one word: RELATED or UNRELATED.
 
         if not candidates:
             logger.warning(f"No valid candidates generated. Error detail: {error_detail}")
-            return None, None, token_usage, error_detail
+            return None, None, token_usage, error_detail, None
 
         # Majority voting on fingerprints
-        sql, metadata = self._select_best_candidate(candidates)
-        return sql, metadata, token_usage, None
+        sql, metadata, preview = self._select_best_candidate(candidates)
+        return sql, metadata, token_usage, None, preview
     
     def _check_hardcoded_examples(self, question: str) -> Optional[Tuple[str, Dict]]:
         """Check for hardcoded example queries (for demo/testing)"""
@@ -565,36 +1155,22 @@ ORDER BY
 
 {sql}"""
             
-            headers = {
-                "api-key": self.config.azure_api_key,
-                "Content-Type": CONTENT_TYPE
-            }
-
-            endpoint = f"{self.config.azure_endpoint}/openai/deployments/{self.config.azure_deployment}/chat/completions?api-version={self.config.azure_api_version}"
+            try:
+                data = await self.llm.chat(
+                    [
+                        {"role": "system", "content": "You are a helpful assistant that explains SQL queries in simple terms."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=0.3,
+                    priority=PRIORITY_EXPLANATION,
+                )
+            except AzureOpenAIError as e:
+                logger.error(f"Error explaining SQL: {e.status}")
+                return "This query retrieves and analyzes your data.", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
 
-            json_data: Dict[str, Any] = {
-                "messages": [
-                    {"role": "system", "content": "You are a helpful assistant that explains SQL queries in simple terms."},
-                    {"role": "user", "content": prompt}
-                ]
-            }
-            if self.config.supports_temperature:
-                json_data["temperature"] = 0.3
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    endpoint,
-                    headers=headers,
-                    json=json_data
-                ) as response:
-                    if response.status != 200:
-                        logger.error(f"Error explaining SQL: {response.status}")
-                        return "This query retrieves and analyzes your data.", {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
-
-                    data = await response.json()
-                    explanation = data["choices"][0]["message"]["content"].strip()
-                    usage = data.get('usage', {})
-                    return explanation, usage
+            explanation = data["choices"][0]["message"]["content"].strip()
+            usage = data.get('usage', {})
+            return explanation, usage
 
         except Exception as e:
             logger.error(f"Error generating SQL explanation: {e}", exc_info=True)
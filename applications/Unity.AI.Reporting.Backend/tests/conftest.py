@@ -0,0 +1,153 @@
+"""
+Shared fixtures for the backend tests.
+Run from applications/Unity.AI.Reporting.Backend with `python -m pytest`.
+"""
+import asyncio
+import copy
+import os
+import sys
+import threading
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "src"))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "tools"))
+
+from config import config, DEFAULT_TENANT  # noqa: E402
+
+
+@pytest.fixture
+def tenant_api_key(monkeypatch):
+    """Give the default tenant a Metabase API key, as tenant_config.local.json would."""
+    tenant = dict(config.tenant_mappings[DEFAULT_TENANT], api_key="test")
+    monkeypatch.setitem(config.tenant_mappings, DEFAULT_TENANT, tenant)
+    return tenant
+
+
+@pytest.fixture
+def fake_metabase(monkeypatch, tmp_path, tenant_api_key):
+    """
+    Factory that starts tools/fake_metabase.py on the demo database and
+    points config.metabase.url at it. Keyword arguments go to FakeMetabase.
+    """
+    from aiohttp import web
+    import fake_metabase as fm
+
+    db_path = str(tmp_path / "demo.db")
+    fm.create_demo_database(db_path, rows=200, seed=1)
+    servers = []
+
+    def start(**options):
+        settings = dict(latency=0.0, query_latency=0.0, jitter=0.0, async_rate=0.0,
+                        async_duration=0.0, error_rate=0.0, error_status=503,
+                        query_error_rate=0.0, seed=1)
+        settings.update(options)
+        fake = fm.FakeMetabase(fm.SQLiteBackend(db_path, ["public"], 100.0, 100.0), **settings)
+
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(fake.build_app())
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        servers.append((loop, runner))
+
+        monkeypatch.setattr(config.metabase, "url", f"http://127.0.0.1:{port}")
+        return fake
+
+    yield start
+
+    for loop, runner in servers:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result(timeout=5)
+        loop.call_soon_threadsafe(loop.stop)
+
+
+class MemoryCardDedup:
+    """In-memory stand-in for database.CardDedupRepository (which needs Postgres)."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def _find(self, tenant_id, card_id):
+        return next((k for k, v in self.entries.items() if k[0] == tenant_id and v[0] == card_id), None)
+
+    def acquire(self, tenant_id, collection_id, sql_hash, viz_hash):
+        key = (tenant_id, collection_id, sql_hash, viz_hash)
+        if key not in self.entries:
+            return None
+        card_id, refs = self.entries[key]
+        self.entries[key] = (card_id, refs + 1)
+        return card_id
+
+    def register(self, tenant_id, collection_id, sql_hash, viz_hash, card_id):
+        self.entries[(tenant_id, collection_id, sql_hash, viz_hash)] = (card_id, 1)
+
+    def release(self, tenant_id, card_id):
+        key = self._find(tenant_id, card_id)
+        if key is None:
+            return 0
+        remaining = self.entries[key][1] - 1
+        if remaining <= 0:
+            del self.entries[key]
+            return 0
+        self.entries[key] = (card_id, remaining)
+        return remaining
+
+    def forget(self, tenant_id, card_id):
+        key = self._find(tenant_id, card_id)
+        if key is not None:
+            del self.entries[key]
+
+    def ref_count(self, tenant_id, card_id):
+        key = self._find(tenant_id, card_id)
+        return self.entries[key][1] if key is not None else 0
+
+    def update_visualization(self, tenant_id, card_id, viz_hash):
+        key = self._find(tenant_id, card_id)
+        if key is None:
+            return
+        entry = self.entries.pop(key)
+        new_key = key[:3] + (viz_hash,)
+        if new_key not in self.entries:
+            self.entries[new_key] = entry
+
+
+@pytest.fixture
+def card_dedup(monkeypatch):
+    """Swap the card_dedup registry used by metabase.py for an in-memory one."""
+    import metabase
+
+    registry = MemoryCardDedup()
+    monkeypatch.setattr(metabase, "card_dedup_repository", registry)
+    monkeypatch.setattr(metabase.metabase_client.card_registry, "_entries", {})
+    return registry
+
+
+class MemoryChatRepository:
+    """Stores conversations the way ChatRepository does, without Postgres."""
+
+    def __init__(self):
+        self.chats = {}
+
+    def get_chat(self, chat_id, user_id):
+        chat = self.chats.get((chat_id, user_id))
+        return copy.deepcopy(chat) if chat else None
+
+    def update_chat_cards(self, chat_id, user_id, conversation):
+        self.chats[(chat_id, user_id)]["conversation"] = copy.deepcopy(conversation)
+
+    def delete_chat(self, chat_id, user_id):
+        chat = self.chats.pop((chat_id, user_id), None)
+        return chat["conversation"] if chat else None
+
+
+@pytest.fixture
+def chat_manager(monkeypatch):
+    """A ChatManager storing chats in a MemoryChatRepository."""
+    from chat import ChatManager
+
+    manager = ChatManager()
+    monkeypatch.setattr(manager, "repository", MemoryChatRepository())
+    return manager
@@ -0,0 +1,33 @@
+"""AsyncMetabaseClient card creation and previews used by the /api/ask paths."""
+import asyncio
+
+from metabase import AsyncMetabaseClient
+
+SQL = 'SELECT "Status", COUNT(*) AS applications FROM "public"."Applications" GROUP BY "Status"'
+COLLECTION_ID = 1
+
+
+def test_get_or_create_card_reuses_registered_card(fake_metabase, card_dedup):
+    fake_metabase()
+
+    async def run():
+        metabase = AsyncMetabaseClient()
+        first = await metabase.get_or_create_card(SQL, 1, COLLECTION_ID, "By status")
+        second = await metabase.get_or_create_card(SQL, 1, COLLECTION_ID, "By status")
+        return first, second
+
+    (card_id, reused), (second_id, second_reused) = asyncio.run(run())
+
+    assert not reused
+    assert second_reused and second_id == card_id
+
+
+def test_fetch_preview_caps_rows_and_reports_total(fake_metabase):
+    fake_metabase()
+    sql = 'SELECT "Id" FROM "public"."Applications"'
+
+    preview = asyncio.run(AsyncMetabaseClient().fetch_preview(sql, 1, 5))
+
+    assert len(preview["rows"]) == 5
+    assert all(len(row) == 1 for row in preview["rows"])
+    assert preview["row_count"] > 5
@@ -0,0 +1,51 @@
+"""Restyling a card shared through the dedup registry by several chats."""
+from config import DEFAULT_TENANT
+from metabase import metabase_client
+
+SQL = 'SELECT "Status", COUNT(*) AS applications FROM "public"."Applications" GROUP BY "Status"'
+COLLECTION_ID = 1
+USER_ID = "user-1"
+
+
+def add_chat(repository, chat_id, card_id, title):
+    repository.chats[(chat_id, USER_ID)] = {
+        "tenant_id": DEFAULT_TENANT,
+        "conversation": [{"question": title, "embed": {"card_id": card_id, "SQL": SQL, "title": title}}],
+    }
+
+
+def stored_card_id(repository, chat_id):
+    return repository.chats[(chat_id, USER_ID)]["conversation"][0]["embed"]["card_id"]
+
+
+def test_answers_with_different_titles_share_a_card(fake_metabase, card_dedup):
+    fake_metabase()
+
+    card_id, _ = metabase_client.get_or_create_card(SQL, 1, COLLECTION_ID, "Applications by status")
+    shared_id, reused = metabase_client.get_or_create_card(SQL, 1, COLLECTION_ID, "Status breakdown")
+
+    assert reused and shared_id == card_id
+
+
+def test_restyling_shared_card_moves_only_the_restyling_chat(fake_metabase, card_dedup, chat_manager):
+    fake_metabase()
+    repository = chat_manager.repository
+
+    card_id, _ = metabase_client.get_or_create_card(SQL, 1, COLLECTION_ID, "Applications by status")
+    shared_id, _ = metabase_client.get_or_create_card(SQL, 1, COLLECTION_ID, "Status breakdown")
+    add_chat(repository, "chat-a", card_id, "Applications by status")
+    add_chat(repository, "chat-b", shared_id, "Status breakdown")
+
+    new_card_id = metabase_client.update_card_visualization(
+        card_id, "bar", ["Status"], ["applications"], name="Applications by status"
+    )
+    assert chat_manager.replace_card_ids("chat-a", USER_ID, {card_id: new_card_id})
+
+    assert new_card_id != card_id
+    assert stored_card_id(repository, "chat-a") == new_card_id
+    assert stored_card_id(repository, "chat-b") == card_id
+    assert metabase_client.get_card_exists(card_id) is True
+    assert metabase_client.get_card(new_card_id)["display"] == "bar"
+    assert metabase_client.get_card(card_id)["display"] == "table"
+    assert card_dedup.ref_count(DEFAULT_TENANT, card_id) == 1
+    assert card_dedup.ref_count(DEFAULT_TENANT, new_card_id) == 1
@@ -0,0 +1,52 @@
+"""Deleting a chat deletes its Metabase cards."""
+import pytest
+
+from config import DEFAULT_TENANT
+from metabase import metabase_client
+
+STATUS_SQL = 'SELECT "Status", COUNT(*) AS applications FROM "public"."Applications" GROUP BY "Status"'
+CITY_SQL = 'SELECT "City", COUNT(*) AS applicants FROM "public"."Applicants" GROUP BY "City"'
+COLLECTION_ID = 1
+USER_ID = "user-1"
+
+
+def add_chat(repository, chat_id, *card_ids):
+    repository.chats[(chat_id, USER_ID)] = {
+        "tenant_id": DEFAULT_TENANT,
+        "conversation": [{"question": "q", "embed": {"card_id": card_id}} for card_id in card_ids]
+        + [{"question": "no report"}],
+    }
+
+
+def test_delete_chat_deletes_its_cards_in_one_batch(fake_metabase, card_dedup, chat_manager, monkeypatch):
+    fake_metabase()
+    shared_id, _ = metabase_client.get_or_create_card(STATUS_SQL, 1, COLLECTION_ID, "By status")
+    metabase_client.get_or_create_card(STATUS_SQL, 1, COLLECTION_ID, "By status")
+    own_id, _ = metabase_client.get_or_create_card(CITY_SQL, 1, COLLECTION_ID, "By city")
+    add_chat(chat_manager.repository, "chat-a", shared_id, own_id)
+    add_chat(chat_manager.repository, "chat-b", shared_id)
+
+    batches = []
+    delete_cards = metabase_client.delete_cards
+
+    def record_batch(card_ids, tenant_id=None):
+        batches.append(list(card_ids))
+        return delete_cards(card_ids, tenant_id=tenant_id)
+
+    monkeypatch.setattr(metabase_client, "delete_cards", record_batch)
+
+    assert chat_manager.delete_chat("chat-a", USER_ID, tenant_id=DEFAULT_TENANT)
+
+    assert batches == [[shared_id, own_id]]
+    assert metabase_client.get_card_exists(own_id) is False
+    assert metabase_client.get_card_exists(shared_id) is True
+    assert card_dedup.ref_count(DEFAULT_TENANT, shared_id) == 1
+
+
+def test_delete_missing_chat_deletes_nothing(chat_manager, monkeypatch):
+    def fail(*args, **kwargs):
+        pytest.fail("delete_cards called for a missing chat")
+
+    monkeypatch.setattr(metabase_client, "delete_cards", fail)
+
+    assert not chat_manager.delete_chat("missing", USER_ID, tenant_id=DEFAULT_TENANT)
@@ -0,0 +1,65 @@
+"""Circuit breaker behaviour for Metabase calls abandoned at their statement timeout."""
+import asyncio
+
+import pytest
+
+from circuit_breaker import CLOSED, metabase_breaker
+from config import config, DEFAULT_TENANT
+from metabase import AsyncMetabaseClient, MetabaseClient
+
+SLOW_SQL = 'SELECT COUNT(*) FROM "public"."Applications"'
+
+
+@pytest.fixture(autouse=True)
+def reset_breaker():
+    metabase_breaker._circuits.clear()
+    yield
+    metabase_breaker._circuits.clear()
+
+
+def query_circuit_state():
+    return metabase_breaker.snapshot().get(f"{DEFAULT_TENANT}/query", {}).get("state", CLOSED)
+
+
+def test_async_statement_timeouts_leave_circuit_closed(fake_metabase):
+    fake_metabase(query_latency=1.0)
+    attempts = config.metabase.breaker_failure_threshold + 1
+
+    async def run():
+        metabase = AsyncMetabaseClient()
+        return [
+            await metabase.validate_and_execute(SLOW_SQL, 1, use_cache=False, statement_timeout=0.2)
+            for _ in range(attempts)
+        ]
+
+    results = asyncio.run(run())
+
+    assert all(not is_valid and "statement timeout" in error for is_valid, error, _ in results)
+    assert query_circuit_state() == CLOSED
+
+
+def test_sync_statement_timeouts_leave_circuit_closed(fake_metabase):
+    fake_metabase(query_latency=1.0)
+    client = MetabaseClient()
+    attempts = config.metabase.breaker_failure_threshold + 1
+
+    results = [
+        client.validate_sql(SLOW_SQL, 1, mode="full", statement_timeout=0.2)
+        for _ in range(attempts)
+    ]
+
+    assert all(not is_valid and "statement timeout" in error for is_valid, error in results)
+    assert query_circuit_state() == CLOSED
+
+
+def test_server_errors_still_open_circuit(fake_metabase):
+    fake_metabase(error_rate=1.0)
+
+    async def run():
+        metabase = AsyncMetabaseClient()
+        for _ in range(config.metabase.breaker_failure_threshold):
+            await metabase.validate_and_execute(SLOW_SQL, 1, use_cache=False, statement_timeout=5)
+
+    asyncio.run(run())
+
+    assert query_circuit_state() != CLOSED
@@ -0,0 +1,22 @@
+"""QueryResultCache storage rules."""
+from metabase import QueryResultCache
+
+SQL = "SELECT 1"
+
+
+def test_put_stores_complete_result():
+    cache = QueryResultCache(max_size=10, ttl=60, max_rows=100)
+    data = {"cols": [{"name": "n"}], "rows": [[1]]}
+
+    cache.put(SQL, 1, data)
+
+    assert cache.get(SQL, 1) == data
+
+
+def test_put_skips_row_capped_result():
+    cache = QueryResultCache(max_size=10, ttl=60, max_rows=100)
+    data = {"cols": [{"name": "n"}], "rows": [[1], [2]], "rows_truncated": 2, "row_count": 50}
+
+    cache.put(SQL, 1, data)
+
+    assert not cache.contains(SQL, 1)
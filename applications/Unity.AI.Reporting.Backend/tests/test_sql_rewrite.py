@@ -0,0 +1,87 @@
+"""SQL rewrites that nest generated SQL inside a wrapper query."""
+import sqlite3
+
+import pytest
+
+from metabase import (
+    PREVIEW_TOTAL_COLUMN, build_fingerprint_sql, build_preview_sql, build_validation_sql,
+    parse_preview, strip_sql,
+)
+from reporting_db import is_single_statement
+
+TRAILING_NOISE = [
+    "SELECT 1",
+    "SELECT 1;",
+    "  SELECT 1 ;; \n",
+    "SELECT 1; -- note",
+    "SELECT 1 -- note",
+    "SELECT 1 -- first\n-- second\n",
+    "SELECT 1 /* note */",
+    "SELECT 1; /* multi\nline */ ; -- and more",
+]
+
+
+@pytest.mark.parametrize("sql", TRAILING_NOISE)
+def test_strip_sql_removes_trailing_semicolons_and_comments(sql):
+    assert strip_sql(sql) == "SELECT 1"
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT '-- not a comment;'",
+    'SELECT 1 AS "a;--b"',
+    "SELECT $$ ; /* */ $$",
+    "SELECT E'it\\'s; -- fine'",
+    "SELECT 10 - 2 / 1",
+])
+def test_strip_sql_keeps_quoted_markers_and_operators(sql):
+    assert strip_sql(sql + "; -- note") == sql
+
+
+def test_strip_sql_keeps_inner_comments():
+    sql = "SELECT 1 -- one\n  + 2 /* two */ AS n"
+    assert strip_sql(sql + ";") == sql
+
+
+@pytest.mark.parametrize("sql, single", [
+    ("SELECT 1; -- note", True),
+    ("SELECT ';'; ", True),
+    ("SELECT 1; SELECT 2", False),
+    ("SELECT E'\\';' ; DROP TABLE t", False),
+])
+def test_is_single_statement(sql, single):
+    assert is_single_statement(sql) is single
+
+
+@pytest.mark.parametrize("sql", TRAILING_NOISE)
+def test_build_validation_sql(sql):
+    assert build_validation_sql(sql, "explain") == "EXPLAIN SELECT 1"
+    assert build_validation_sql(sql, "limit0") == "SELECT * FROM (\nSELECT 1\n) AS validation_q LIMIT 0"
+    assert build_validation_sql(sql, "full") == sql
+
+
+@pytest.mark.parametrize("sql", TRAILING_NOISE)
+def test_build_fingerprint_sql_nests_stripped_sql(sql):
+    wrapped = build_fingerprint_sql(sql)
+    assert wrapped.startswith("WITH fp_q AS (\nSELECT 1\n)\nSELECT\n")
+    assert is_single_statement(wrapped)
+
+
+def test_build_preview_sql_caps_rows_and_counts_all():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE t (n INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(n,) for n in range(25)])
+
+    cur = conn.execute(build_preview_sql("SELECT n FROM t ORDER BY n; -- all rows", 10))
+    cols = [{"name": d[0]} for d in cur.description]
+    preview = parse_preview({"cols": cols, "rows": [list(row) for row in cur.fetchall()]})
+
+    assert cols[-1]["name"] == PREVIEW_TOTAL_COLUMN
+    assert preview["cols"] == [{"name": "n"}]
+    assert preview["rows"] == [[n] for n in range(10)]
+    assert preview["row_count"] == 25
+
+
+def test_parse_preview_of_empty_result():
+    assert parse_preview({"cols": [{"name": "n"}, {"name": PREVIEW_TOTAL_COLUMN}], "rows": []}) == {
+        "cols": [{"name": "n"}], "rows": [], "row_count": 0,
+    }
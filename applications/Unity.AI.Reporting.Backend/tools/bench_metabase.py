@@ -0,0 +1,132 @@
+"""
+Throughput benchmark for candidate validation against Metabase.
+
+Runs the same validate_and_execute calls SQLGenerator makes for each
+candidate (optionally wrapped in build_fingerprint_sql, as in "server"
+fingerprint mode) at a fixed concurrency, and reports throughput, latency
+percentiles and failures. Point it at tools/fake_metabase.py for
+reproducible offline runs.
+
+Usage:
+    python tools/fake_metabase.py --demo-rows 5000 --latency 0.02 --async-rate 0.2 --seed 1
+    MB_URL=http://localhost:3001 python tools/bench_metabase.py --queries 500 --concurrency 8
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import statistics
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from config import config  # noqa: E402
+from metabase import (  # noqa: E402
+    AsyncMetabaseClient, build_fingerprint_sql, metabase_headers, metabase_http_session,
+)
+
+# Queries against the fake_metabase.py demo database
+DEMO_QUERIES = [
+    'SELECT "Status", COUNT(*) AS applications FROM "public"."Applications" GROUP BY "Status"',
+    'SELECT a."Sector", SUM(p."RequestedAmount") AS requested FROM "public"."Applications" p '
+    'JOIN "public"."Applicants" a ON a."Id" = p."ApplicantId" GROUP BY a."Sector"',
+    'SELECT "ProjectName", "ApprovedAmount" FROM "public"."Applications" '
+    'WHERE "Status" = \'Approved\' ORDER BY "ApprovedAmount" DESC LIMIT 20',
+    'SELECT "City", COUNT(*) AS applicants FROM "public"."Applicants" GROUP BY "City"',
+]
+
+
+def load_queries(path: Optional[str]) -> List[str]:
+    """Read ;-separated queries from a file, or use the demo queries."""
+    if not path:
+        return DEMO_QUERIES
+    with open(path, encoding="utf-8") as f:
+        return [q.strip() for q in f.read().split(";") if q.strip()]
+
+
+async def run(queries: List[str], total: int, concurrency: int, db_id: int,
+              server_fingerprint: bool, statement_timeout: Optional[float]
+              ) -> Tuple[List[float], int, float]:
+    """Run total validations, at most concurrency at a time; returns (latencies, failures, elapsed)."""
+    metabase = AsyncMetabaseClient(max_concurrency=concurrency)
+    workload = itertools.islice(itertools.cycle(queries), total)
+    latencies: List[float] = []
+    failures = 0
+
+    async def worker():
+        nonlocal failures
+        for sql in workload:
+            if server_fingerprint:
+                sql = build_fingerprint_sql(sql)
+            started = time.monotonic()
+            try:
+                is_valid, _, data = await metabase.validate_and_execute(
+                    sql, db_id, use_cache=False, statement_timeout=statement_timeout
+                )
+            except Exception as e:
+                logging.warning(f"Request failed: {e}")
+                is_valid, data = False, None
+            latencies.append(time.monotonic() - started)
+            if not is_valid or data is None:
+                failures += 1
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        # Closes the aiohttp ClientSession and stops its background loop
+        await asyncio.to_thread(metabase_http_session.close)
+    return latencies, failures, time.monotonic() - started
+
+
+def percentile(values: List[float], pct: int) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark candidate validation against Metabase")
+    parser.add_argument("--queries", type=int, default=200, help="Total validations to run")
+    parser.add_argument("--concurrency", type=int, default=config.metabase.async_max_concurrency,
+                        help="Validations in flight at once")
+    parser.add_argument("--db-id", type=int, default=1, help="Metabase database ID")
+    parser.add_argument("--sql-file", help="File of ;-separated queries (default: demo queries)")
+    parser.add_argument("--fingerprint-mode", choices=["rows", "server"],
+                        default=config.metabase.fingerprint_mode,
+                        help="Run the queries as-is or wrapped in build_fingerprint_sql")
+    parser.add_argument("--statement-timeout", type=float, default=None,
+                        help="Seconds before a validation is abandoned")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    latencies, failures, elapsed = asyncio.run(run(
+        load_queries(args.sql_file), args.queries, args.concurrency, args.db_id,
+        args.fingerprint_mode == "server", args.statement_timeout,
+    ))
+
+    print(f"{len(latencies)} validations in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.1f}/s, concurrency {args.concurrency})")
+    print(f"latency mean {statistics.mean(latencies) * 1000:.0f}ms, "
+          f"p50 {percentile(latencies, 50) * 1000:.0f}ms, "
+          f"p95 {percentile(latencies, 95) * 1000:.0f}ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.0f}ms")
+    print(f"failures {failures}")
+
+    # Request counters are only available from fake_metabase.py
+    try:
+        r = requests.get(f"{config.metabase.url}/api/fake/stats", headers=metabase_headers(), timeout=5)
+        if r.status_code == 200:
+            print(f"fake Metabase: {r.json()}")
+    except requests.exceptions.RequestException:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,547 @@
+"""
+Fake Metabase server for local tests and benchmarks.
+
+Implements the subset of the Metabase API used by the backend on top of a
+local SQLite file or Postgres database, with configurable latency, 202 async
+jobs and error injection, so metabase.py, SchemaExtractor and the SQL
+generation pipeline can be exercised offline and reproducibly.
+
+Usage:
+    python tools/fake_metabase.py --demo-rows 5000 --latency 0.02 --async-rate 0.2
+    MB_URL=http://localhost:3001 python src/app.py embed
+    MB_URL=http://localhost:3001 python tools/bench_metabase.py --queries 500
+
+Endpoints:
+    POST   /api/dataset                  run a native query
+    GET    /api/async/{id}               poll a job started with 202
+    GET    /api/card                     list cards
+    POST   /api/card                     create a card
+    GET    /api/card/{id}                get a card
+    PUT    /api/card/{id}                update a card
+    DELETE /api/card/{id}                delete a card
+    POST   /api/card/{id}/query          run a card's query
+    GET    /api/collection/{id}/items    list a collection's cards
+    GET    /api/database/{id}/metadata   tables and fields
+    GET    /api/fake/stats               request counters (fake-only)
+"""
+import argparse
+import asyncio
+import datetime as dt
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+# Configure logging
+logger = logging.getLogger("fake_metabase")
+
+# Metabase caps ad-hoc native query results at 2000 rows
+MAX_RESULT_ROWS = 2000
+
+EXPLAIN_JSON_PATTERN = re.compile(r"^\s*EXPLAIN\s*\(\s*FORMAT\s+JSON\s*\)\s*", re.I)
+EXPLAIN_PATTERN = re.compile(r"^\s*EXPLAIN\s+", re.I)
+# The aggregate metabase.build_fingerprint_sql wraps around a candidate
+FINGERPRINT_PATTERN = re.compile(
+    r"^WITH fp_q AS \(\n(?P<sql>.*)\n\)\nSELECT\n\s*\(SELECT COUNT\(\*\) FROM fp_q\) AS row_count,.*AS columns$",
+    re.S,
+)
+
+SQLITE_BASE_TYPES = {
+    "INTEGER": "type/Integer",
+    "INT": "type/Integer",
+    "BIGINT": "type/BigInteger",
+    "REAL": "type/Float",
+    "NUMERIC": "type/Decimal",
+    "TEXT": "type/Text",
+    "BOOLEAN": "type/Boolean",
+    "DATE": "type/Date",
+    "TIMESTAMP": "type/DateTime",
+}
+
+POSTGRES_BASE_TYPES = {
+    "integer": "type/Integer",
+    "bigint": "type/BigInteger",
+    "smallint": "type/Integer",
+    "numeric": "type/Decimal",
+    "real": "type/Float",
+    "double precision": "type/Float",
+    "text": "type/Text",
+    "character varying": "type/Text",
+    "boolean": "type/Boolean",
+    "date": "type/Date",
+    "timestamp without time zone": "type/DateTime",
+    "timestamp with time zone": "type/DateTimeWithTZ",
+    "uuid": "type/UUID",
+    "jsonb": "type/SerializedJSON",
+}
+
+
+class QueryError(Exception):
+    """SQL error reported back in the Metabase error body"""
+
+
+def _to_json_value(value: Any) -> Any:
+    """Convert a database value to the JSON form Metabase returns."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (dt.datetime, dt.date, dt.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    return value
+
+
+def _record_text(row: Tuple) -> str:
+    """Render a row like Postgres' record output, e.g. (1,"a b",)."""
+    fields = []
+    for value in row:
+        if value is None:
+            fields.append("")
+            continue
+        text = str(_to_json_value(value))
+        if text == "" or any(c in text for c in '",\\() \t\n'):
+            text = '"' + text.replace("\\", "\\\\").replace('"', '""') + '"'
+        fields.append(text)
+    return "(" + ",".join(fields) + ")"
+
+
+def _row_hash(row: Tuple) -> int:
+    """The signed 64-bit md5 slice build_fingerprint_sql sums per row."""
+    value = int(hashlib.md5(_record_text(row).encode()).hexdigest()[:16], 16)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class SQLiteBackend:
+    """
+    Runs queries on a SQLite file attached under each schema name, so
+    Postgres-style "public"."Table" references resolve. Postgres-only
+    EXPLAIN forms are emulated with EXPLAIN QUERY PLAN, and the
+    build_fingerprint_sql aggregate (md5, ::bit, json_agg) is computed in
+    Python over the full inner result.
+    """
+
+    def __init__(self, path: str, schemas: List[str], plan_cost: float, plan_rows: float):
+        self.path = path
+        self.schemas = schemas
+        self.plan_cost = plan_cost
+        self.plan_rows = plan_rows
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        for schema in self.schemas:
+            conn.execute("ATTACH DATABASE ? AS " + f'"{schema}"', (f"file:{self.path}?mode=ro",))
+        return conn
+
+    def run(self, sql: str) -> Dict[str, Any]:
+        """Run SQL and return Metabase's data shape, raising QueryError for bad SQL."""
+        sql = sql.strip().rstrip(";")
+        conn = self._connect()
+        try:
+            if EXPLAIN_JSON_PATTERN.match(sql):
+                conn.execute("EXPLAIN QUERY PLAN " + EXPLAIN_JSON_PATTERN.sub("", sql)).fetchall()
+                plan = [{"Plan": {"Node Type": "Result", "Total Cost": self.plan_cost,
+                                  "Plan Rows": self.plan_rows}}]
+                return {"cols": [{"name": "QUERY PLAN", "display_name": "QUERY PLAN",
+                                  "base_type": "type/Text"}],
+                        "rows": [[json.dumps(plan)]]}
+            if EXPLAIN_PATTERN.match(sql):
+                sql = "EXPLAIN QUERY PLAN " + EXPLAIN_PATTERN.sub("", sql)
+            fingerprint = FINGERPRINT_PATTERN.match(sql)
+            if fingerprint:
+                return self._fingerprint(conn, fingerprint.group("sql"))
+
+            cur = conn.execute(sql)
+            names = [d[0] for d in cur.description or []]
+            rows = [[_to_json_value(v) for v in row] for row in cur.fetchmany(MAX_RESULT_ROWS)]
+            cols = [{"name": n, "display_name": n, "base_type": "type/*"} for n in names]
+            return {"cols": cols, "rows": rows}
+        except sqlite3.Error as e:
+            raise QueryError(str(e)) from e
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _fingerprint(conn: sqlite3.Connection, sql: str) -> Dict[str, Any]:
+        """
+        Answer a build_fingerprint_sql query with its (row_count, result_hash, columns) row.
+
+        Rows are hashed from a Postgres-style record text, so fingerprints
+        agree between equivalent queries here but not with a real Postgres.
+        """
+        cur = conn.execute(sql)
+        names = [d[0] for d in cur.description or []]
+        row_count, result_hash = 0, 0
+        for row in cur:
+            row_count += 1
+            result_hash += _row_hash(row)
+        columns = json.dumps(names) if row_count else None
+        cols = [{"name": n, "display_name": n, "base_type": "type/*"}
+                for n in ("row_count", "result_hash", "columns")]
+        return {"cols": cols, "rows": [[row_count, str(result_hash), columns]]}
+
+    def metadata(self) -> List[Dict[str, Any]]:
+        """List tables and fields for /api/database/{id}/metadata."""
+        conn = self._connect()
+        try:
+            tables = []
+            names = [r[0] for r in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') "
+                "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            )]
+            for table_id, name in enumerate(names, start=1):
+                fields = [
+                    {"name": col[1],
+                     "base_type": SQLITE_BASE_TYPES.get((col[2] or "").upper(), "type/*")}
+                    for col in conn.execute(f'PRAGMA table_info("{name}")')
+                ]
+                for schema in self.schemas:
+                    tables.append({"id": table_id, "schema": schema, "name": name, "fields": fields})
+            return tables
+        finally:
+            conn.close()
+
+
+class PostgresBackend:
+    """Runs queries on a Postgres database in read-only transactions."""
+
+    def __init__(self, dsn: str):
+        import psycopg
+        self.psycopg = psycopg
+        self.dsn = dsn
+
+    def run(self, sql: str) -> Dict[str, Any]:
+        """Run SQL and return Metabase's data shape, raising QueryError for bad SQL."""
+        with self.psycopg.connect(self.dsn) as conn:
+            conn.read_only = True
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(sql)
+                    if cur.description is None:
+                        return {"cols": [], "rows": []}
+                    cols = [{"name": d.name, "display_name": d.name, "base_type": "type/*"}
+                            for d in cur.description]
+                    rows = [[_to_json_value(v) for v in row] for row in cur.fetchmany(MAX_RESULT_ROWS)]
+                    return {"cols": cols, "rows": rows}
+            except self.psycopg.Error as e:
+                raise QueryError(str(e).strip()) from e
+            finally:
+                conn.rollback()
+
+    def metadata(self) -> List[Dict[str, Any]]:
+        """List tables and fields for /api/database/{id}/metadata."""
+        data = self.run("""
+            SELECT table_schema, table_name, column_name, data_type
+            FROM information_schema.columns
+            WHERE table_schema NOT IN ('pg_catalog', 'information_schema')
+            ORDER BY table_schema, table_name, ordinal_position
+        """)
+        tables: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for schema, name, column, data_type in data["rows"]:
+            table = tables.setdefault((schema, name), {
+                "id": len(tables) + 1, "schema": schema, "name": name, "fields": []
+            })
+            table["fields"].append({"name": column,
+                                    "base_type": POSTGRES_BASE_TYPES.get(data_type, "type/*")})
+        return list(tables.values())
+
+
+def create_demo_database(path: str, rows: int, seed: int):
+    """Create a small grants-like SQLite database with Applicants and Applications."""
+    rng = random.Random(seed)
+    sectors = ["Agriculture", "Energy", "Fisheries", "Forestry", "Technology", "Tourism"]
+    statuses = ["Approved", "Declined", "Submitted", "Under Review", "Withdrawn"]
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executescript("""
+            DROP TABLE IF EXISTS "Applications";
+            DROP TABLE IF EXISTS "Applicants";
+            CREATE TABLE "Applicants" (
+                "Id" INTEGER PRIMARY KEY,
+                "ApplicantName" TEXT,
+                "Sector" TEXT,
+                "SubSector" TEXT,
+                "City" TEXT
+            );
+            CREATE TABLE "Applications" (
+                "Id" INTEGER PRIMARY KEY,
+                "ApplicantId" INTEGER REFERENCES "Applicants"("Id"),
+                "ProjectName" TEXT,
+                "Status" TEXT,
+                "RequestedAmount" NUMERIC,
+                "ApprovedAmount" NUMERIC,
+                "SubmissionDate" DATE
+            );
+        """)
+        applicants = max(1, rows // 4)
+        conn.executemany(
+            'INSERT INTO "Applicants" VALUES (?, ?, ?, ?, ?)',
+            [(i, f"Applicant {i}", rng.choice(sectors), f"Sub {rng.randint(1, 12)}",
+              rng.choice(["Victoria", "Vancouver", "Kelowna", "Prince George"]))
+             for i in range(1, applicants + 1)]
+        )
+        start = dt.date(2020, 1, 1)
+        app_rows = []
+        for i in range(1, rows + 1):
+            status = rng.choice(statuses)
+            requested = round(rng.uniform(5000, 500000), 2)
+            app_rows.append((
+                i, rng.randint(1, applicants), f"Project {i}", status, requested,
+                round(requested * rng.uniform(0.5, 1.0), 2) if status == "Approved" else None,
+                (start + dt.timedelta(days=rng.randint(0, 1800))).isoformat(),
+            ))
+        conn.executemany('INSERT INTO "Applications" VALUES (?, ?, ?, ?, ?, ?, ?)', app_rows)
+    conn.close()
+
+
+class FakeMetabase:
+    """aiohttp application state: cards, async jobs and fault injection."""
+
+    def __init__(self, backend, latency: float, query_latency: float, jitter: float,
+                 async_rate: float, async_duration: float, error_rate: float,
+                 error_status: int, query_error_rate: float, seed: Optional[int]):
+        self.backend = backend
+        self.latency = latency
+        self.query_latency = query_latency
+        self.jitter = jitter
+        self.async_rate = async_rate
+        self.async_duration = async_duration
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.query_error_rate = query_error_rate
+        self.rng = random.Random(seed)
+        self.cards: Dict[int, Dict[str, Any]] = {}
+        self.card_ids = itertools.count(1)
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.stats: Counter = Counter()
+
+    def _delay(self, base: float) -> float:
+        if base <= 0:
+            return 0.0
+        spread = base * self.jitter
+        return max(0.0, base + self.rng.uniform(-spread, spread))
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        """Count requests, add latency and inject HTTP errors."""
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else "?"
+        self.stats[f"{request.method} {route}"] += 1
+        if route.startswith("/api/fake"):
+            return await handler(request)
+
+        await asyncio.sleep(self._delay(self.latency))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.stats["injected_errors"] += 1
+            return web.json_response({"message": "Injected error"}, status=self.error_status)
+        return await handler(request)
+
+    async def _run_query(self, sql: str) -> Dict[str, Any]:
+        """Run SQL in a worker thread and build the Metabase dataset response body."""
+        started = time.monotonic()
+        await asyncio.sleep(self._delay(self.query_latency))
+        if self.query_error_rate and self.rng.random() < self.query_error_rate:
+            self.stats["injected_query_errors"] += 1
+            return {"status": "failed", "error": "ERROR: injected query error"}
+        try:
+            data = await asyncio.to_thread(self.backend.run, sql)
+        except QueryError as e:
+            return {"status": "failed", "error": str(e)}
+        return {
+            "status": "completed",
+            "row_count": len(data["rows"]),
+            "running_time": int((time.monotonic() - started) * 1000),
+            "data": data,
+        }
+
+    async def _respond_query(self, sql: str) -> web.Response:
+        """Answer 202 with a running job at async_rate, otherwise 202 with the finished body."""
+        if self.async_rate and self.rng.random() < self.async_rate:
+            job_id = uuid.uuid4().hex
+            job = {"result": None}
+            self.jobs[job_id] = job
+
+            async def finish():
+                await asyncio.sleep(self._delay(self.async_duration))
+                job["result"] = await self._run_query(sql)
+
+            job["task"] = asyncio.get_running_loop().create_task(finish())
+            self.stats["async_jobs"] += 1
+            return web.json_response({"status": "running", "id": job_id}, status=202)
+        # Metabase answers ad-hoc and card queries with 202 even when they finish inline
+        return web.json_response(await self._run_query(sql), status=202)
+
+    async def dataset(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        sql = (body.get("native") or {}).get("query")
+        if not sql:
+            return web.json_response({"message": "native.query is required"}, status=400)
+        return await self._respond_query(sql)
+
+    async def async_job(self, request: web.Request) -> web.Response:
+        job = self.jobs.get(request.match_info["job_id"])
+        if job is None:
+            return web.json_response({"message": "Not found."}, status=404)
+        if job["result"] is None:
+            return web.json_response({"status": "running"}, status=202)
+        self.jobs.pop(request.match_info["job_id"], None)
+        return web.json_response(job["result"])
+
+    def _get_card(self, request: web.Request) -> Optional[Dict[str, Any]]:
+        try:
+            return self.cards.get(int(request.match_info["card_id"]))
+        except ValueError:
+            return None
+
+    async def list_cards(self, request: web.Request) -> web.Response:
+        return web.json_response([c for c in self.cards.values() if not c["archived"]])
+
+    async def create_card(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        card_id = next(self.card_ids)
+        card = {
+            "id": card_id,
+            "name": body.get("name", "Untitled"),
+            "collection_id": body.get("collection_id"),
+            "dataset_query": body.get("dataset_query", {}),
+            "display": body.get("display", "table"),
+            "visualization_settings": body.get("visualization_settings", {}),
+            "enable_embedding": body.get("enable_embedding", False),
+            "archived": False,
+        }
+        self.cards[card_id] = card
+        return web.json_response(card)
+
+    async def get_card(self, request: web.Request) -> web.Response:
+        card = self._get_card(request)
+        if card is None:
+            return web.json_response({"message": "Not found."}, status=404)
+        return web.json_response(card)
+
+    async def update_card(self, request: web.Request) -> web.Response:
+        card = self._get_card(request)
+        if card is None:
+            return web.json_response({"message": "Not found."}, status=404)
+        body = await request.json()
+        card.update({k: v for k, v in body.items() if k != "id"})
+        return web.json_response(card)
+
+    async def delete_card(self, request: web.Request) -> web.Response:
+        card = self._get_card(request)
+        if card is None:
+            return web.json_response({"message": "Not found."}, status=404)
+        del self.cards[card["id"]]
+        return web.Response(status=204)
+
+    async def card_query(self, request: web.Request) -> web.Response:
+        card = self._get_card(request)
+        if card is None:
+            return web.json_response({"message": "Not found."}, status=404)
+        sql = card["dataset_query"].get("native", {}).get("query", "")
+        return await self._respond_query(sql)
+
+    async def collection_items(self, request: web.Request) -> web.Response:
+        collection_id = int(request.match_info["collection_id"])
+        items = [
+            {"id": c["id"], "model": "card", "name": c["name"]}
+            for c in self.cards.values()
+            if c["collection_id"] == collection_id and not c["archived"]
+        ]
+        return web.json_response({"data": items, "total": len(items)})
+
+    async def database_metadata(self, request: web.Request) -> web.Response:
+        db_id = int(request.match_info["db_id"])
+        tables = await asyncio.to_thread(self.backend.metadata)
+        return web.json_response({"id": db_id, "name": f"fake-{db_id}", "engine": "postgres",
+                                  "tables": tables})
+
+    async def fake_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"cards": len(self.cards), "pending_jobs": len(self.jobs),
+                                  "requests": dict(self.stats)})
+
+    def build_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_post("/api/dataset", self.dataset)
+        app.router.add_get("/api/async/{job_id}", self.async_job)
+        app.router.add_get("/api/card", self.list_cards)
+        app.router.add_post("/api/card", self.create_card)
+        app.router.add_get("/api/card/{card_id}", self.get_card)
+        app.router.add_put("/api/card/{card_id}", self.update_card)
+        app.router.add_delete("/api/card/{card_id}", self.delete_card)
+        app.router.add_post("/api/card/{card_id}/query", self.card_query)
+        app.router.add_get("/api/collection/{collection_id}/items", self.collection_items)
+        app.router.add_get("/api/database/{db_id}/metadata", self.database_metadata)
+        app.router.add_get("/api/fake/stats", self.fake_stats)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Metabase server for tests and benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3001)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--sqlite", help="SQLite database file to query")
+    source.add_argument("--postgres", help="Postgres connection string to query")
+    parser.add_argument("--demo-rows", type=int, default=1000,
+                        help="Rows in the generated demo database when no source is given")
+    parser.add_argument("--schemas", default="public",
+                        help="Schema names the SQLite file is attached as")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--query-latency", type=float, default=0.0, help="Extra seconds per query")
+    parser.add_argument("--jitter", type=float, default=0.25, help="+/- fraction applied to latencies")
+    parser.add_argument("--async-rate", type=float, default=0.0,
+                        help="Fraction of queries answered 202 running and finished via /api/async")
+    parser.add_argument("--async-duration", type=float, default=0.5, help="Seconds an async job runs")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected errors")
+    parser.add_argument("--query-error-rate", type=float, default=0.0,
+                        help="Fraction of queries returning a SQL error body")
+    parser.add_argument("--plan-cost", type=float, default=100.0,
+                        help="Total Cost reported by emulated EXPLAIN (FORMAT JSON) on SQLite")
+    parser.add_argument("--plan-rows", type=float, default=100.0,
+                        help="Plan Rows reported by emulated EXPLAIN (FORMAT JSON) on SQLite")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.postgres:
+        backend = PostgresBackend(args.postgres)
+    else:
+        path = args.sqlite
+        if not path:
+            path = os.path.join(tempfile.gettempdir(), "fake_metabase_demo.db")
+            create_demo_database(path, args.demo_rows, args.seed or 0)
+            logger.info(f"Created demo database with {args.demo_rows} applications at {path}")
+        schemas = [s.strip() for s in args.schemas.split(",") if s.strip()]
+        backend = SQLiteBackend(path, schemas, args.plan_cost, args.plan_rows)
+
+    fake = FakeMetabase(
+        backend,
+        latency=args.latency,
+        query_latency=args.query_latency,
+        jitter=args.jitter,
+        async_rate=args.async_rate,
+        async_duration=args.async_duration,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        query_error_rate=args.query_error_rate,
+        seed=args.seed,
+    )
+    web.run_app(fake.build_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ import { Turn } from './turn';
 import { SqlExplanationComponent } from './sql-explanation/sql-explanation';
 import { ToastComponent } from './toast/toast.component';
 import { AuthService } from './services/auth.service';
-import { ApiService } from './services/api.service';
+import { ApiService, BULK_MAX_CARDS, CardRecreateResult } from './services/api.service';
 import { ToastService } from './services/toast.service';
 import { LoggerService } from './services/logger.service';
 import { IframeDetectorService } from './iframe-detector.service';
@@ -458,8 +458,9 @@ export class App implements OnInit, OnDestroy {
         throw new Error('Not authenticated');
       }
 
+      // Show the chat at once; missing cards are recreated afterwards
       const chatData = await firstValueFrom(
-        this.apiService.getChat<{conversation: Turn[]}>(chatId)
+        this.apiService.getChat<{conversation: Turn[]}>(chatId, false)
       );
 
       this.conversation = chatData.conversation.map(turn => ({
@@ -475,6 +476,10 @@ export class App implements OnInit, OnDestroy {
       
       // Scroll to bottom instantly after loading chat
       this.scrollToBottomInstant();
+
+      await this.recreateMissingCards(chatId).catch(error =>
+        this.logger.error('Failed to recreate chat cards', error)
+      );
     } catch (error) {
       // Log the error and provide non-intrusive user feedback
       if (this.logger && typeof this.logger.error === 'function') {
@@ -488,6 +493,37 @@ export class App implements OnInit, OnDestroy {
     }
   }
 
+  // Recreate the reopened chat's deleted cards in bulk and save the new card IDs
+  private async recreateMissingCards(chatId: string): Promise<void> {
+    const turns = this.conversation.filter(turn => turn.embed?.card_id && turn.embed.SQL);
+    let changed = false;
+
+    for (let i = 0; i < turns.length; i += BULK_MAX_CARDS) {
+      const batch = turns.slice(i, i + BULK_MAX_CARDS);
+      const response = await firstValueFrom(
+        this.apiService.recreateCards<{results: CardRecreateResult[]}>(batch.map(({ embed }) => ({
+          card_id: embed.card_id,
+          SQL: embed.SQL,
+          title: embed.title,
+          current_visualization: embed.current_visualization,
+          x_field: embed.x_field,
+          y_field: embed.y_field
+        })))
+      );
+      response.results.forEach((result, index) => {
+        if (result.success && result.new_card_id !== result.card_id) {
+          batch[index].embed.card_id = result.new_card_id;
+          changed = true;
+        }
+      });
+    }
+
+    // Skip the save if the user switched chats meanwhile
+    if (changed && this.currentChatId === chatId) {
+      await this.saveChat();
+    }
+  }
+
   async saveChat(): Promise<void> {
     if (this.conversation.length === 0) return;
 
@@ -6,6 +6,15 @@ import { AuthService } from './auth.service';
 import { ConfigService } from './config.service';
 import { LoggerService } from './logger.service';
 
+// Largest batch the bulk card endpoints accept (backend MB_BULK_MAX_CARDS default)
+export const BULK_MAX_CARDS = 100;
+
+export interface CardRecreateResult {
+  card_id: number;
+  new_card_id: number;
+  success: boolean;
+}
+
 @Injectable({
   providedIn: 'root'
 })
@@ -121,13 +130,19 @@ export class ApiService {
     return this.post<T>('/ask', body);
   }
 
-  changeDisplay<T>(cardId: number, mode: string, xField: string, yField: string): Observable<T> {
-    return this.post<T>('/change_display', {
+  // The response card_id replaces cardId: a card shared with other chats is
+  // restyled as a copy. Passing chatId also saves the copy into that chat.
+  changeDisplay<T>(cardId: number, mode: string, xField: string, yField: string, chatId?: string | null): Observable<T> {
+    const body: any = {
       card_id: cardId,
       mode,
       x_field: xField,
       y_field: yField
-    });
+    };
+    if (chatId) {
+      body.chat_id = chatId;
+    }
+    return this.post<T>('/change_display', body);
   }
 
   deleteCard<T>(cardId: number): Observable<T> {
@@ -136,6 +151,18 @@ export class ApiService {
     });
   }
 
+  deleteCards<T>(cardIds: number[]): Observable<T> {
+    return this.post<T>('/cards/delete', {
+      card_ids: cardIds
+    });
+  }
+
+  recreateCards<T>(cards: any[]): Observable<T> {
+    return this.post<T>('/cards/recreate', {
+      cards
+    });
+  }
+
   explainSql<T>(sql: string): Observable<T> {
     return this.post<T>('/explain_sql', {
       sql: sql
@@ -147,8 +174,10 @@ export class ApiService {
     return this.post<T>('/chats', {});
   }
 
-  getChat<T>(chatId: string): Observable<T> {
-    return this.post<T>(`/chats/${chatId}`, {});
+  getChat<T>(chatId: string, validateCards: boolean = true): Observable<T> {
+    return this.post<T>(`/chats/${chatId}`, {
+      validate_cards: validateCards
+    });
   }
 
   saveChat<T>(chatId: string | null, conversation: any[], title: string): Observable<T> {